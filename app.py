@@ -1,20 +1,49 @@
 import streamlit as st
-from PIL import Image
 import os
+import uuid
+from dotenv import load_dotenv
+
+# Load .env before importing modules that read their settings from the environment
+load_dotenv()
+
 from gemini_api import (
-    generate_creative_ideas,
-    analyze_caption,
-    suggest_captions_from_image,
+    stream_creative_ideas,
+    stream_caption_analysis,
+    stream_caption_suggestions,
     localize_caption,
+    localize_caption_many,
+    localize_caption_batch,
+    score_variations,
 )
+from image_utils import prepare_image, preview_image
+from backends import get_backend, set_backend
+from session_memo import SessionMemo, input_key
+from translation_memory import translation_memory
+from poster_index import poster_index
+from routing import router
+import metrics
 from utils import (
     run_ab_test_simulation,
     get_supported_languages,
     format_score,
+    format_win_chance,
+    format_prescreen,
+    format_bytes,
 )
-from dotenv import load_dotenv
 
-load_dotenv()
+@st.cache_resource
+def shared_backend():
+    """
+    One configured client and model-handle cache per server process, shared by all sessions and reruns.
+    """
+    return get_backend()
+
+set_backend(shared_backend())
+
+# Tag this session's Gemini calls so the sidebar can show its own usage
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+metrics.set_session(st.session_state.session_id)
 
 # --------- Aesthetic Almond-Pink Styling + Improved Font Color ---------
 st.markdown("""
@@ -119,6 +148,214 @@ def show_header():
 
 show_header()
 
+def show_all_localizations(caption, languages, batched=False, results=None):
+    """
+    Localizes the caption into every language at once, filling in the table as each result arrives.
+    In batched mode the languages are requested together in as few calls as possible.
+    Pass results (language -> localization) to redraw an earlier table without any requests.
+    Returns the localizations by language.
+    """
+    st.markdown("**Localized Captions:**")
+    table = st.empty()
+    rows = {lang: {"Language": lang, "Localized Caption": "⏳", "Note": "", "Pre-screen": ""} for lang in languages}
+    table.table(list(rows.values()))
+    if results is not None:
+        arriving = results.items()
+    elif batched:
+        arriving = localize_caption_batch(caption, languages).items()
+    else:
+        arriving = localize_caption_many(caption, languages)
+    localized_by_lang = {}
+    for lang, localized in arriving:
+        localized_by_lang[lang] = localized
+        if localized.get("error"):
+            rows[lang]["Localized Caption"] = f"⚠️ {localized['error']}"
+        else:
+            rows[lang]["Localized Caption"] = localized["localized_caption"]
+        rows[lang]["Note"] = localized["notes"]
+        rows[lang]["Pre-screen"] = format_prescreen(localized.get("prescreen"))
+        table.table(list(rows.values()))
+    return localized_by_lang
+
+def show_localization(caption, selected_lang, localize_all, batched, languages, memo):
+    """
+    Shows the caption localized into the selected language (or all languages). Localizations
+    are memoized per session, so changing the language only requests the new one.
+    """
+    if localize_all:
+        key = input_key("all", caption, batched)
+        localized_by_lang = show_all_localizations(caption, languages, batched, memo.get(key))
+        # Failed languages are not memoized so the next rerun retries them
+        if not any(localized.get("error") for localized in localized_by_lang.values()):
+            memo.set(key, localized_by_lang)
+    elif selected_lang != "English":
+        key = input_key(selected_lang, caption)
+        localized = memo.get(key)
+        if localized is None:
+            localized = localize_caption(caption, selected_lang)
+            memo.set(key, localized)
+        st.markdown("**Localized Caption:**")
+        st.markdown(f"{selected_lang}: “{localized['localized_caption']}”")
+        if localized.get("notes"):
+            st.info(f"Note: {localized['notes']}")
+        if format_prescreen(localized.get("prescreen")):
+            st.warning(f"Pre-screen: {format_prescreen(localized['prescreen'])}")
+
+def option_boxes_html(results, detailed=False):
+    """
+    Builds the option boxes for a list of caption variations. Detailed boxes also show the reason.
+    """
+    boxes = []
+    for idx, result in enumerate(results):
+        win_chance = format_win_chance(result)
+        flagged = format_prescreen(result.get("prescreen"))
+        if detailed:
+            boxes.append(
+                f"<div class='option-box genie-suggestion'><b>Option {chr(65+idx)}:</b> "
+                f"<span style='color:#A3B18A;'>{result['caption']}</span><br>"
+                f"<b>Engagement:</b> <span style='color:#B9D6DF;'>{format_score(result['score'])}</span><br>"
+                + (f"<b>A/B:</b> <span style='color:#B9D6DF;'>{win_chance}</span><br>" if win_chance else "")
+                + f"<span style='color:#968E7E;'>{result['why']}</span>"
+                + (f"<br><span style='color:#B4889F;'>{flagged}</span>" if flagged else "")
+                + ("<br>🌟 <b style='color:#A3B18A;'>Recommended</b>" if result['recommended'] else "")
+                + "</div>"
+            )
+        else:
+            boxes.append(
+                f"<div class='option-box genie-suggestion'><b>Option {chr(65+idx)}:</b> "
+                f"<span style='color:#A3B18A;'>{result['caption']}</span> "
+                f"(Score: <span style='color:#B9D6DF;'>{format_score(result['score'])}</span>"
+                + (f", {win_chance}" if win_chance else "") + ")"
+                + (f" <span style='color:#B4889F;'>{flagged}</span>" if flagged else "")
+                + (" 🌟 <b style='color:#A3B18A;'>Recommended</b>" if result['recommended'] else "")
+                + "</div>"
+            )
+    return "".join(boxes)
+
+def show_analysis_stream(events, options_heading, image=None, score=True):
+    """
+    Renders a streamed analysis: each field appears as soon as its line arrives and the option
+    boxes fill in one by one, then get scored against the image in one request and re-ranked by
+    the A/B simulation. Returns the final result. Pass score=False to redraw a result that was
+    scored before: variations left unscored then are ranked as they are, without a new request.
+    """
+    slots = {field: st.empty() for field in ("caption", "engagement_score", "brand_voice", "compliance", "prescreen")}
+    heading_slot = st.empty()
+    options_slot = st.empty()
+    variations = []
+    result = None
+    for field, value in events:
+        if field == "caption":
+            slots["caption"].markdown(f"**Suggested Caption:** “{value}”")
+        elif field == "engagement_score":
+            slots["engagement_score"].markdown(f"**Engagement Score:** {format_score(value)}")
+        elif field == "brand_voice":
+            slots["brand_voice"].markdown(f"**Brand Voice:** {value}")
+        elif field == "compliance":
+            slots["compliance"].markdown(f"**Compliance Check:** {value}")
+        elif field == "prescreen":
+            # Local rule matches, shown before the model's own compliance check arrives
+            if format_prescreen(value):
+                slots["prescreen"].markdown(f"**Compliance Pre-screen:** {format_prescreen(value)}")
+            else:
+                slots["prescreen"].empty()
+        elif field == "caption_variation":
+            variations.append(value)
+            heading_slot.markdown(f"**{options_heading}:**")
+            options_slot.markdown(option_boxes_html(variations), unsafe_allow_html=True)
+        elif field == "result":
+            result = value
+    if result["caption_variations"]:
+        try:
+            if score:
+                score_variations(result["caption_variations"], image)
+        except Exception as e:
+            # Unscored variations still get ranked, just with a wider prior
+            st.caption(f"Could not score the suggestions: {e}")
+        ab_results = run_ab_test_simulation(result["caption_variations"])
+        options_slot.markdown(option_boxes_html(ab_results), unsafe_allow_html=True)
+    return result
+
+def memoized_events(result):
+    """
+    Replays a memoized analysis result as the events its stream produced, so reruns draw it
+    through show_analysis_stream (with score=False) without another request.
+    """
+    for field in ("caption", "engagement_score", "brand_voice", "compliance", "prescreen"):
+        if field in result:
+            yield field, result[field]
+    for variation in result["caption_variations"]:
+        yield "caption_variation", variation
+    yield "result", result
+
+def caption_to_localize(analysis):
+    """
+    The caption that gets localized: the suggested caption of an image-only analysis,
+    otherwise the first suggested alternative.
+    """
+    if "caption" in analysis:
+        return analysis["caption"]
+    variations = analysis["caption_variations"]
+    return variations[0]["caption"] if variations else ""
+
+def idea_answers_html(ideas):
+    """
+    Builds the answer boxes for ideas that came without scoring info.
+    """
+    return "".join(f"<div class='genie-answer'>{idea}</div>" for idea in ideas)
+
+def show_streamed_ideas(variations, ideas, heading_slot, options_slot):
+    """
+    Redraws the ideas received so far: scored variations as option boxes, unscored ideas after them.
+    """
+    if variations:
+        heading_slot.markdown("#### Top Suggestions")
+    options_slot.markdown(
+        (option_boxes_html(variations, detailed=True) if variations else "") + idea_answers_html(ideas),
+        unsafe_allow_html=True,
+    )
+
+def show_creative_results(ideas, variations, heading_slot, options_slot):
+    if len(variations) > 1:
+        heading_slot.markdown("#### Top Suggestions")
+        options_slot.markdown(option_boxes_html(variations, detailed=True), unsafe_allow_html=True)
+    elif ideas:
+        heading_slot.empty()
+        options_slot.markdown(idea_answers_html(ideas), unsafe_allow_html=True)
+    else:
+        # Every idea was blocked by the pre-screen or dropped as a near-duplicate
+        heading_slot.empty()
+        options_slot.warning(
+            "Genie couldn't come up with an idea that passes the compliance pre-screen. "
+            "Try rephrasing your prompt or choosing another style."
+        )
+
+def analyze_upload(raw, caption, fused_lang):
+    """
+    Prepares the uploaded image, shows a downsized preview of it and streams its analysis.
+    Only the prepared payload is kept; the full-resolution upload is never decoded for display.
+    """
+    image = prepare_image(raw)
+    st.image(preview_image(image), caption="Uploaded Image", use_column_width=True)
+    st.caption(
+        f"Upload size: {format_bytes(image['source_bytes'])} → "
+        f"{format_bytes(image['sent_bytes'])} ({image['size'][0]}×{image['size'][1]})"
+    )
+    with st.spinner("Genie is analyzing your content..."):
+        # If caption provided, analyze it
+        if caption.strip():
+            st.markdown(f"**Original Caption:** “{caption}”")
+            return show_analysis_stream(
+                stream_caption_analysis(image, caption, fused_lang), "Suggestions", image
+            )
+        return show_analysis_stream(stream_caption_suggestions(image, fused_lang), "Alternate Captions", image)
+
+# Results of this session keyed by their inputs, so reruns (any widget change) redraw them
+# instead of querying the model again
+creative_memo = SessionMemo(st.session_state, "creative_results")
+analysis_memo = SessionMemo(st.session_state, "analysis_results")
+localization_memo = SessionMemo(st.session_state, "localization_results")
+
 tabs = st.tabs(["💡 Creative Assistant", "🖼️ Image/Poster Analysis", "ℹ️ About Genie"])
 
 # ------------- Creative Assistant -------------
@@ -132,30 +369,32 @@ with tabs[0]:
         index=0,
         key="creative_style"
     )
+    creative_key = input_key(user_prompt.strip(), style)
     if st.button("Generate Ideas", key="generate_ideas_btn"):
         if user_prompt.strip() == "":
             st.warning("Please enter your idea prompt to get started.")
         else:
             with st.spinner("Genie is generating ideas..."):
                 try:
-                    ideas, variations = generate_creative_ideas(user_prompt, style)
+                    heading_slot = st.empty()
+                    options_slot = st.empty()
+                    streamed_variations = []
+                    streamed_ideas = []
+                    for event, value in stream_creative_ideas(user_prompt, style):
+                        if event in ("variation", "idea"):
+                            (streamed_variations if event == "variation" else streamed_ideas).append(value)
+                            show_streamed_ideas(streamed_variations, streamed_ideas, heading_slot, options_slot)
+                        elif event == "result":
+                            ideas, variations = value
                     if len(variations) > 1:
-                        ab_results = run_ab_test_simulation(variations)
-                        st.markdown("#### Top Suggestions")
-                        for idx, result in enumerate(ab_results):
-                            st.markdown(
-                                f"<div class='option-box genie-suggestion'><b>Option {chr(65+idx)}:</b> "
-                                f"<span style='color:#A3B18A;'>{result['caption']}</span><br>"
-                                f"<b>Engagement:</b> <span style='color:#B9D6DF;'>{format_score(result['score'])}</span><br>"
-                                f"<span style='color:#968E7E;'>{result['why']}</span>"
-                                + ("<br>🌟 <b style='color:#A3B18A;'>Recommended</b>" if result['recommended'] else "")
-                                + "</div>",
-                                unsafe_allow_html=True
-                            )
-                    else:
-                        st.markdown(f"<div class='genie-answer'>{ideas[0]}</div>", unsafe_allow_html=True)
+                        variations = run_ab_test_simulation(variations)
+                    creative_memo.set(creative_key, (ideas, variations))
+                    show_creative_results(ideas, variations, heading_slot, options_slot)
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
+    elif creative_memo.get(creative_key) is not None:
+        ideas, variations = creative_memo.get(creative_key)
+        show_creative_results(ideas, variations, st.empty(), st.empty())
 
 # ------------- Image/Poster Analysis -------------
 with tabs[1]:
@@ -168,68 +407,57 @@ with tabs[1]:
     )
     lang_options = get_supported_languages()
     selected_lang = st.selectbox("Translate to (localization):", lang_options, index=0, key="localize_lang")
+    localize_all = st.checkbox("Localize into all supported languages", key="localize_all")
+    batch_localize = localize_all and st.toggle(
+        "Batch languages into a single request (saves quota)", key="localize_batched"
+    )
+    target_langs = [lang for lang in lang_options if lang != "English"]
+    # The analysis depends only on the image and caption, not on the localization settings
+    analysis_key = input_key(img_file.getvalue(), input_caption.strip()) if img_file else None
 
+    # A single target language is localized by the analysis request itself
+    fused_lang = selected_lang if selected_lang != "English" and not localize_all else None
+
+    analysis = None
     if st.button("Analyze Content", key="analyze_btn"):
         if not img_file:
             st.warning("Please upload an image before analyzing.")
         else:
             try:
-                image = Image.open(img_file)
-                st.image(image, caption="Uploaded Image", use_column_width=True)
-                with st.spinner("Genie is analyzing your content..."):
-                    # If caption provided, analyze it
-                    if input_caption.strip():
-                        analysis = analyze_caption(image, input_caption)
-                        st.markdown(f"**Original Caption:** “{input_caption}”")
-                        st.markdown(f"**Engagement Score:** {format_score(analysis['engagement_score'])}")
-                        st.markdown(f"**Brand Voice:** {analysis['brand_voice']}")
-                        st.markdown(f"**Compliance Check:** {analysis['compliance']}")
-                        st.markdown("**Suggestions:**")
-                        ab_results = run_ab_test_simulation(analysis["caption_variations"])
-                        for idx, result in enumerate(ab_results):
-                            st.markdown(
-                                f"<div class='option-box genie-suggestion'><b>Option {chr(65+idx)}:</b> "
-                                f"<span style='color:#A3B18A;'>{result['caption']}</span> "
-                                f"(Score: <span style='color:#B9D6DF;'>{format_score(result['score'])}</span>)"
-                                + (" 🌟 <b style='color:#A3B18A;'>Recommended</b>" if result['recommended'] else "")
-                                + "</div>",
-                                unsafe_allow_html=True
-                            )
-                        st.divider()
-                        # Localization
-                        if selected_lang != "English":
-                            st.markdown("**Localized Caption:**")
-                            localized = localize_caption(analysis['caption_variations'][0]["caption"], selected_lang)
-                            st.markdown(f"{selected_lang}: “{localized['localized_caption']}”")
-                            if localized.get("notes"):
-                                st.info(f"Note: {localized['notes']}")
-                    else:
-                        suggestion = suggest_captions_from_image(image)
-                        st.markdown(f"**Suggested Caption:** “{suggestion['caption']}”")
-                        st.markdown(f"**Engagement Score:** {format_score(suggestion['engagement_score'])}")
-                        st.markdown(f"**Brand Voice:** {suggestion['brand_voice']}")
-                        st.markdown(f"**Compliance Check:** {suggestion['compliance']}")
-                        if suggestion.get('caption_variations'):
-                            st.markdown("**Alternate Captions:**")
-                            ab_results = run_ab_test_simulation(suggestion["caption_variations"])
-                            for idx, result in enumerate(ab_results):
-                                st.markdown(
-                                    f"<div class='option-box genie-suggestion'><b>Option {chr(65+idx)}:</b> "
-                                    f"<span style='color:#A3B18A;'>{result['caption']}</span> "
-                                    f"(Score: <span style='color:#B9D6DF;'>{format_score(result['score'])}</span>)"
-                                    + (" 🌟 <b style='color:#A3B18A;'>Recommended</b>" if result['recommended'] else "")
-                                    + "</div>",
-                                    unsafe_allow_html=True
-                                )
-                        # Localization
-                        if selected_lang != "English":
-                            st.markdown("**Localized Caption:**")
-                            localized = localize_caption(suggestion['caption'], selected_lang)
-                            st.markdown(f"{selected_lang}: “{localized['localized_caption']}”")
-                            if localized.get("notes"):
-                                st.info(f"Note: {localized['notes']}")
+                # Peak memory of this analysis, shown in the sidebar
+                with metrics.memory_peak() as memory_usage:
+                    analysis = analyze_upload(img_file.getvalue(), input_caption, fused_lang)
+                st.session_state["analysis_memory"] = memory_usage
+                analysis_memo.set(analysis_key, analysis)
+                fused = analysis.get("localization")
+                if fused and fused["localized_caption"] and caption_to_localize(analysis):
+                    localization_memo.set(input_key(fused_lang, caption_to_localize(analysis)), fused)
             except Exception as e:
                 st.error(f"Error analyzing image: {e}")
+    elif analysis_key and analysis_memo.get(analysis_key) is not None:
+        image = prepare_image(img_file.getvalue())
+        st.image(preview_image(image), caption="Uploaded Image", use_column_width=True)
+        if input_caption.strip():
+            st.markdown(f"**Original Caption:** “{input_caption}”")
+            analysis = show_analysis_stream(
+                memoized_events(analysis_memo.get(analysis_key)), "Suggestions", image, score=False
+            )
+        else:
+            analysis = show_analysis_stream(
+                memoized_events(analysis_memo.get(analysis_key)), "Alternate Captions", image, score=False
+            )
+
+    # Localization runs outside the button so changing the language only localizes the caption
+    if analysis is not None:
+        if input_caption.strip():
+            st.divider()
+        best_caption = caption_to_localize(analysis)
+        if best_caption:
+            try:
+                show_localization(best_caption, selected_lang, localize_all, batch_localize,
+                                  target_langs, localization_memo)
+            except Exception as e:
+                st.error(f"Error localizing caption: {e}")
 
 # ------------- About / Help -------------
 with tabs[2]:
@@ -252,3 +480,74 @@ with tabs[2]:
     st.markdown("---")
     st.markdown("For support or collaboration, please get in touch.")
 
+# ------------- Session usage & latency -------------
+with st.sidebar:
+    if st.checkbox("Show usage & latency", key="show_metrics"):
+        summary = metrics.ring_buffer.summary(session=st.session_state.session_id)
+        st.markdown("#### This session")
+        col1, col2 = st.columns(2)
+        col1.metric("Calls", summary["calls"])
+        col2.metric("Cache hits", summary["cache_hits"])
+        col1.metric("Tokens", summary["prompt_tokens"] + summary["response_tokens"])
+        col2.metric("Est. cost", f"${summary['cost_usd']:.4f}")
+        col1.metric("p50 latency", f"{summary['p50_seconds']:.2f}s")
+        col2.metric("p95 latency", f"{summary['p95_seconds']:.2f}s")
+        if summary["retries"] or summary["errors"]:
+            st.caption(f"Retries: {summary['retries']} · Errors: {summary['errors']}")
+        if summary["phase_seconds"]:
+            st.markdown("**Time by phase (s)**")
+            st.bar_chart({name: round(seconds, 3) for name, seconds in summary["phase_seconds"].items()})
+        usage = st.session_state.get("analysis_memory")
+        if usage and usage["growth_bytes"] is not None:
+            st.caption(
+                f"Peak memory (last image analysis): +{format_bytes(usage['growth_bytes'])} "
+                f"over {format_bytes(usage['start_bytes'])}"
+                + ("" if usage["exact"] else " (process peak shared with other analyses, may predate this one)")
+            )
+        memory = translation_memory.summary()
+        if memory["lookups"]:
+            st.caption(
+                f"Translation memory (all sessions): {memory['units']} entries · "
+                f"{memory['exact_hit_rate']:.0%} exact / {memory['fuzzy_hit_rate']:.0%} fuzzy hits"
+            )
+        posters = poster_index.summary()
+        if posters["lookups"]:
+            st.caption(
+                f"Poster index (all sessions): {posters['posters']} posters · "
+                f"{posters['exact_hit_rate']:.0%} same file / {posters['near_hit_rate']:.0%} near-duplicate hits"
+            )
+        recent = metrics.ring_buffer.records(session=st.session_state.session_id)[-10:]
+        if recent:
+            st.markdown("**Recent calls**")
+            st.dataframe(
+                [
+                    {
+                        "function": r["function"],
+                        "seconds": round(r["duration"], 2),
+                        "tokens": r["prompt_tokens"] + r["response_tokens"],
+                        "cache": "hit" if r["cache_hit"] else "",
+                        "retries": r["retries"],
+                    }
+                    for r in reversed(recent)
+                ],
+                hide_index=True,
+            )
+        routes = router.summary()
+        if routes:
+            st.markdown("**Model routing (all sessions)**")
+            st.dataframe(
+                [
+                    {
+                        "task": task,
+                        "models": ", ".join(
+                            f"{model} ×{usage['attempts']} ~{usage['ewma_seconds']:.2f}s"
+                            for model, usage in route["models"].items()
+                        ),
+                        "escalations": route["escalations"],
+                        "SLO fallbacks": route["slo_fallbacks"],
+                        "over SLO": route["over_slo"],
+                    }
+                    for task, route in routes.items()
+                ],
+                hide_index=True,
+            )
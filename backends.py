@@ -0,0 +1,205 @@
+# --------- backends.py ---------
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# Backend selection (override via environment variables)
+BACKEND_NAME = os.getenv("GENIE_BACKEND", "gemini").lower()
+MOCK_LATENCY_SECONDS = float(os.getenv("GENIE_MOCK_LATENCY", 0.05))
+MOCK_ERROR_RATE = float(os.getenv("GENIE_MOCK_ERROR_RATE", 0.0))
+# Latency of each model on the mock relative to GENIE_MOCK_LATENCY. These are assumed ratios, not
+# measurements: they only make routing visible in benchmarks, so mock timings say nothing about
+# the latency real models would save
+MOCK_MODEL_LATENCY_FACTORS = {"gemini-1.5-flash-8b": 0.6, "gemini-1.5-flash": 1.0, "gemini-1.5-pro": 2.5}
+
+class GeminiBackend:
+    """
+    The real Gemini API. The SDK is imported and configured on first use, so importing
+    gemini_api does not require an API key.
+    """
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self._genai = None
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        with self._lock:
+            if self._genai is None:
+                from dotenv import load_dotenv
+                import google.generativeai as genai
+
+                load_dotenv()
+                api_key = self.api_key or os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("Gemini API key not found in .env. Please set GEMINI_API_KEY.")
+                genai.configure(api_key=api_key)
+                self._genai = genai
+            return self._genai
+
+    def model(self, model_name):
+        """
+        Returns a shared GenerativeModel handle for model_name.
+        """
+        genai = self._client()
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def generate(self, model_name, contents, generation_config=None, stream=False):
+        return self.model(model_name).generate_content(
+            contents, generation_config=generation_config, stream=stream
+        )
+
+class MockServiceError(Exception):
+    """
+    Simulated transient API failure; code mirrors the HTTP status so the scheduler retries it.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+class MockBackend:
+    """
+    Deterministic local stand-in for Gemini. Replies follow each prompt's expected format and
+    depend only on the prompt, so repeated runs return identical text. Latency and error rate
+    are configurable to exercise retries and concurrency without spending quota.
+    """
+
+    def __init__(self, latency=MOCK_LATENCY_SECONDS, error_rate=MOCK_ERROR_RATE, seed=0, stream_chunk_size=24):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.stream_chunk_size = stream_chunk_size
+        self._errors = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def generate(self, model_name, contents, generation_config=None, stream=False):
+        parts = contents if isinstance(contents, list) else [contents]
+        prompt = next((p for p in parts if isinstance(p, str)), "")
+        with self._lock:
+            self.calls += 1
+            fail = self._errors.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency * MOCK_MODEL_LATENCY_FACTORS.get(model_name, 1.0))
+        if fail:
+            raise MockServiceError(503, "Mock backend: service unavailable")
+        rng = random.Random(hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).digest())
+        text = self._reply(prompt, generation_config or {}, rng)
+        usage = SimpleNamespace(
+            prompt_token_count=len(prompt) // 4 + 258 * (len(parts) - 1),
+            candidates_token_count=len(text) // 4,
+        )
+        usage.total_token_count = usage.prompt_token_count + usage.candidates_token_count
+        if not stream:
+            return SimpleNamespace(text=text, usage_metadata=usage)
+        size = self.stream_chunk_size
+        return [
+            SimpleNamespace(text=text[i:i + size], usage_metadata=usage)
+            for i in range(0, len(text), size)
+        ]
+
+    def _reply(self, prompt, generation_config, rng):
+        if generation_config.get("response_schema"):
+            return json.dumps(_fake_from_schema(generation_config["response_schema"], rng, prompt))
+        if "each numbered caption below" in prompt:
+            numbers = re.findall(r'^(\d+)\. "', prompt, flags=re.MULTILINE)
+            return json.dumps({
+                number: {"score": round(rng.uniform(5, 9.5), 1), "why": "Clear hook and call to action."}
+                for number in numbers
+            })
+        if "each of these audiences:" in prompt:
+            languages = prompt.split("audiences:", 1)[1].split("\n", 1)[0].split(",")
+            caption = _quoted(prompt)
+            return json.dumps({
+                lang.strip(): {"localized_caption": f"[{lang.strip()}] {caption}", "note": ""}
+                for lang in languages if lang.strip()
+            })
+        if "localization specialist" in prompt:
+            language = re.search(r"for (.+?) audiences", prompt)
+            language = language.group(1) if language else "target"
+            return f'Localized Caption: "[{language}] {_quoted(prompt)}"\nNote: '
+        if "brainstorm" in prompt:
+            num = re.search(r"brainstorm (\d+)", prompt)
+            num = int(num.group(1)) if num else 3
+            return "\n".join(
+                f'{i}. "{_mock_tagline(rng)}" '
+                f"(Engagement: {rng.uniform(5, 9.5):.1f}/10) Why: Catchy and on-brand."
+                for i in range(1, num + 1)
+            )
+        lines = []
+        if "Given only an image" in prompt:
+            lines.append(f'Caption: "Mock caption {rng.randrange(10_000)}"')
+        lines += [
+            f"Engagement Score: {rng.uniform(5, 9.5):.1f}/10",
+            "Why: Clear call to action.",
+            "Brand Voice: Yes - playful and consistent.",
+            "Compliance: No risks found.",
+            "Suggested Captions:",
+            f'1. "Mock alternate {rng.randrange(10_000)}"',
+            f'2. "Mock alternate {rng.randrange(10_000)}"',
+        ]
+        if "Localized Caption:" in prompt:
+            language = re.search(r"for (.+?) audiences", prompt)
+            language = language.group(1) if language else "target"
+            source = lines[0] if lines[0].startswith("Caption:") else lines[-2].split(". ", 1)[1]
+            lines += [f'Localized Caption: "[{language}] {_quoted(source)}"', "Localization Note: "]
+        return "\n".join(lines)
+
+_TAGLINE_WORDS = (
+    ["Spin", "Play", "Chase", "Catch", "Unlock", "Grab", "Join", "Claim", "Feel", "Own"],
+    ["the jackpot", "your luck", "big wins", "the night", "every bonus", "golden moments", "the thrill",
+     "mega prizes", "lucky stars", "the spotlight"],
+    ["tonight", "with friends", "in style", "like a legend", "before midnight", "all weekend", "on us",
+     "at home", "every Friday", "in one click"],
+)
+
+def _mock_tagline(rng):
+    verbs, objects, endings = _TAGLINE_WORDS
+    return f"{rng.choice(verbs)} {rng.choice(objects)} {rng.choice(endings)}"
+
+def _quoted(prompt):
+    match = re.search(r'"([^"\n]*)"', prompt)
+    return match.group(1) if match else ""
+
+def _fake_from_schema(schema, rng, name=""):
+    """
+    Builds a value matching a response schema, for structured-output requests.
+    """
+    kind = str(schema.get("type", "string")).lower()
+    if kind == "object":
+        return {key: _fake_from_schema(sub, rng, key) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_fake_from_schema(schema["items"], rng, name) for _ in range(2)]
+    if kind in ("number", "integer"):
+        return round(rng.uniform(5, 9.5), 1)
+    return f"Mock {name.split('.')[-1] or 'text'} {rng.randrange(10_000)}"
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Returns the process-wide backend, chosen by GENIE_BACKEND ("gemini" or "mock").
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = MockBackend() if BACKEND_NAME == "mock" else GeminiBackend()
+        return _backend
+
+def set_backend(backend):
+    """
+    Replaces the process-wide backend (e.g. with a MockBackend in benchmarks).
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,241 @@
+# --------- batch.py ---------
+"""
+Headless batch runner for poster and caption catalogs.
+
+Usage:
+    python batch.py manifest.csv -o results.jsonl [--workers 4] [--checkpoint results.jsonl.checkpoint]
+
+The manifest is a CSV (with an "image" column and optional "caption", "languages" and "id"
+columns) or a JSONL file with the same keys. Languages may be a list or a string separated
+by ";" or "|". Results are appended to the output JSONL as items finish; completed item ids
+are recorded in the checkpoint file so an interrupted run can be resumed. Without an "id", an
+item is identified by its image path and a hash of its caption and languages, so reordering or
+editing other rows of the manifest keeps the ids of completed items. On resume, the records of
+items that failed before are replaced by their new results.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from gemini_api import analyze_caption, localize_caption, suggest_captions_from_image
+from poster_index import poster_index
+from routing import router
+from scheduler import BATCH, priority_lane, scheduler
+
+def _split_languages(value):
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(lang).strip() for lang in value if str(lang).strip()]
+    return [lang.strip() for lang in str(value).replace("|", ";").split(";") if lang.strip()]
+
+def item_id(image, caption, languages):
+    """
+    Default id of a manifest item: its image path as written plus a hash of its caption and languages.
+    """
+    digest = hashlib.sha256(json.dumps([caption, sorted(languages)], ensure_ascii=False).encode("utf-8"))
+    return f"{image}#{digest.hexdigest()[:12]}"
+
+def load_manifest(path):
+    """
+    Reads a CSV or JSONL manifest into a list of items with id, image, caption and languages.
+    Relative image paths are resolved against the manifest's directory. Rows repeating an
+    earlier row's image, caption and languages (without an id) are only listed once.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    items = []
+    seen = set()
+    for idx, row in enumerate(rows):
+        image = (row.get("image") or "").strip()
+        if not image:
+            raise ValueError(f"Manifest row {idx + 1} has no image path.")
+        caption = (row.get("caption") or "").strip()
+        languages = _split_languages(row.get("languages"))
+        if row.get("id"):
+            identifier = str(row["id"])
+        else:
+            identifier = item_id(image, caption, languages)
+            if identifier in seen:
+                continue
+        seen.add(identifier)
+        items.append({
+            "id": identifier,
+            "image": image if os.path.isabs(image) else os.path.join(base_dir, image),
+            "caption": caption,
+            "languages": languages,
+        })
+    return items
+
+def load_checkpoint(path):
+    """
+    Returns the set of item ids already completed.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+def drop_records(output, ids):
+    """
+    Rewrites the output JSONL without the records of the given item ids (and without a line cut
+    off by an interrupted run). Returns the number of records dropped.
+    """
+    if not ids or not os.path.exists(output):
+        return 0
+    kept = []
+    dropped = 0
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                dropped += 1
+                continue
+            if record.get("id") in ids:
+                dropped += 1
+            else:
+                kept.append(line if line.endswith("\n") else line + "\n")
+    if dropped:
+        temporary = output + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(temporary, output)
+    return dropped
+
+def process_item(item):
+    """
+    Analyzes (or suggests captions for) one poster and localizes its best caption.
+    """
+    started = time.perf_counter()
+    record = {"id": item["id"], "image": item["image"], "caption": item["caption"]}
+    try:
+        if item["caption"]:
+            analysis = analyze_caption(item["image"], item["caption"])
+            variations = analysis["caption_variations"]
+            best_caption = variations[0]["caption"] if variations else item["caption"]
+        else:
+            analysis = suggest_captions_from_image(item["image"])
+            best_caption = analysis["caption"]
+        record["analysis"] = analysis
+        record["localizations"] = {
+            lang: localize_caption(best_caption, lang)
+            for lang in item["languages"]
+            if lang != "English"
+        }
+    except Exception as e:
+        record["error"] = str(e)
+    record["elapsed"] = round(time.perf_counter() - started, 3)
+    return record
+
+def _process_in_batch_lane(item):
+    with priority_lane(BATCH):
+        return process_item(item)
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def run_batch(manifest, output, checkpoint=None, workers=4, log=sys.stderr):
+    """
+    Processes every manifest item not yet in the checkpoint through a pool of workers,
+    streaming results to output as they finish. Returns (succeeded, failed, skipped) counts.
+    """
+    checkpoint = checkpoint or output + ".checkpoint"
+    items = load_manifest(manifest)
+    done = load_checkpoint(checkpoint)
+    pending = [item for item in items if item["id"] not in done]
+    skipped = len(items) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} item(s) already in {checkpoint}", file=log)
+    # Items not checkpointed failed (or were cut off) last time: their new records replace the old ones
+    replaced = drop_records(output, {item["id"] for item in pending})
+    if replaced:
+        print(f"Replacing {replaced} earlier record(s) of items that did not complete", file=log)
+
+    succeeded = failed = 0
+    lock = threading.Lock()
+    started = time.perf_counter()
+    with open(output, "a", encoding="utf-8") as out, open(checkpoint, "a", encoding="utf-8") as ckpt, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_process_in_batch_lane, item) for item in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            with lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if "error" in record:
+                    failed += 1
+                else:
+                    succeeded += 1
+                    # Only successful items are checkpointed, so failures are retried on resume
+                    ckpt.write(record["id"] + "\n")
+                    ckpt.flush()
+                finished = succeeded + failed
+                rate = finished / max(time.perf_counter() - started, 1e-9)
+                eta = (len(pending) - finished) / rate if rate else 0
+                print(
+                    f"[{finished}/{len(pending)}] {rate:.2f} items/s, ETA {_format_eta(eta)}"
+                    + (f" — {record['id']} failed: {record['error']}" if "error" in record else ""),
+                    file=log,
+                )
+    return succeeded, failed, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Genie over a catalog of posters and captions.")
+    parser.add_argument("manifest", help="CSV or JSONL manifest (image, caption, languages, id)")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Concurrent items (default: 4)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    succeeded, failed, skipped = run_batch(args.manifest, args.output, args.checkpoint, args.workers)
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done: {succeeded} succeeded, {failed} failed, {skipped} skipped in {elapsed:.1f}s",
+        file=sys.stderr,
+    )
+    stats = scheduler.metrics()
+    print(
+        f"Scheduler: {stats['admitted']} requests, {stats['retries']} retries, "
+        f"mean wait {stats['mean_wait_seconds']['batch']:.2f}s, max queue depth {stats['max_queue_depth']}",
+        file=sys.stderr,
+    )
+    posters = poster_index.summary()
+    if posters["lookups"]:
+        print(
+            f"Poster index: {posters['near_hits']} near-duplicate and {posters['exact_hits']} repeated posters "
+            f"reused out of {posters['lookups']} lookups",
+            file=sys.stderr,
+        )
+    for task, route in router.summary().items():
+        models = ", ".join(
+            f"{model} ×{usage['attempts']} (~{usage['ewma_seconds']:.2f}s)" for model, usage in route["models"].items()
+        )
+        print(
+            f"Routing {task}: {models}; {route['escalations']} escalations (+{route['escalation_seconds']:.1f}s), "
+            f"{route['slo_fallbacks']} SLO fallbacks",
+            file=sys.stderr,
+        )
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+# --------- bench.py ---------
+"""
+End-to-end benchmarks for the gemini_api entry points against the local mock backend.
+
+Usage:
+    python bench.py [--iterations 30] [--concurrency 8] [--latency 0.05] [--runs 3]
+    python bench.py --update-baseline      # record the current numbers as the baseline
+
+Reports p50/p95/p99 latency, throughput under N concurrent callers and memory allocated per
+call. The stream_* benchmarks drain the whole stream per call and also report the latency of
+its first event. When bench_baseline.json exists, any benchmark whose p95 latency (or p95 first
+event) or throughput is worse than the baseline by more than the tolerance fails the run with
+exit code 1. Every benchmark is run --runs times (interleaved with the others) and compared by
+the median of each figure; throughput, measured over one short concurrent burst, must also drop
+by more than --throughput-noise before it counts.
+
+Re-record the baseline in every change to a benchmarked code path or to the mock's latencies.
+"""
+import os
+
+# Benchmarks never touch the real API, the response cache, the translation memory, the poster index
+# or the quota limits
+os.environ["GENIE_BACKEND"] = "mock"
+os.environ["GENIE_CACHE"] = "0"
+os.environ["GENIE_TM"] = "0"
+os.environ["GENIE_POSTER_INDEX"] = "0"
+os.environ.setdefault("GENIE_RPM", "1000000000")
+os.environ.setdefault("GENIE_TPM", "1000000000000")
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import gemini_api
+from backends import MockBackend, set_backend
+from compliance import screener
+from metrics import percentile
+from utils import run_ab_test_simulation
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+LANGUAGES = ["Spanish", "German", "French", "Italian", "Dutch", "Portuguese", "Polish", "Hindi"]
+
+def _poster(i):
+    # A distinct poster per call so the encoded-image cache does not hide the encode cost: every i
+    # below 2**24 gets its own colour, and each benchmark and run draws from its own range of i
+    return Image.new("RGB", (1600, 1200), (i % 256, (i >> 8) % 256, (i >> 16) % 256))
+
+def _variations(i, count=50):
+    return [
+        {"caption": f"Variation {i}-{n}", "score": None if n % 3 == 0 else 5 + (n % 50) / 10, "why": ""}
+        for n in range(count)
+    ]
+
+def _drain(stream):
+    """
+    Wraps a stream_* function into a call that consumes the whole stream and returns the
+    seconds until its first event.
+    """
+    def call(*args):
+        started = time.perf_counter()
+        first = None
+        for _ in stream(*args):
+            if first is None:
+                first = time.perf_counter() - started
+        return first
+    return call
+
+# name -> (setup(i) returning args, call(*args))
+BENCHMARKS = {
+    "generate_creative_ideas": (lambda i: (f"Give me 5 taglines for game night #{i}", "Witty"),
+                                gemini_api.generate_creative_ideas),
+    "generate_creative_ideas_60": (lambda i: (f"Give me 60 taglines for game night #{i}", "Witty"),
+                                   gemini_api.generate_creative_ideas),
+    "analyze_caption": (lambda i: (_poster(i), f"Spin to win, night {i}!"), gemini_api.analyze_caption),
+    "suggest_captions_from_image": (lambda i: (_poster(i),), gemini_api.suggest_captions_from_image),
+    "localize_caption": (lambda i: (f"Big wins tonight {i}", "Spanish"), gemini_api.localize_caption),
+    "localize_caption_many": (lambda i: (f"Big wins tonight {i}", LANGUAGES),
+                              lambda caption, langs: dict(gemini_api.localize_caption_many(caption, langs))),
+    "localize_caption_batch": (lambda i: (f"Big wins tonight {i}", LANGUAGES), gemini_api.localize_caption_batch),
+    "score_captions": (lambda i: ([v["caption"] for v in _variations(i)],), gemini_api.score_captions),
+    "run_ab_test_simulation": (lambda i: (_variations(i),), run_ab_test_simulation),
+    "prescreen_1000": (lambda i: ([f"Spin big, win free bets, night {i}-{n}" for n in range(1000)],),
+                       screener.screen_many),
+    "stream_creative_ideas": (lambda i: (f"Give me 5 taglines for game night #{i}", "Witty"),
+                              _drain(gemini_api.stream_creative_ideas)),
+    "stream_caption_analysis": (lambda i: (_poster(i), f"Spin to win, night {i}!"),
+                                _drain(gemini_api.stream_caption_analysis)),
+    "stream_caption_suggestions": (lambda i: (_poster(i),), _drain(gemini_api.stream_caption_suggestions)),
+}
+# Benchmarks whose call returns the seconds to its first event
+STREAMING = {"stream_creative_ideas", "stream_caption_analysis", "stream_caption_suggestions"}
+
+def run_benchmark(setup, call, iterations, concurrency, streaming=False, offset=0):
+    """
+    Measures sequential latency percentiles, concurrent throughput and memory per call.
+    For streaming benchmarks the first-event latency percentiles are measured as well.
+    Inputs are set up for offset + 0 up to offset + 3 * iterations.
+    """
+    latencies = []
+    first_events = []
+    for i in range(iterations):
+        args = setup(offset + i)
+        started = time.perf_counter()
+        first = call(*args)
+        latencies.append(time.perf_counter() - started)
+        if streaming and first is not None:
+            first_events.append(first)
+
+    jobs = [setup(offset + iterations + i) for i in range(iterations)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda args: call(*args), jobs))
+    throughput = iterations / (time.perf_counter() - started)
+
+    samples = [setup(offset + 2 * iterations + i) for i in range(min(iterations, 10))]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for args in samples:
+        call(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocations = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "filename"))
+
+    result = {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "throughput_per_s": round(throughput, 2),
+        "peak_kib": round(peak / 1024, 1),
+        "net_blocks_per_call": round(allocations / len(samples), 1),
+    }
+    if first_events:
+        result["first_event_p50_ms"] = round(percentile(first_events, 50) * 1000, 3)
+        result["first_event_p95_ms"] = round(percentile(first_events, 95) * 1000, 3)
+    return result
+
+def _slower(current_ms, previous_ms, tolerance, noise_floor_ms):
+    return current_ms - previous_ms > max(previous_ms * tolerance, noise_floor_ms)
+
+def median_results(runs):
+    """
+    Combines the results of several runs of one benchmark into the median of each figure.
+    """
+    return {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+
+def compare_to_baseline(results, baseline, tolerance, noise_floor_ms=1.0, throughput_noise=0.4):
+    """
+    Returns a list of human-readable regressions against the baseline. Latency differences below
+    noise_floor_ms per call are ignored so sub-millisecond benchmarks do not flap; throughput
+    must drop by more than both tolerance and throughput_noise (as shares of the baseline).
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        if _slower(current["p95_ms"], previous["p95_ms"], tolerance, noise_floor_ms):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {previous['p95_ms']}ms")
+        if "first_event_p95_ms" in current and "first_event_p95_ms" in previous and _slower(
+                current["first_event_p95_ms"], previous["first_event_p95_ms"], tolerance, noise_floor_ms):
+            regressions.append(
+                f"{name}: first event p95 {current['first_event_p95_ms']}ms"
+                f" vs baseline {previous['first_event_p95_ms']}ms"
+            )
+        if current["throughput_per_s"] < previous["throughput_per_s"] * (1 - max(tolerance, throughput_noise)):
+            regressions.append(
+                f"{name}: throughput {current['throughput_per_s']}/s vs baseline {previous['throughput_per_s']}/s"
+            )
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Genie against the mock backend.")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API latency in seconds")
+    parser.add_argument("--only", nargs="*", help="Run only these benchmarks")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--runs", type=int, default=3, help="Runs per benchmark, compared by their median")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--throughput-noise", type=float, default=0.4,
+                        help="Throughput drop always treated as noise (0.4 = 40%%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    set_backend(MockBackend(latency=args.latency, error_rate=0.0))
+    names = [name for name in BENCHMARKS if not args.only or name in args.only]
+    # Each (run, benchmark) sets up its inputs from its own range, so no benchmark reuses another's posters
+    stride = 3 * args.iterations + 10
+    runs = {name: [] for name in names}
+    for run in range(max(1, args.runs)):
+        for name in names:
+            setup, call = BENCHMARKS[name]
+            offset = (run * len(BENCHMARKS) + list(BENCHMARKS).index(name)) * stride
+            runs[name].append(run_benchmark(setup, call, args.iterations, args.concurrency, name in STREAMING, offset))
+    results = {}
+    print(f"{'benchmark':<30}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'calls/s':>10}{'peak KiB':>10}{'blocks':>10}"
+          f"{'1st p50':>10}{'1st p95':>10}")
+    for name in names:
+        r = results[name] = median_results(runs[name])
+        print(f"{name:<30}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['throughput_per_s']:>10}{r['peak_kib']:>10}{r['net_blocks_per_call']:>10}"
+              f"{r.get('first_event_p50_ms', '-'):>10}{r.get('first_event_p95_ms', '-'):>10}")
+
+    settings = {"iterations": args.iterations, "concurrency": args.concurrency, "latency": args.latency,
+                "runs": args.runs}
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != settings:
+        print("Baseline was recorded with different settings; skipping comparison.")
+        return 0
+    regressions = compare_to_baseline(results, baseline, args.tolerance, throughput_noise=args.throughput_noise)
+    if regressions:
+        print("\nPERFORMANCE REGRESSIONS:", file=sys.stderr)
+        for line in regressions:
+            print(f"  - {line}", file=sys.stderr)
+        return 1
+    print("\nNo regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
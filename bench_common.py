@@ -0,0 +1,52 @@
+# --------- bench_common.py ---------
+"""
+Helpers shared by the benchmark scripts that drive the app in fresh interpreters
+(bench_startup.py, bench_memory.py).
+"""
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def probe_env(label):
+    """
+    Environment for a probe interpreter: the mock backend without latency, and no response cache,
+    translation memory, poster index or quota limits, so only the app itself is measured.
+    """
+    return dict(
+        os.environ,
+        GENIE_BACKEND="mock",
+        GENIE_MOCK_LATENCY="0",
+        GENIE_CACHE="0",
+        GENIE_TM="0",
+        GENIE_POSTER_INDEX="0",
+        GENIE_RPM="1000000000",
+        # Older revisions require a key at import time; it is never used against the API here
+        GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", label),
+    )
+
+def run_probe(source, app_dir, args, label):
+    """
+    Runs the probe source in a fresh interpreter inside app_dir with the given arguments and
+    returns the JSON object printed on its last line of output.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", source, app_dir, *args],
+        cwd=app_dir, env=probe_env(label), capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def export_revision(ref, target):
+    """
+    Extracts the tree of a git revision of the app into the target directory.
+    """
+    archive = subprocess.run(["git", "archive", ref], cwd=HERE, capture_output=True, check=True).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(target)
@@ -0,0 +1,130 @@
+# --------- bench_memory.py ---------
+"""
+Peak-memory benchmark for the app's image path on large uploads, using the mock backend.
+
+Usage:
+    python bench_memory.py [--megapixels 20 35 50] [--formats JPEG PNG] [--compare <git-ref>]
+
+For every size and format a synthetic poster is written to disk, then a fresh interpreter drives
+app.py through Streamlit's AppTest with that file as the upload and clicks "Analyze Content",
+followed by one plain rerun. The peak resident memory of each step is read from VmHWM (reset
+just before the step), so it is reported relative to the RSS before the step. Linux only. With
+--compare, the same uploads are measured for another revision of the app.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from bench_common import HERE, export_revision, run_probe
+
+# Runs inside a fresh interpreter; prints one JSON line of memory figures
+_PROBE = r"""
+import json, sys, time, warnings
+warnings.filterwarnings("ignore")
+app_dir, image_path = sys.argv[1], sys.argv[2]
+sys.path.insert(0, app_dir)
+
+def status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+
+def reset_peak():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+wrapper = image_path + ".app.py"
+with open(wrapper, "w") as f:
+    f.write(
+        "import streamlit as st\n"
+        "class _Upload:\n"
+        "    def getvalue(self):\n"
+        f"        with open({image_path!r}, 'rb') as f:\n"
+        "            return f.read()\n"
+        "_upload = _Upload()\n"
+        "st.file_uploader = lambda *args, **kwargs: _upload\n"
+        f"exec(compile(open({app_dir + '/app.py'!r}).read(), 'app.py', 'exec'))\n"
+    )
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(wrapper, default_timeout=120)
+at.run()
+result = {}
+for step in ("analyze", "rerun"):
+    before = status("VmRSS")
+    reset_peak()
+    t = time.perf_counter()
+    if step == "analyze":
+        at.button(key="analyze_btn").click().run()
+    else:
+        at.run()
+    result[step + "_s"] = time.perf_counter() - t
+    result[step + "_peak_bytes"] = status("VmHWM") - before
+result["error"] = "; ".join(str(e.value) for e in at.error) or (str(at.exception[0].value) if at.exception else "")
+print(json.dumps(result))
+"""
+
+def make_poster(path, megapixels, fmt):
+    """
+    Writes a synthetic poster of about the given size: smooth gradients with solid blocks of
+    colour, which compress like real artwork rather than like noise.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    width = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)
+    height = int(megapixels * 1_000_000 / width)
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = (x * 0.7 + y * 0.3).astype(np.uint8)
+    pixels[..., 1] = (255 - x * 0.5).astype(np.uint8).repeat(height, axis=0)
+    pixels[..., 2] = (y * 0.8).astype(np.uint8).repeat(width, axis=1)
+    image = Image.fromarray(pixels)
+    del pixels
+    draw = ImageDraw.Draw(image)
+    for i in range(12):
+        left, top = width * i // 14, height * ((i * 5) % 12) // 13
+        draw.rectangle([left, top, left + width // 10, top + height // 14], fill=(30 * i % 256, 90, 200 - 10 * i))
+    image.save(path, format=fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return os.path.getsize(path)
+
+def _probe(app_dir, image_path):
+    return run_probe(_PROBE, app_dir, [image_path], "memory-benchmark")
+
+def _mib(num_bytes):
+    return f"{num_bytes / (1024 * 1024):.0f}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the app's peak memory on large image uploads.")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[20, 35, 50])
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "PNG"])
+    parser.add_argument("--compare", metavar="GIT_REF", help="Also measure this revision of the app")
+    args = parser.parse_args(argv)
+    if not os.path.exists("/proc/self/clear_refs"):
+        print("bench_memory.py needs Linux (/proc/self/clear_refs).", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trees = [("working tree", HERE)]
+        if args.compare:
+            previous = os.path.join(tmp, "previous")
+            export_revision(args.compare, previous)
+            trees.append((args.compare, previous))
+        print(f"{'upload':<16}{'file MiB':>9}  {'revision':<14}{'analyze MiB':>12}{'rerun MiB':>10}"
+              f"{'analyze s':>10}  error")
+        for fmt in args.formats:
+            for megapixels in args.megapixels:
+                path = os.path.join(tmp, f"poster_{megapixels:g}mp.{fmt.lower()}")
+                size = make_poster(path, megapixels, fmt)
+                for label, app_dir in trees:
+                    r = _probe(app_dir, path)
+                    print(f"{f'{megapixels:g} MP {fmt}':<16}{_mib(size):>9}  {label:<14}"
+                          f"{_mib(r['analyze_peak_bytes']):>12}{_mib(r['rerun_peak_bytes']):>10}"
+                          f"{r['analyze_s']:>10.2f}  {r['error']}")
+                os.remove(path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# --------- bench_startup.py ---------
+"""
+Cold-start and rerun timing harness for the Streamlit app, using the mock backend.
+
+Usage:
+    python bench_startup.py [--runs 5] [--reruns 10] [--compare <git-ref>]
+
+Each run starts a fresh interpreter and drives app.py through Streamlit's AppTest: the first
+page load, plain reruns, and one "Generate Ideas" interaction. Like a Streamlit server, the
+probe compiles app.py once, so reruns time the script itself rather than AppTest recompiling it. With --compare, the same cold
+start and rerun measurements are taken for another revision of the app (e.g. the commit before
+lazy startup) so the gain can be read off directly.
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+
+from bench_common import HERE, export_revision, run_probe
+
+# Runs inside a fresh interpreter; prints one JSON line of timings
+_PROBE = r"""
+import json, sys, time, warnings
+started = time.perf_counter()
+warnings.filterwarnings("ignore")
+from streamlit.testing.v1 import AppTest
+import streamlit.testing.v1.local_script_runner as local_runner
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+# A Streamlit server compiles the script once and reuses its bytecode; AppTest recompiles
+# app.py on every run, which would make reruns grow with the size of the file
+shared_cache = ScriptCache()
+local_runner.ScriptCache = lambda: shared_cache
+app_dir, reruns, interact = sys.argv[1], int(sys.argv[2]), sys.argv[3] == "1"
+sys.path.insert(0, app_dir)
+at = AppTest.from_file(app_dir + "/app.py", default_timeout=60)
+t = time.perf_counter()
+at.run()
+first_run = time.perf_counter() - t
+result = {
+    "cold_start_s": time.perf_counter() - started,
+    "first_run_s": first_run,
+    "sdk_loaded": "google.generativeai" in sys.modules,
+    "pil_loaded": "PIL.Image" in sys.modules,
+    "error": str(at.exception[0].value) if at.exception else "",
+}
+times = []
+for _ in range(reruns):
+    t = time.perf_counter()
+    at.run()
+    times.append(time.perf_counter() - t)
+result["rerun_s"] = times
+if interact:
+    at.text_area(key="creative_prompt").input("Give me 3 taglines for a game night")
+    t = time.perf_counter()
+    at.button(key="generate_ideas_btn").click().run()
+    result["interaction_s"] = time.perf_counter() - t
+    t = time.perf_counter()
+    at.run()
+    result["rerun_after_interaction_s"] = time.perf_counter() - t
+print(json.dumps(result))
+"""
+
+def _probe(app_dir, reruns, interact):
+    return run_probe(_PROBE, app_dir, [str(reruns), "1" if interact else "0"], "startup-benchmark")
+
+def measure(app_dir, runs, reruns, interact):
+    """
+    Runs the probe runs times in fresh interpreters and returns median timings.
+    """
+    samples = [_probe(app_dir, reruns, interact) for _ in range(runs)]
+    summary = {
+        "cold_start_s": statistics.median(s["cold_start_s"] for s in samples),
+        "first_run_s": statistics.median(s["first_run_s"] for s in samples),
+        "rerun_s": statistics.median(t for s in samples for t in s["rerun_s"]),
+        "sdk_loaded_at_startup": samples[0]["sdk_loaded"],
+        "pil_loaded_at_startup": samples[0]["pil_loaded"],
+        "error": samples[0]["error"],
+    }
+    if interact:
+        summary["interaction_s"] = statistics.median(s["interaction_s"] for s in samples)
+        summary["rerun_after_interaction_s"] = statistics.median(s["rerun_after_interaction_s"] for s in samples)
+    return summary
+
+def _print(label, summary):
+    print(f"\n{label}")
+    for key, value in summary.items():
+        if isinstance(value, float):
+            print(f"  {key:<28}{value * 1000:>10.1f} ms")
+        elif value not in ("", None):
+            print(f"  {key:<28}{value!s:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Streamlit cold start and rerun times.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--reruns", type=int, default=10, help="Reruns timed per interpreter")
+    parser.add_argument("--compare", metavar="GIT_REF", help="Also measure this revision of the app")
+    args = parser.parse_args(argv)
+
+    current = measure(HERE, args.runs, args.reruns, interact=True)
+    _print("Working tree", current)
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            export_revision(args.compare, tmp)
+            previous = measure(tmp, args.runs, args.reruns, interact=False)
+        _print(f"Revision {args.compare}", previous)
+        print("\nSpeedup vs", args.compare)
+        for key in ("cold_start_s", "first_run_s", "rerun_s"):
+            print(f"  {key:<28}{previous[key] / max(current[key], 1e-9):>9.2f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
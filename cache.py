@@ -0,0 +1,181 @@
+# --------- cache.py ---------
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Cache settings (override via environment variables)
+CACHE_ENABLED = os.getenv("GENIE_CACHE", "1") != "0"
+CACHE_PATH = os.getenv(
+    "GENIE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "genie", "responses.sqlite3"),
+)
+CACHE_TTL_SECONDS = float(os.getenv("GENIE_CACHE_TTL", 7 * 24 * 3600))
+MEMORY_MAX_ENTRIES = int(os.getenv("GENIE_CACHE_MEMORY_ENTRIES", 256))
+DISK_MAX_BYTES = int(os.getenv("GENIE_CACHE_DISK_MAX_BYTES", 64 * 1024 * 1024))
+
+def make_cache_key(model_name, prompt, image_bytes=None, namespace=""):
+    """
+    Builds a content-addressed cache key from the model name, the rendered prompt
+    and (optionally) the image bytes sent alongside it.
+    """
+    digest = hashlib.sha256()
+    for part in (namespace, model_name, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    if image_bytes:
+        digest.update(image_bytes)
+    return digest.hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier cache for parsed Gemini results: an in-process LRU in front of a
+    persistent SQLite store. Values are stored as JSON, so every hit hands back a
+    fresh copy that callers are free to mutate.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS,
+                 memory_max_entries=MEMORY_MAX_ENTRIES, disk_max_bytes=DISK_MAX_BYTES,
+                 enabled=True):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # The SQLite store is opened on first use, keeping imports cheap
+        self._db = None
+        self._db_opened = False
+        self._writes_since_prune = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _disk(self):
+        """
+        Returns the SQLite connection, opening it on first use. Call with the lock held.
+        """
+        if not self._db_opened:
+            self._db_opened = True
+            self._db = self._open_db(self.path) if self.path else None
+        return self._db
+
+    def _open_db(self, path):
+        """
+        Opens (and creates if needed) the SQLite store. Falls back to memory-only
+        caching if the location is not writable.
+        """
+        try:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            db.commit()
+            return db
+        except (OSError, sqlite3.Error):
+            return None
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None on a miss or expired entry.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return json.loads(payload)
+                del self._memory[key]
+            if self._disk() is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and row[1] > now:
+                        self._db.execute(
+                            "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._db.commit()
+                        self._remember(key, row[0], row[1])
+                        self.stats["disk_hits"] += 1
+                        return json.loads(row[0])
+                except sqlite3.Error:
+                    pass
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        """
+        Stores a JSON-serializable value under key in both tiers.
+        """
+        if not self.enabled:
+            return
+        payload = json.dumps(value)
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, payload, expires_at)
+            if self._disk() is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload), expires_at, now),
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 50:
+                    self._prune_disk(now)
+                self._db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key, payload, expires_at):
+        self._memory[key] = (payload, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now):
+        """
+        Drops expired rows, then least recently used rows until the store fits
+        within disk_max_bytes.
+        """
+        self._writes_since_prune = 0
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        excess = total - self.disk_max_bytes
+        freed = 0
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self):
+        """
+        Empties both cache tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._disk() is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+response_cache = ResponseCache(enabled=CACHE_ENABLED)
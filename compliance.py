@@ -0,0 +1,364 @@
+# --------- compliance.py ---------
+"""
+Local responsible-gaming pre-screen for captions.
+
+Banned and risky phrasings are kept as rules per language (and optionally per market). The
+phrases of every rule that applies to a language are compiled into one Aho-Corasick automaton,
+so a caption is matched against all of them in a single pass; rules that need more than a fixed
+phrase use regular expressions. Screening a caption takes microseconds and needs no model call,
+so clear violations can be flagged or filtered before (or instead of) asking Gemini.
+
+Extra rules can be loaded from a JSON file (GENIE_COMPLIANCE_RULES): a list of objects with an
+"id", a "severity" ("block" or "warn"), a "message", "phrases" and/or "patterns" as
+{language: [...]} ("*" applies to every language) and optional "markets" (e.g. ["UK"]).
+A rule with the id of a built-in rule replaces it.
+
+Usage:
+    python compliance.py captions.csv -o findings.jsonl [--language German] [--market UK]
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import deque
+
+# Compliance pre-screen settings (override via environment variables)
+RULES_PATH = os.getenv("GENIE_COMPLIANCE_RULES", "")
+# Market-specific rules (e.g. "UK") only apply when a market is set
+DEFAULT_MARKET = os.getenv("GENIE_COMPLIANCE_MARKET", "").strip() or None
+
+SOURCE_LANGUAGE = "English"
+BLOCK = "block"
+WARN = "warn"
+PASS = "pass"
+_SEVERITY_RANK = {PASS: 0, WARN: 1, BLOCK: 2}
+
+DEFAULT_RULES = [
+    {
+        "id": "guaranteed-win",
+        "severity": BLOCK,
+        "message": "Promises a guaranteed win",
+        "phrases": {
+            "English": ["guaranteed win", "guaranteed wins", "guaranteed to win", "guaranteed winnings",
+                        "sure win", "sure bet", "can't lose", "cannot lose", "can not lose", "never lose",
+                        "win every time", "always win"],
+            "Spanish": ["ganancia garantizada", "victoria garantizada", "gana seguro", "ganar seguro",
+                        "no puedes perder", "siempre ganas"],
+            "German": ["garantierter gewinn", "gewinn garantiert", "sicherer gewinn",
+                       "du kannst nicht verlieren", "immer gewinnen"],
+            "French": ["gain garanti", "victoire garantie", "gagner à coup sûr", "tu ne peux pas perdre",
+                       "vous ne pouvez pas perdre"],
+            "Italian": ["vincita garantita", "vincita sicura", "non puoi perdere"],
+            "Dutch": ["gegarandeerde winst", "gegarandeerd winnen", "je kunt niet verliezen"],
+            "Portuguese": ["ganho garantido", "vitória garantida", "você não pode perder", "não tem como perder"],
+            "Polish": ["gwarantowana wygrana", "pewna wygrana", "nie możesz przegrać"],
+            "Hindi": ["पक्की जीत", "गारंटीड जीत", "जीत की गारंटी"],
+        },
+        "patterns": {
+            "*": [r"\b100 ?% (?:win|guaranteed|chance of winning)"],
+        },
+    },
+    {
+        "id": "risk-free",
+        "severity": BLOCK,
+        "message": "Presents gambling as risk-free",
+        "phrases": {
+            "English": ["risk free", "no risk", "zero risk", "without risk"],
+            "Spanish": ["sin riesgo", "sin riesgos", "libre de riesgo"],
+            "German": ["ohne risiko", "risikofrei", "null risiko"],
+            "French": ["sans risque", "sans risques", "zéro risque"],
+            "Italian": ["senza rischio", "senza rischi", "zero rischi"],
+            "Dutch": ["zonder risico", "risicoloos"],
+            "Portuguese": ["sem risco", "sem riscos", "risco zero"],
+            "Polish": ["bez ryzyka"],
+            "Hindi": ["बिना जोखिम", "जोखिम मुक्त"],
+        },
+    },
+    {
+        "id": "financial-solution",
+        "severity": BLOCK,
+        "message": "Presents gambling as a way to make money or solve money problems",
+        "phrases": {
+            "English": ["easy money", "free money", "get rich", "quick cash", "pay off your debts",
+                        "pay your bills", "quit your job", "solve your money problems", "financial freedom"],
+            "Spanish": ["dinero fácil", "dinero gratis", "hazte rico", "hacerte rico", "paga tus deudas"],
+            "German": ["leichtes geld", "schnelles geld", "gratis geld", "werde reich", "reich werden"],
+            "French": ["argent facile", "argent gratuit", "devenez riche", "deviens riche"],
+            "Italian": ["soldi facili", "soldi gratis", "diventa ricco"],
+            "Dutch": ["makkelijk geld", "gratis geld", "word rijk", "rijk worden"],
+            "Portuguese": ["dinheiro fácil", "dinheiro grátis", "fique rico"],
+            "Polish": ["łatwe pieniądze", "darmowe pieniądze", "zostań bogaty"],
+            "Hindi": ["आसान पैसा", "मुफ्त पैसा", "अमीर बनें"],
+        },
+        "patterns": {
+            "English": [r"\b(?:double|triple) your (?:money|cash|salary)\b"],
+        },
+    },
+    {
+        "id": "chasing-losses",
+        "severity": BLOCK,
+        "message": "Encourages chasing losses or gambling with money needed elsewhere",
+        "phrases": {
+            "English": ["win back your losses", "win it all back", "chase your losses", "chase losses",
+                        "recover your losses", "make up for your losses"],
+            "Spanish": ["recupera tus pérdidas", "recuperar tus pérdidas"],
+            "German": ["verluste zurückgewinnen", "hol dir deine verluste zurück"],
+            "French": ["récupérez vos pertes", "récupère tes pertes"],
+            "Italian": ["recupera le perdite", "recupera le tue perdite"],
+            "Dutch": ["verlies terugwinnen", "win je verlies terug"],
+            "Portuguese": ["recupere suas perdas", "recupere as suas perdas"],
+            "Polish": ["odzyskaj straty"],
+        },
+        "patterns": {
+            "English": [r"\b(?:borrow|loan)\w* (?:money |cash )?(?:to|and) (?:bet|gamble|play)\b",
+                        r"\bbet (?:your|the) (?:rent|savings|paycheck|salary|house)\b"],
+        },
+    },
+    {
+        "id": "minors",
+        "severity": WARN,
+        "message": "Mentions or appeals to minors",
+        "phrases": {
+            "Spanish": ["niños", "adolescentes", "menores de edad"],
+            "German": ["kinder", "jugendliche", "schüler"],
+            "French": ["enfants", "ados", "adolescents", "mineurs"],
+            "Italian": ["bambini", "ragazzini", "adolescenti", "minorenni"],
+            "Dutch": ["kinderen", "tieners", "minderjarigen"],
+            "Portuguese": ["crianças", "adolescentes", "menores de idade"],
+            "Polish": ["dzieci", "nastolatki", "nieletni"],
+            "Hindi": ["बच्चे", "बच्चों"],
+        },
+        "patterns": {
+            "English": [r"\b(?:kids?|children|teens?|teenagers?|students?|minors?|under ?18s?)\b"],
+        },
+    },
+    {
+        "id": "excessive-play",
+        "severity": WARN,
+        "message": "Encourages excessive or uncontrolled play",
+        "phrases": {
+            "English": ["bet it all", "go all in", "don't stop", "never stop", "no limits", "without limits",
+                        "all night long", "one more spin"],
+            "Spanish": ["sin límites", "no pares", "apuesta todo"],
+            "German": ["ohne limit", "ohne grenzen", "hör nicht auf", "setz alles"],
+            "French": ["sans limite", "sans limites", "ne t'arrête pas", "mise tout"],
+            "Italian": ["senza limiti", "non fermarti", "punta tutto"],
+            "Dutch": ["zonder limiet", "zonder grenzen", "stop niet", "zet alles in"],
+            "Portuguese": ["sem limites", "não pare", "aposte tudo"],
+            "Polish": ["bez limitu", "bez granic", "nie przestawaj"],
+        },
+    },
+    {
+        "id": "free-bet-terms",
+        "severity": WARN,
+        "message": "Free bet or bonus offers must state their significant terms",
+        "markets": ["UK", "US"],
+        "patterns": {
+            "English": [r"\bfree (?:bets?|spins?|plays?)\b", r"\bno deposit\b"],
+        },
+    },
+]
+
+def normalize(text):
+    """
+    Matching form of a caption: Unicode-normalized, case-folded, typographic apostrophes unified and
+    hyphens, dashes and whitespace collapsed into single spaces ("Risk-free" matches "risk free").
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().replace("’", "'").replace("‘", "'")
+    return re.sub(r"[\s\-‐‑–—_]+", " ", text).strip()
+
+def _is_word_char(char):
+    # Combining marks continue a word (e.g. Devanagari vowel signs)
+    return char.isalnum() or unicodedata.category(char).startswith("M")
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of phrases. find() reports every occurrence of every
+    phrase in one left-to-right pass over the text, however many phrases there are.
+    """
+
+    def __init__(self, phrases):
+        # phrases: phrase -> payload reported with each match
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for phrase, payload in phrases.items():
+            node = 0
+            for char in phrase:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._out[node] = ((len(phrase), payload),)
+        # Breadth-first so every failure link points at an already finished, shallower node
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] += self._out[self._fail[child]]
+                pending.append(child)
+
+    def find(self, text):
+        """
+        Yields (start, end, payload) for every phrase occurrence in text.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, payload in out[node]:
+                yield end - length, end, payload
+
+class ComplianceScreener:
+    """
+    Screens captions against the rules for a language and market. The automaton and regexes for
+    each (language, market) are compiled on first use and then shared between threads.
+    """
+
+    def __init__(self, rules=None, market=DEFAULT_MARKET):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.market = market
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def _applies(self, rule, market):
+        markets = rule.get("markets")
+        return not markets or (market is not None and market.upper() in {m.upper() for m in markets})
+
+    def _compile(self, language, market):
+        key = (language, market)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            return compiled
+        # English rules apply to every language: English claims often survive in localized copy
+        languages = ("*", SOURCE_LANGUAGE, language)
+        phrases = {}
+        patterns = []
+        for rule in self.rules:
+            if not self._applies(rule, market):
+                continue
+            for lang in dict.fromkeys(languages):
+                for phrase in rule.get("phrases", {}).get(lang, ()):
+                    phrases.setdefault(normalize(phrase), []).append(rule)
+                for pattern in rule.get("patterns", {}).get(lang, ()):
+                    patterns.append((re.compile(pattern), rule))
+        compiled = (KeywordAutomaton(phrases), patterns)
+        with self._lock:
+            return self._compiled.setdefault(key, compiled)
+
+    def screen(self, caption, language=SOURCE_LANGUAGE, market=None):
+        """
+        Screens one caption. Returns {"verdict": "block" | "warn" | "pass", "findings": [...]}
+        with one {"rule", "severity", "message", "match"} finding per rule that matched.
+        """
+        automaton, patterns = self._compile(language or SOURCE_LANGUAGE, market or self.market)
+        text = normalize(caption)
+        findings = {}
+        for start, end, rules in automaton.find(text):
+            if (start and _is_word_char(text[start - 1])) or (end < len(text) and _is_word_char(text[end])):
+                continue
+            for rule in rules:
+                findings.setdefault(rule["id"], (rule, text[start:end]))
+        for pattern, rule in patterns:
+            if rule["id"] not in findings:
+                match = pattern.search(text)
+                if match:
+                    findings[rule["id"]] = (rule, match.group(0))
+        verdict = PASS
+        for rule, _ in findings.values():
+            if _SEVERITY_RANK[rule["severity"]] > _SEVERITY_RANK[verdict]:
+                verdict = rule["severity"]
+        return {
+            "verdict": verdict,
+            "findings": [
+                {"rule": rule["id"], "severity": rule["severity"], "message": rule["message"], "match": match}
+                for rule, match in findings.values()
+            ],
+        }
+
+    def screen_many(self, captions, language=SOURCE_LANGUAGE, market=None):
+        """
+        Screens a list of captions in the same language. Returns one result per caption, in order.
+        """
+        return [self.screen(caption, language, market) for caption in captions]
+
+def load_rules(path=RULES_PATH):
+    """
+    Returns the built-in rules extended (or overridden, by id) with the rules in a JSON file.
+    """
+    if not path:
+        return DEFAULT_RULES
+    with open(path, encoding="utf-8") as f:
+        extra = json.load(f)
+    rules = {rule["id"]: rule for rule in DEFAULT_RULES}
+    for rule in extra:
+        if rule.get("severity") not in (BLOCK, WARN):
+            raise ValueError(f"Compliance rule {rule.get('id')!r} needs a severity of 'block' or 'warn'.")
+        rules[rule["id"]] = rule
+    return list(rules.values())
+
+screener = ComplianceScreener(load_rules())
+
+def prescreen(caption, language=SOURCE_LANGUAGE, market=None):
+    """
+    Screens a caption with the process-wide rules (see ComplianceScreener.screen).
+    """
+    return screener.screen(caption, language, market)
+
+def _load_captions(path, language):
+    """
+    Reads (caption, language) pairs from a CSV or JSONL file with a "caption" and optional
+    "language" column, or from a text file with one caption per line.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        elif path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [{"caption": line.rstrip("\n")} for line in f if line.strip()]
+    return [((row.get("caption") or "").strip(), (row.get("language") or "").strip() or language) for row in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-screen a caption catalog for responsible-gaming risks.")
+    parser.add_argument("path", help="CSV or JSONL (caption, optional language) or a text file, one caption per line")
+    parser.add_argument("-o", "--output", help="JSONL file for the results (default: stdout)")
+    parser.add_argument("--language", default=SOURCE_LANGUAGE, help="Language of rows without one (default: English)")
+    parser.add_argument("--market", default=DEFAULT_MARKET, help="Also apply this market's rules (e.g. UK)")
+    args = parser.parse_args(argv)
+
+    rows = _load_captions(args.path, args.language)
+    started = time.perf_counter()
+    results = [screener.screen(caption, language, args.market) for caption, language in rows]
+    elapsed = time.perf_counter() - started
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for (caption, language), result in zip(rows, results):
+            out.write(json.dumps({"caption": caption, "language": language, **result}, ensure_ascii=False) + "\n")
+    finally:
+        if args.output:
+            out.close()
+    verdicts = [result["verdict"] for result in results]
+    print(
+        f"Screened {len(rows)} captions in {elapsed * 1000:.1f}ms: "
+        f"{verdicts.count(BLOCK)} blocked, {verdicts.count(WARN)} warned, {verdicts.count(PASS)} passed",
+        file=sys.stderr,
+    )
+    return 1 if BLOCK in verdicts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,177 +1,475 @@
-import google.generativeai as genai
+import contextvars
+import json
+import math
 import os
+import queue
 import re
-from dotenv import load_dotenv
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import metrics
+from backends import get_backend
+from cache import make_cache_key, response_cache
+from compliance import BLOCK, prescreen
+from image_utils import image_part, prepare_image
+from poster_index import poster_index
+from routing import ANALYSIS, CREATIVE, LOCALIZATION, SCORING, SUGGESTION, note_model_seconds, router
+from scheduler import estimate_tokens, scheduler
+from similarity import NearDuplicateIndex
+from translation_memory import translation_memory
 from prompts import (
     creative_prompt_template,
     caption_analysis_template,
     image_caption_suggestion_template,
     localization_template,
+    localization_hints_template,
+    fused_localization_instruction,
+    multi_localization_template,
+    caption_scoring_template,
+    caption_scoring_poster_context,
+    creative_angle_instruction,
+    creative_angles,
+    structured_creative_prompt_template,
+    structured_caption_analysis_template,
+    structured_image_caption_suggestion_template,
+    structured_repair_template,
 )
+from schemas import (
+    ANALYSIS_SCHEMA,
+    CREATIVE_SCHEMA,
+    SUGGESTION_SCHEMA,
+    CaptionAnalysis,
+    CaptionSuggestion,
+    CreativeIdeas,
+    apply_repair,
+    parse_structured,
+    repair_schema,
+    response_config,
+)
+
+# The API key is read from .env on the first call (see backends.GeminiBackend); the model of
+# each call is chosen per task by routing.router
+LOCALIZATION_MAX_WORKERS = int(os.getenv("GENIE_LOCALIZATION_MAX_WORKERS", 4))
+LOCALIZATION_BATCH_SIZE = int(os.getenv("GENIE_LOCALIZATION_BATCH_SIZE", 5))
+SCORING_BATCH_SIZE = int(os.getenv("GENIE_SCORING_BATCH_SIZE", 20))
+SCORING_MAX_WORKERS = int(os.getenv("GENIE_SCORING_MAX_WORKERS", 4))
+# Opt-in JSON responses validated against a schema instead of line parsing. Only the non-streaming
+# functions (used by batch.py and server.py) support it: the stream_* functions used by the app
+# parse replies line by line as they arrive, and always request line-formatted replies
+STRUCTURED_OUTPUT = os.getenv("GENIE_STRUCTURED_OUTPUT", "0") == "1"
 
-# Load environment variables (for API key)
-load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
+# Idea counts above MAX_IDEAS are capped; counts above IDEAS_PER_REQUEST are split into
+# parallel sub-requests (override via environment variables)
+MAX_IDEAS = int(os.getenv("GENIE_MAX_IDEAS", 100))
+IDEAS_PER_REQUEST = int(os.getenv("GENIE_IDEAS_PER_REQUEST", 10))
+IDEA_MAX_WORKERS = int(os.getenv("GENIE_IDEA_MAX_WORKERS", 4))
+# Share of extra ideas requested from split plans to make up for near-duplicates dropped when merging
+IDEA_OVERGENERATION = 0.2
+DEFAULT_NUM_IDEAS = 3
 
-if not API_KEY:
-    raise ValueError("Gemini API key not found in .env. Please set GEMINI_API_KEY.")
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20,
+}
+_COUNT_NOUNS = (
+    r"ideas?|taglines?|slogans?|names?|captions?|headlines?|titles?|options?|variations?|versions?"
+    r"|concepts?|hooks?|lines?|suggestions?|alternatives?|puns?|one-liners?|tweets?|posts?|phrases?"
+)
+# A number followed (within a few words) by what is being counted: "give me 20 witty taglines"
+_COUNT_PATTERN = re.compile(
+    rf"\b(\d+|{'|'.join(_NUMBER_WORDS)})\s+(?:[a-z'-]+\s+){{0,3}}?(?:{_COUNT_NOUNS})\b", re.IGNORECASE
+)
+# Any standalone integer that is not part of an amount, percentage, date, time or hashtag
+_NUMBER_PATTERN = re.compile(r"(?<![\w#$€£.,:/-])(\d+)(?!\w|\s?%|[.,:/-]\d)")
 
-# Configure Gemini API key for the current session
-genai.configure(api_key=API_KEY)
-MODEL_NAME = "gemini-1.5-flash"
+def _as_count(token):
+    """
+    Converts a matched number to an idea count, or None for things like years.
+    """
+    value = _NUMBER_WORDS.get(token.lower()) if not token.isdigit() else int(token)
+    if value is None or value < 1 or (len(token) == 4 and 1900 <= value <= 2100):
+        return None
+    return value
 
 def extract_num_ideas(user_prompt):
     """
-    Returns the first integer found in the user prompt,
-    or defaults to 3 if no number is found.
+    Returns how many ideas the user asked for: preferably a number attached to what is being
+    counted ("20 taglines", "five slogans"), otherwise the first standalone number that is not
+    a year, amount or percentage. Defaults to 3 and is capped at MAX_IDEAS (GENIE_MAX_IDEAS).
     """
-    match = re.search(r"(\d+)", user_prompt)
-    if match:
-        return int(match.group(1))
-    return 3
+    for pattern in (_COUNT_PATTERN, _NUMBER_PATTERN):
+        for match in pattern.finditer(user_prompt):
+            count = _as_count(match.group(1))
+            if count is not None:
+                return min(count, MAX_IDEAS)
+    return DEFAULT_NUM_IDEAS
 
-def generate_creative_ideas(user_prompt, style):
+def plan_idea_requests(num, per_request=IDEAS_PER_REQUEST):
     """
-    Generates creative ideas/slogans based on the user's prompt and desired style.
-    Returns both the list of ideas and a list of variations with additional scoring info for A/B simulation.
+    Splits an idea count into sub-requests of at most per_request ideas, each with its own angle
+    so the batches do not converge on the same ideas. Returns a list of (count, angle) pairs;
+    a count that fits in one request gets a single pair with no angle.
+    """
+    if num <= per_request:
+        return [(num, None)]
+    target = math.ceil(num * (1 + IDEA_OVERGENERATION))
+    requests = math.ceil(target / per_request)
+    base, extra = divmod(target, requests)
+    return [(base + (i < extra), creative_angles[i % len(creative_angles)]) for i in range(requests)]
+
+def _creative_prompts(user_prompt, style, num, structured=False):
+    """
+    Builds the prompt of every sub-request in the plan for num ideas.
+    """
+    template = structured_creative_prompt_template if structured else creative_prompt_template
+    return [
+        template.format(prompt=user_prompt, style=style, num=count)
+        + (creative_angle_instruction.format(angle=angle) if angle else "")
+        for count, angle in plan_idea_requests(num)
+    ]
+
+class _IdeaMerger:
+    """
+    Merges the ideas of one or more sub-requests, dropping near-duplicates and ideas the compliance
+    pre-screen blocks, and stopping at num ideas.
+    """
+
+    def __init__(self, num):
+        self.num = num
+        self.ideas = []
+        self.variations = []
+        self._index = NearDuplicateIndex()
+
+    def add(self, idea, variation):
+        """
+        Returns True if the idea was kept.
+        """
+        if len(self.ideas) >= self.num:
+            return False
+        screened = prescreen(idea)
+        if screened["verdict"] == BLOCK or self._index.add(idea) is not None:
+            return False
+        self.ideas.append(idea)
+        if variation:
+            variation["prescreen"] = screened
+            self.variations.append(variation)
+        return True
+
+    def result(self):
+        # Each sub-request marked its own favourite; only the overall top one stays recommended
+        for variation in self.variations:
+            variation["recommended"] = False
+        _mark_recommended(self.variations)
+        return self.ideas, self.variations
+
+def _poster_id(payload):
+    """
+    Cache key part for an image: copies of a poster that was analyzed before (re-exported, resized
+    or in another format) share its id, so they reuse its cached results. The id is kept on the
+    payload, so one analysis looks its image up only once.
+    """
+    if "poster_id" not in payload:
+        payload["poster_id"] = poster_index.identify(payload)
+    return payload["poster_id"].encode("ascii")
+
+def _generate(contents, model, generation_config=None):
+    """
+    Sends the prompt (and any attached image parts) to the model and returns the stripped response text.
+    The duration of the successful backend call is reported to the routed attempt, if any.
+    """
+    backend = get_backend()
+    elapsed = []
+
+    def call():
+        started = time.perf_counter()
+        response = backend.generate(model, contents, generation_config=generation_config)
+        elapsed.append(time.perf_counter() - started)
+        return response
+
+    response = scheduler.submit(call, estimate_tokens(contents), model=model)
+    note_model_seconds(elapsed[-1])
+    metrics.note_response(model, response)
+    return response.text.strip()
+
+def _generate_stream(contents, model, generation_config=None, timing=None):
+    """
+    Streams the response from the model, yielding text chunks as they arrive. The first chunk is
+    awaited inside the scheduled call, so a failure before anything was yielded is retried like a
+    failed request; an error after that ends the stream (the consumer has seen part of the reply).
+    If given, timing["seconds"] is increased by the time spent in the backend: the call and the
+    waits for each chunk, but not queueing, backoff or the consumer's handling of the chunks.
+    """
+    backend = get_backend()
+    started = time.perf_counter()
+    elapsed = []
+
+    def call():
+        call_started = time.perf_counter()
+        response = iter(backend.generate(model, contents, generation_config=generation_config, stream=True))
+        first = next(response, None)
+        elapsed.append(time.perf_counter() - call_started)
+        return first, response
+
+    chunk, response = scheduler.submit(call, estimate_tokens(contents), model=model)
+    model_seconds = elapsed[-1]
+    try:
+        if chunk is not None:
+            metrics.add_phase("first_chunk", time.perf_counter() - started)
+            yield chunk.text
+            while True:
+                waited = time.perf_counter()
+                try:
+                    chunk = next(response)
+                except StopIteration:
+                    break
+                finally:
+                    model_seconds += time.perf_counter() - waited
+                yield chunk.text
+    finally:
+        if timing is not None:
+            timing["seconds"] += model_seconds
+    # Usage metadata is complete on the final chunk
+    metrics.note_response(model, chunk)
+
+def _stream_routed(task, contents, parse):
+    """
+    Streams a request routed for task, yielding parse(line) for every line it parses (parse returns
+    None for other lines). Streamed items cannot be taken back, so in cascade mode a reply is only
+    escalated when not a single line of it parsed. Attempts are recorded with their model time.
+    """
+    for model, reason in router.plan(task):
+        timing = {"seconds": 0.0}
+        parsed = 0
+        try:
+            for line in _iter_lines(_generate_stream(contents, model, timing=timing)):
+                item = parse(line)
+                if item is not None:
+                    parsed += 1
+                    yield item
+        except Exception as e:
+            router.record(task, model, reason, timing["seconds"], error=str(e) or type(e).__name__)
+            raise
+        router.record(task, model, reason, timing["seconds"], 1.0 if parsed else 0.0)
+        if parsed:
+            return
+
+def _submit(pool, fn, *args):
+    """
+    Submits fn to a thread pool in a copy of the caller's context, so the caller's
+    scheduler priority lane carries over to the worker thread.
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+def _iter_lines(chunks):
+    """
+    Incrementally splits streamed text chunks into lines, yielding each line as soon as it is complete.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split('\n')
+        yield from lines
+    if buffer:
+        yield buffer
+
+def _parse_idea_line(line):
+    """
+    Parses one line of the idea list returned for creative_prompt_template.
+    Returns (idea, variation); variation is None when the line has no scoring info,
+    and both are None when the line is not an idea.
+    """
+    if "." not in line:
+        return None, None
+    parts = line.split(".", 1)
+    idea = parts[1].strip().strip('"')
+    if "(" not in idea:
+        return idea, None
+    caption, meta = idea.rsplit("(", 1)
+    caption = caption.strip().strip('"')
+    score = None
+    why = None
+    if "Engagement:" in meta:
+        score_part = meta.split("Engagement:")[1].split("/")[0].strip()
+        try:
+            score = float(score_part)
+        except:
+            score = None
+    if "Why:" in meta:
+        why = meta.split("Why:")[1].strip().rstrip(")")
+    variation = {
+        "caption": caption,
+        "score": score,
+        "why": why if why else "",
+        "recommended": False,
+    }
+    return caption, variation
+
+def _mark_recommended(variations):
+    """
+    Marks the top-scoring variation as recommended.
     """
-    num = extract_num_ideas(user_prompt)
-    prompt = creative_prompt_template.format(prompt=user_prompt, style=style, num=num)
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(prompt)
-    text = response.text.strip()
-    ideas = []
-    variations = []
-    for line in text.split('\n'):
-        if "." in line:
-            parts = line.split(".", 1)
-            idea = parts[1].strip().strip('"')
-            if "(" in idea:
-                caption, meta = idea.rsplit("(", 1)
-                score = None
-                why = None
-                if "Engagement:" in meta:
-                    score_part = meta.split("Engagement:")[1].split("/")[0].strip()
-                    try:
-                        score = float(score_part)
-                    except:
-                        score = None
-                if "Why:" in meta:
-                    why = meta.split("Why:")[1].strip().rstrip(")")
-                variations.append({
-                    "caption": caption.strip(),
-                    "score": score,
-                    "why": why if why else "",
-                    "recommended": False,
-                })
-                ideas.append(caption.strip())
-            else:
-                ideas.append(idea)
-    # Mark the top-scoring idea as recommended
     if variations:
         top_idx = max(range(len(variations)), key=lambda i: variations[i]['score'] or 0)
         variations[top_idx]['recommended'] = True
-    return ideas, variations
 
-def analyze_caption(image, caption):
+def _parse_idea(line):
     """
-    Analyzes a given caption with an image to provide engagement, brand voice, compliance, and alternate suggestions.
+    Returns the (idea, variation) pair of an idea line, or None for other lines.
     """
-    import io
-    img_bytes = io.BytesIO()
-    image.save(img_bytes, format="PNG")
-    img_bytes = img_bytes.getvalue()
+    idea, variation = _parse_idea_line(line)
+    return None if idea is None else (idea, variation)
 
-    prompt = caption_analysis_template.format(caption=caption)
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(
-        [prompt, {"mime_type": "image/png", "data": img_bytes}]
-    )
-    result = {
+def _parse_idea_pairs(text):
+    """
+    Parses the numbered idea list returned for creative_prompt_template into (idea, variation) pairs.
+    """
+    pairs = []
+    for line in text.split('\n'):
+        idea, variation = _parse_idea_line(line)
+        if idea is not None:
+            pairs.append((idea, variation))
+    return pairs
+
+def _parse_analysis_line(line):
+    """
+    Parses one line of the caption analysis/suggestion formats.
+    Returns a (field, value) pair, or None for lines that carry no result.
+    """
+    lower = line.lower()
+    if lower.startswith("caption:"):
+        return "caption", line.split(":", 1)[1].strip().strip('"')
+    if lower.startswith("engagement score:"):
+        try:
+            return "engagement_score", float(line.split(":")[1].strip().split("/")[0])
+        except:
+            return "engagement_score", None
+    if lower.startswith("brand voice:"):
+        return "brand_voice", line.split(":", 1)[1].strip()
+    if lower.startswith("compliance:"):
+        return "compliance", line.split(":", 1)[1].strip()
+    if lower.startswith("localized caption:"):
+        return "localized_caption", line.split(":", 1)[1].strip().strip('"')
+    if lower.startswith("localization note:"):
+        return "localization_note", line.split(":", 1)[1].strip()
+    if lower.startswith("suggested captions:") or lower.startswith("alternate captions:"):
+        return None
+    if line.strip() and (line.strip()[0] in "123456789"):
+        cap = line.split(".", 1)[1].strip().strip('"')
+        return "caption_variation", {
+            "caption": cap,
+            "score": None,
+            "why": "",
+            "recommended": False,
+        }
+    return None
+
+def _apply_analysis_field(result, field, value):
+    """
+    Applies a parsed (field, value) pair to a result dict, ignoring fields the result does not have
+    and suggested captions the compliance pre-screen blocks. Returns True if the field was applied.
+    """
+    if field == "caption_variation":
+        if not _screen_variation(value):
+            return False
+        result["caption_variations"].append(value)
+    elif field in ("localized_caption", "localization_note") and "localization" in result:
+        result["localization"]["localized_caption" if field == "localized_caption" else "notes"] = value
+    elif field in result:
+        result[field] = value
+        if field == "caption":
+            result["prescreen"] = prescreen(value)
+    else:
+        return False
+    return True
+
+def _screen_variation(variation):
+    """
+    Adds the compliance pre-screen of a suggested caption under "prescreen".
+    Returns False if the caption is blocked and should be dropped.
+    """
+    variation["prescreen"] = prescreen(variation["caption"])
+    return variation["prescreen"]["verdict"] != BLOCK
+
+def _prescreen_structured(result):
+    """
+    Applies the pre-screen that line parsing does in _apply_analysis_field to a structured result.
+    """
+    result["caption_variations"] = [v for v in result["caption_variations"] if _screen_variation(v)]
+    if result.get("caption"):
+        result["prescreen"] = prescreen(result["caption"])
+    return result
+
+def _screened_localization(result, target_language):
+    """
+    Returns a localization with the compliance pre-screen of its text (in the target language).
+    """
+    return dict(result, prescreen=prescreen(result["localized_caption"], target_language))
+
+def _new_analysis_result():
+    return {
         "engagement_score": None,
         "brand_voice": "",
         "compliance": "",
         "caption_variations": [],
     }
-    lines = response.text.strip().split('\n')
-    for line in lines:
-        if line.lower().startswith("engagement score:"):
-            try:
-                result["engagement_score"] = float(line.split(":")[1].strip().split("/")[0])
-            except:
-                result["engagement_score"] = None
-        elif line.lower().startswith("brand voice:"):
-            result["brand_voice"] = line.split(":", 1)[1].strip()
-        elif line.lower().startswith("compliance:"):
-            result["compliance"] = line.split(":", 1)[1].strip()
-        elif line.lower().startswith("suggested captions:"):
-            continue
-        elif line.strip() and (line.strip()[0] in "123456789"):
-            cap = line.split(".", 1)[1].strip().strip('"')
-            result["caption_variations"].append({
-                "caption": cap,
-                "score": None,
-                "why": "",
-                "recommended": False,
-            })
-    return result
 
-def suggest_captions_from_image(image):
-    """
-    Suggests captions for a given image, returning details including score and compliance notes.
-    """
-    import io
-    img_bytes = io.BytesIO()
-    image.save(img_bytes, format="PNG")
-    img_bytes = img_bytes.getvalue()
-    prompt = image_caption_suggestion_template
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(
-        [prompt, {"mime_type": "image/png", "data": img_bytes}]
-    )
-    lines = response.text.strip().split('\n')
-    result = {
+def _new_suggestion_result():
+    return {
         "caption": "",
         "engagement_score": None,
         "brand_voice": "",
         "compliance": "",
         "caption_variations": [],
     }
-    for line in lines:
-        if line.lower().startswith("caption:"):
-            result["caption"] = line.split(":", 1)[1].strip().strip('"')
-        elif line.lower().startswith("engagement score:"):
-            try:
-                result["engagement_score"] = float(line.split(":")[1].strip().split("/")[0])
-            except:
-                result["engagement_score"] = None
-        elif line.lower().startswith("brand voice:"):
-            result["brand_voice"] = line.split(":", 1)[1].strip()
-        elif line.lower().startswith("compliance:"):
-            result["compliance"] = line.split(":", 1)[1].strip()
-        elif line.lower().startswith("alternate captions:"):
-            continue
-        elif line.strip() and (line.strip()[0] in "123456789"):
-            cap = line.split(".", 1)[1].strip().strip('"')
-            result["caption_variations"].append({
-                "caption": cap,
-                "score": None,
-                "why": "",
-                "recommended": False,
-            })
+
+def _analysis_confidence(result):
+    """
+    Share of the expected analysis fields a reply filled in, for routing.ModelRouter.run.
+    """
+    filled = [
+        result["engagement_score"] is not None,
+        bool(result["brand_voice"]),
+        bool(result["compliance"]),
+        bool(result["caption_variations"]),
+    ]
+    if "caption" in result:
+        filled.append(bool(result["caption"]))
+    return sum(filled) / len(filled)
+
+def _idea_confidence(pairs):
+    """
+    Share of the ideas in a creative reply that came with their engagement score, or 0 for no ideas.
+    """
+    if not pairs:
+        return 0.0
+    return sum(variation is not None and variation["score"] is not None for _, variation in pairs) / len(pairs)
+
+def _parse_caption_analysis(text):
+    """
+    Parses the response format of caption_analysis_template.
+    """
+    result = _new_analysis_result()
+    for line in text.split('\n'):
+        parsed = _parse_analysis_line(line)
+        if parsed:
+            _apply_analysis_field(result, *parsed)
     return result
 
-def localize_caption(caption, target_language):
+def _parse_caption_suggestions(text):
     """
-    Localizes the given caption to the specified language.
+    Parses the response format of image_caption_suggestion_template.
     """
-    prompt = localization_template.format(
-        caption=caption,
-        target_language=target_language,
-    )
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(prompt)
-    lines = response.text.strip().split('\n')
+    result = _new_suggestion_result()
+    for line in text.split('\n'):
+        parsed = _parse_analysis_line(line)
+        if parsed:
+            _apply_analysis_field(result, *parsed)
+    return result
+
+def _parse_localization(text):
+    """
+    Parses the response format of localization_template.
+    """
+    lines = text.split('\n')
     localized_caption = ""
     notes = ""
     for line in lines:
@@ -183,3 +481,587 @@ def localize_caption(caption, target_language):
         "localized_caption": localized_caption,
         "notes": notes,
     }
+
+def _generate_structured(prompt, schema, model, image_parts=()):
+    """
+    Requests a schema-constrained JSON response and validates it in a single parse.
+    Fields that fail validation are re-requested once, on their own, and merged back in.
+    """
+    text = _generate([prompt, *image_parts], model, generation_config=response_config(schema))
+    with metrics.phase("parse"):
+        data, failed = parse_structured(text, schema)
+    if failed:
+        repair_prompt = structured_repair_template.format(fields=", ".join(failed), previous=text)
+        repair_text = _generate(
+            [repair_prompt, *image_parts],
+            model,
+            generation_config=response_config(repair_schema(schema, failed)),
+        )
+        data, _ = apply_repair(data, repair_text, schema, failed)
+    return data
+
+def _load_json_object(text):
+    """
+    Loads a JSON object reply, tolerating a surrounding ``` fence. Returns {} for anything else.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def _parse_multi_localization(text, languages):
+    """
+    Parses the JSON object returned for multi_localization_template.
+    Returns results only for the requested languages that came back with a translation.
+    """
+    data = _load_json_object(text)
+    by_name = {str(k).strip().lower(): v for k, v in data.items()}
+    results = {}
+    for lang in languages:
+        entry = by_name.get(lang.lower())
+        if isinstance(entry, dict) and str(entry.get("localized_caption") or "").strip():
+            results[lang] = {
+                "localized_caption": str(entry["localized_caption"]).strip().strip('"'),
+                "notes": str(entry.get("note") or "").strip(),
+            }
+    return results
+
+def _parse_caption_scores(text, captions):
+    """
+    Parses the JSON object returned for caption_scoring_template.
+    Returns caption -> {"score", "why"} for the captions that came back with a valid 1-10 score.
+    """
+    data = _load_json_object(text)
+    results = {}
+    for number, caption in enumerate(captions, 1):
+        entry = data.get(str(number))
+        if not isinstance(entry, dict):
+            continue
+        try:
+            score = float(entry.get("score"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= score <= 10:
+            results[caption] = {"score": round(score, 1), "why": str(entry.get("why") or "").strip()}
+    return results
+
+def _creative_chunk(prompt, structured):
+    """
+    Runs one creative sub-request and returns its (idea, variation) pairs.
+    """
+    def attempt(model):
+        if structured:
+            data = _generate_structured(prompt, CREATIVE_SCHEMA, model)
+            ideas, variations = CreativeIdeas.from_data(data).to_result()
+            return list(zip(ideas, variations))
+        text = _generate(prompt, model)
+        with metrics.phase("parse"):
+            return _parse_idea_pairs(text)
+
+    return router.run(CREATIVE, attempt, _idea_confidence)
+
+def _gather_idea_pairs(prompts, structured):
+    """
+    Runs the creative sub-requests concurrently and returns all their (idea, variation) pairs
+    in plan order. A failed sub-request is skipped unless every one of them failed.
+    """
+    if len(prompts) == 1:
+        return _creative_chunk(prompts[0], structured)
+    pairs = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(IDEA_MAX_WORKERS, len(prompts)))) as pool:
+        futures = [_submit(pool, _creative_chunk, prompt, structured) for prompt in prompts]
+        for future in futures:
+            try:
+                pairs.extend(future.result())
+            except Exception as e:
+                errors.append(e)
+    if errors and not pairs:
+        raise errors[0]
+    return pairs
+
+def _stream_idea_pairs(prompts):
+    """
+    Streams (idea, variation) pairs as their lines complete. Several prompts are streamed
+    concurrently and their ideas are interleaved in arrival order. A failed sub-request is
+    skipped unless no ideas arrived at all.
+    """
+    if len(prompts) == 1:
+        yield from _stream_routed(CREATIVE, prompts[0], _parse_idea)
+        return
+    arrivals = queue.Queue()
+
+    def stream_one(prompt):
+        try:
+            for pair in _stream_routed(CREATIVE, prompt, _parse_idea):
+                arrivals.put(pair)
+        finally:
+            arrivals.put(None)
+
+    received = False
+    with ThreadPoolExecutor(max_workers=max(1, min(IDEA_MAX_WORKERS, len(prompts)))) as pool:
+        futures = [_submit(pool, stream_one, prompt) for prompt in prompts]
+        finished = 0
+        while finished < len(futures):
+            item = arrivals.get()
+            if item is None:
+                finished += 1
+            else:
+                received = True
+                yield item
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors and not received:
+        raise errors[0]
+
+@metrics.instrumented("generate_creative_ideas")
+def generate_creative_ideas(user_prompt, style, structured=None):
+    """
+    Generates creative ideas/slogans based on the user's prompt and desired style.
+    Returns both the list of ideas and a list of variations with additional scoring info for A/B simulation.
+    Large idea counts are split into parallel sub-requests (see plan_idea_requests) and merged
+    without near-duplicates.
+    With structured=True (default: GENIE_STRUCTURED_OUTPUT) the reply is schema-constrained JSON.
+    """
+    structured = STRUCTURED_OUTPUT if structured is None else structured
+    num = extract_num_ideas(user_prompt)
+    prompts = _creative_prompts(user_prompt, style, num, structured)
+    key = make_cache_key(router.cache_tag(CREATIVE), "\n".join(prompts), namespace="creative")
+    cached = response_cache.get(key)
+    if cached is not None:
+        metrics.note_cache_hit()
+        return cached["ideas"], cached["variations"]
+    merger = _IdeaMerger(num)
+    pairs = _gather_idea_pairs(prompts, structured)
+    with metrics.phase("parse"):
+        for idea, variation in pairs:
+            merger.add(idea, variation)
+        ideas, variations = merger.result()
+    if ideas:
+        response_cache.set(key, {"ideas": ideas, "variations": variations})
+    return ideas, variations
+
+@metrics.instrumented("analyze_caption")
+def analyze_caption(image, caption, structured=None):
+    """
+    Analyzes a given caption with an image to provide engagement, brand voice, compliance, and alternate suggestions.
+    The image may be a PIL image, raw upload bytes or a payload from image_utils.prepare_image.
+    With structured=True (default: GENIE_STRUCTURED_OUTPUT) the reply is schema-constrained JSON.
+    """
+    structured = STRUCTURED_OUTPUT if structured is None else structured
+    with metrics.phase("encode"):
+        payload = prepare_image(image)
+    template = structured_caption_analysis_template if structured else caption_analysis_template
+    prompt = template.format(caption=caption)
+    key = make_cache_key(router.cache_tag(ANALYSIS), prompt, _poster_id(payload), namespace="analysis")
+    cached = response_cache.get(key)
+    if cached is not None:
+        metrics.note_cache_hit()
+        return cached
+
+    def attempt(model):
+        if structured:
+            data = _generate_structured(prompt, ANALYSIS_SCHEMA, model, [image_part(payload)])
+            return _prescreen_structured(CaptionAnalysis.from_data(data).to_dict())
+        text = _generate([prompt, image_part(payload)], model)
+        with metrics.phase("parse"):
+            return _parse_caption_analysis(text)
+
+    result = router.run(ANALYSIS, attempt, _analysis_confidence)
+    result["prescreen"] = prescreen(caption)
+    if result["compliance"] or result["caption_variations"]:
+        response_cache.set(key, result)
+    return result
+
+@metrics.instrumented("suggest_captions_from_image")
+def suggest_captions_from_image(image, structured=None):
+    """
+    Suggests captions for a given image, returning details including score and compliance notes.
+    The image may be a PIL image, raw upload bytes or a payload from image_utils.prepare_image.
+    With structured=True (default: GENIE_STRUCTURED_OUTPUT) the reply is schema-constrained JSON.
+    """
+    structured = STRUCTURED_OUTPUT if structured is None else structured
+    with metrics.phase("encode"):
+        payload = prepare_image(image)
+    prompt = structured_image_caption_suggestion_template if structured else image_caption_suggestion_template
+    key = make_cache_key(router.cache_tag(SUGGESTION), prompt, _poster_id(payload), namespace="suggestion")
+    cached = response_cache.get(key)
+    if cached is not None:
+        metrics.note_cache_hit()
+        return cached
+
+    def attempt(model):
+        if structured:
+            data = _generate_structured(prompt, SUGGESTION_SCHEMA, model, [image_part(payload)])
+            return _prescreen_structured(CaptionSuggestion.from_data(data).to_dict())
+        text = _generate([prompt, image_part(payload)], model)
+        with metrics.phase("parse"):
+            return _parse_caption_suggestions(text)
+
+    result = router.run(SUGGESTION, attempt, _analysis_confidence)
+    if result["caption"]:
+        response_cache.set(key, result)
+    return result
+
+@metrics.instrumented("stream_creative_ideas")
+def stream_creative_ideas(user_prompt, style):
+    """
+    Streaming variant of generate_creative_ideas.
+    Yields ("variation", variation) for each scored idea, or ("idea", idea) for an unscored one,
+    as soon as its line is complete, then ("result", (ideas, variations)) once the response ends.
+    Split plans stream all sub-requests at once; near-duplicates are dropped as they arrive.
+    """
+    num = extract_num_ideas(user_prompt)
+    prompts = _creative_prompts(user_prompt, style, num)
+    key = make_cache_key(router.cache_tag(CREATIVE), "\n".join(prompts), namespace="creative")
+    cached = response_cache.get(key)
+    if cached is not None:
+        metrics.note_cache_hit()
+        for variation in cached["variations"]:
+            yield "variation", variation
+        yield "result", (cached["ideas"], cached["variations"])
+        return
+    merger = _IdeaMerger(num)
+    for idea, variation in _stream_idea_pairs(prompts):
+        if merger.add(idea, variation):
+            if variation:
+                yield "variation", variation
+            else:
+                yield "idea", idea
+    ideas, variations = merger.result()
+    if ideas:
+        response_cache.set(key, {"ideas": ideas, "variations": variations})
+    yield "result", (ideas, variations)
+
+def _with_localization(prompt, result, subject, target_language):
+    """
+    Extends an image-analysis prompt and its result so the same request also localizes the best caption.
+    """
+    if not target_language:
+        return prompt
+    result["localization"] = {"localized_caption": "", "notes": ""}
+    return prompt + fused_localization_instruction.format(subject=subject, target_language=target_language)
+
+def _remember_localization(result, source, target_language):
+    """
+    Stores the localization of source from a fused analysis where localize_caption will find it.
+    """
+    localization = result.get("localization")
+    if localization and localization["localized_caption"] and source:
+        response_cache.set(_localization_cache_key(source, target_language), localization)
+        translation_memory.add(source, target_language, localization["localized_caption"], localization["notes"])
+
+def _fused_source_allowed(source):
+    """
+    Whether the fused localization of source may be kept: the caption is known and not blocked.
+    """
+    return bool(source) and prescreen(source)["verdict"] != BLOCK
+
+def _stream_image_analysis(prompt, payload, task, result, target_language=None):
+    """
+    Streams an image analysis, filling in result and yielding each (field, value) pair as its line completes.
+    Ends with ("result", result). The task (ANALYSIS or SUGGESTION) is also the cache namespace.
+    """
+    key = make_cache_key(router.cache_tag(task), prompt, _poster_id(payload), namespace=task)
+    cached = response_cache.get(key)
+    if cached is not None:
+        metrics.note_cache_hit()
+        for field, value in cached.items():
+            if field == "caption_variations":
+                for variation in value:
+                    yield "caption_variation", variation
+            elif field == "localization":
+                yield "localized_caption", value["localized_caption"]
+                yield "localization_note", value["notes"]
+            else:
+                yield field, value
+        yield "result", cached
+        return
+    if "prescreen" in result:
+        yield "prescreen", result["prescreen"]
+    # The caption the model localized: the Caption line of a suggestion, otherwise the model's
+    # first suggested caption, recorded before the pre-screen may drop it
+    fused = {"source": None}
+
+    def parse(line):
+        parsed = _parse_analysis_line(line)
+        if not parsed:
+            return None
+        field, value = parsed
+        if field == "caption_variation" and fused["source"] is None and "caption" not in result:
+            fused["source"] = value["caption"]
+        elif field == "caption":
+            fused["source"] = value
+        elif field in ("localized_caption", "localization_note") and not _fused_source_allowed(fused["source"]):
+            # A translation of a blocked (or not yet seen) caption must not be shown or reused
+            return None
+        return parsed if _apply_analysis_field(result, field, value) else None
+
+    received = False
+    for parsed in _stream_routed(task, [prompt, image_part(payload)], parse):
+        received = True
+        yield parsed
+        if parsed[0] == "caption":
+            yield "prescreen", result["prescreen"]
+    if target_language:
+        if result["localization"]["localized_caption"] and _fused_source_allowed(fused["source"]):
+            result["localization"] = _screened_localization(result["localization"], target_language)
+        else:
+            result["localization"] = {"localized_caption": "", "notes": ""}
+    if received:
+        response_cache.set(key, result)
+        if target_language:
+            _remember_localization(result, fused["source"], target_language)
+    yield "result", result
+
+@metrics.instrumented("stream_caption_analysis")
+def stream_caption_analysis(image, caption, target_language=None):
+    """
+    Streaming variant of analyze_caption. Yields ("prescreen", findings) for the caption straight away,
+    ("engagement_score" | "brand_voice" | "compliance", value) and ("caption_variation", variation)
+    as each line arrives, then ("result", result).
+    With a target_language, the same request also localizes the first suggested caption: the
+    stream then yields ("localized_caption", text) and ("localization_note", note), and the
+    result carries them as result["localization"] in localize_caption's format. If the pre-screen
+    blocks the caption the model localized, its translation is dropped (left empty).
+    """
+    with metrics.phase("encode"):
+        payload = prepare_image(image)
+    result = _new_analysis_result()
+    result["prescreen"] = prescreen(caption)
+    prompt = _with_localization(
+        caption_analysis_template.format(caption=caption), result, "the first suggested caption", target_language
+    )
+    yield from _stream_image_analysis(prompt, payload, ANALYSIS, result, target_language)
+
+@metrics.instrumented("stream_caption_suggestions")
+def stream_caption_suggestions(image, target_language=None):
+    """
+    Streaming variant of suggest_captions_from_image. Yields the same events as
+    stream_caption_analysis plus ("caption", caption), with the pre-screen of the suggested
+    caption right after it, then ("result", result).
+    With a target_language, the suggested caption is localized in the same request
+    (see stream_caption_analysis).
+    """
+    with metrics.phase("encode"):
+        payload = prepare_image(image)
+    result = _new_suggestion_result()
+    prompt = _with_localization(
+        image_caption_suggestion_template, result, "your best caption (the Caption line)", target_language
+    )
+    yield from _stream_image_analysis(prompt, payload, SUGGESTION, result, target_language)
+
+def _localization_cache_key(caption, target_language):
+    """
+    Cache key localize_caption uses, so batched results also serve single-language lookups.
+    """
+    prompt = localization_template.format(caption=caption, target_language=target_language)
+    return make_cache_key(router.cache_tag(LOCALIZATION), prompt, namespace="localization")
+
+@metrics.instrumented("localize_caption")
+def localize_caption(caption, target_language):
+    """
+    Localizes the given caption to the specified language.
+    Captions already in the translation memory are answered from it without a request; close
+    matches from the memory are passed to the model as hints. New translations are added to it.
+    The result carries the compliance pre-screen of the localized text under "prescreen".
+    """
+    prompt = localization_template.format(
+        caption=caption,
+        target_language=target_language,
+    )
+    key = make_cache_key(router.cache_tag(LOCALIZATION), prompt, namespace="localization")
+    cached = response_cache.get(key)
+    if cached is not None:
+        metrics.note_cache_hit()
+        return _screened_localization(cached, target_language)
+    remembered = translation_memory.lookup(caption, target_language)
+    if remembered is not None:
+        metrics.note_cache_hit()
+        return _screened_localization(remembered, target_language)
+    hints = translation_memory.fuzzy(caption, target_language)
+    if hints:
+        prompt += localization_hints_template.format(
+            target_language=target_language,
+            hints="\n".join(f'- "{hint["source"]}" -> "{hint["localized_caption"]}"' for hint in hints),
+        )
+
+    def attempt(model):
+        text = _generate(prompt, model)
+        with metrics.phase("parse"):
+            return _parse_localization(text)
+
+    result = router.run(LOCALIZATION, attempt, lambda reply: 1.0 if reply["localized_caption"] else 0.0)
+    if result["localized_caption"]:
+        response_cache.set(key, result)
+        translation_memory.add(caption, target_language, result["localized_caption"], result["notes"])
+    return _screened_localization(result, target_language)
+
+@metrics.instrumented("localize_caption_many")
+def localize_caption_many(caption, languages, max_workers=LOCALIZATION_MAX_WORKERS):
+    """
+    Localizes the caption into several languages concurrently, at most max_workers calls at a time.
+    Yields (language, result) pairs as each translation finishes. A failed language yields a
+    result with an "error" message instead of stopping the others.
+    """
+    languages = list(dict.fromkeys(languages))
+    if not languages:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(languages)))) as pool:
+        futures = {_submit(pool, localize_caption, caption, lang): lang for lang in languages}
+        for future in as_completed(futures):
+            lang = futures[future]
+            try:
+                yield lang, future.result()
+            except Exception as e:
+                yield lang, {"localized_caption": "", "notes": "", "error": str(e)}
+
+def _localize_chunk(caption, languages):
+    """
+    Requests one chunk of languages in a single JSON-mode call.
+    """
+    prompt = multi_localization_template.format(
+        caption=caption,
+        target_languages=", ".join(languages),
+    )
+
+    def attempt(model):
+        text = _generate(prompt, model, generation_config={"response_mime_type": "application/json"})
+        return _parse_multi_localization(text, languages)
+
+    return router.run(LOCALIZATION, attempt, lambda reply: len(reply) / len(languages))
+
+@metrics.instrumented("localize_caption_batch")
+def localize_caption_batch(caption, languages, chunk_size=LOCALIZATION_BATCH_SIZE, max_retries=1):
+    """
+    Localizes the caption into several languages using one request per chunk of chunk_size languages.
+    Languages already in the response cache or translation memory are not requested. Languages
+    missing from a reply, or from a chunk whose request failed, are requested again (up to
+    max_retries rounds); any still missing after that fall back to localize_caption_many.
+    Returns a dict of language -> result, where a language that could not be localized has a
+    result with an "error" message, as in localize_caption_many.
+    """
+    languages = list(dict.fromkeys(languages))
+    results = {}
+    pending = []
+    for lang in languages:
+        cached = response_cache.get(_localization_cache_key(caption, lang))
+        if cached is None:
+            cached = translation_memory.lookup(caption, lang)
+        if cached is not None:
+            results[lang] = cached
+        else:
+            pending.append(lang)
+
+    chunk_size = max(1, chunk_size)
+    for _ in range(1 + max_retries):
+        if not pending:
+            break
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+        with ThreadPoolExecutor(max_workers=max(1, min(LOCALIZATION_MAX_WORKERS, len(chunks)))) as pool:
+            futures = [_submit(pool, _localize_chunk, caption, chunk) for chunk in chunks]
+            for future in futures:
+                try:
+                    chunk_results = future.result()
+                except Exception:
+                    # The chunk's languages stay pending and are retried
+                    continue
+                for lang, result in chunk_results.items():
+                    response_cache.set(_localization_cache_key(caption, lang), result)
+                    translation_memory.add(caption, lang, result["localized_caption"], result["notes"])
+                    results[lang] = result
+        pending = [lang for lang in pending if lang not in results]
+
+    if pending:
+        results.update(localize_caption_many(caption, pending))
+    return {
+        lang: results[lang] if "prescreen" in results[lang] else _screened_localization(results[lang], lang)
+        for lang in languages
+    }
+
+def _score_chunk(captions, image_parts):
+    """
+    Scores one chunk of captions in a single JSON-mode call.
+    """
+    prompt = caption_scoring_template.format(
+        context=caption_scoring_poster_context if image_parts else "",
+        captions="\n".join(f'{number}. "{caption}"' for number, caption in enumerate(captions, 1)),
+    )
+
+    def attempt(model):
+        text = _generate([prompt, *image_parts], model, generation_config={"response_mime_type": "application/json"})
+        with metrics.phase("parse"):
+            return _parse_caption_scores(text, captions)
+
+    return router.run(SCORING, attempt, lambda reply: len(reply) / len(captions))
+
+@metrics.instrumented("score_captions")
+def score_captions(captions, image=None, chunk_size=SCORING_BATCH_SIZE, max_retries=1):
+    """
+    Scores the engagement (1-10) of a list of captions, optionally as captions for the given poster.
+    All captions go out in one request per chunk of chunk_size, with the chunks sent concurrently;
+    captions missing from a reply or from a failed chunk are re-requested up to max_retries times.
+    Returns one {"score", "why"} dict per caption, in order (score None if it could not be scored).
+    Raises the first chunk error only if no caption could be scored at all.
+    """
+    unique = list(dict.fromkeys(caption for caption in captions if caption))
+    image_parts = []
+    image_data = None
+    if image is not None:
+        with metrics.phase("encode"):
+            payload = prepare_image(image)
+        image_parts = [image_part(payload)]
+        image_data = _poster_id(payload)
+    keys = {caption: make_cache_key(router.cache_tag(SCORING), caption, image_data, namespace="caption_score") for caption in unique}
+
+    scores = {}
+    pending = []
+    for caption in unique:
+        cached = response_cache.get(keys[caption])
+        if cached is not None:
+            scores[caption] = cached
+        else:
+            pending.append(caption)
+    if unique and not pending:
+        metrics.note_cache_hit()
+
+    chunk_size = max(1, chunk_size)
+    errors = []
+    for _ in range(1 + max_retries):
+        if not pending:
+            break
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+        with ThreadPoolExecutor(max_workers=max(1, min(SCORING_MAX_WORKERS, len(chunks)))) as pool:
+            futures = [_submit(pool, _score_chunk, chunk, image_parts) for chunk in chunks]
+            for future in futures:
+                try:
+                    chunk_scores = future.result()
+                except Exception as e:
+                    # The chunk's captions stay pending and are retried
+                    errors.append(e)
+                    continue
+                for caption, scored in chunk_scores.items():
+                    response_cache.set(keys[caption], scored)
+                    scores[caption] = scored
+        pending = [caption for caption in pending if caption not in scores]
+
+    if errors and not scores:
+        raise errors[0]
+    return [scores.get(caption, {"score": None, "why": ""}) for caption in captions]
+
+def score_variations(variations, image=None):
+    """
+    Fills in the score (and a missing reason) of every unscored caption variation with a single
+    score_captions call, so the A/B simulation ranks them on model scores. Returns variations.
+    """
+    unscored = [v for v in variations if v.get("score") is None]
+    if unscored:
+        for variation, scored in zip(unscored, score_captions([v["caption"] for v in unscored], image)):
+            variation["score"] = scored["score"]
+            if scored["why"] and not variation.get("why"):
+                variation["why"] = scored["why"]
+    return variations
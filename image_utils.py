@@ -0,0 +1,234 @@
+# --------- image_utils.py ---------
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+# Preprocessing settings (override via environment variables)
+IMAGE_MAX_EDGE = int(os.getenv("GENIE_IMAGE_MAX_EDGE", 1536))
+IMAGE_FORMAT = os.getenv("GENIE_IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("GENIE_IMAGE_QUALITY", 85))
+ENCODED_CACHE_MAX_BYTES = int(os.getenv("GENIE_IMAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Largest raster decoded from an upload, checked from the file header before any pixels are decoded
+IMAGE_MAX_PIXELS = int(os.getenv("GENIE_IMAGE_MAX_PIXELS", 64_000_000))
+# Uploads decoded at the same time; each holds a full-resolution raster until it is encoded
+IMAGE_DECODE_CONCURRENCY = int(os.getenv("GENIE_IMAGE_DECODE_CONCURRENCY", 2))
+PREVIEW_MAX_EDGE = 1024
+# In-memory images are hashed a strip of rows at a time, copying at most this much of the raster
+HASH_STRIP_BYTES = 1024 * 1024
+
+# Perceptual signature: a 64-bit pHash (the low 8x8 DCT frequencies of a 32x32 grayscale copy)
+# and a THUMBNAIL_EDGE-square grayscale thumbnail for confirming near-duplicates
+PHASH_SIZE = 8
+PHASH_SAMPLE = 32
+THUMBNAIL_EDGE = 64
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+_dct_matrix = None
+_encoded_cache = OrderedDict()
+_encoded_cache_bytes = 0
+_cache_lock = threading.Lock()
+_decode_slots = threading.BoundedSemaphore(IMAGE_DECODE_CONCURRENCY)
+
+image_stats = {"images": 0, "cache_hits": 0, "source_bytes": 0, "sent_bytes": 0}
+
+class ImageTooLarge(ValueError):
+    """
+    Raised for uploads with more pixels than IMAGE_MAX_PIXELS.
+    """
+
+def _content_hash(source, max_edge, fmt, quality):
+    """
+    Hashes the image content together with the encoding settings, so a change of
+    settings never returns stale bytes. Uploads are keyed on their encoded bytes.
+    """
+    digest = hashlib.sha256(f"{max_edge}:{fmt}:{quality}:".encode("utf-8"))
+    if not isinstance(source, bytes):
+        width, height = source.size
+        digest.update(f"{source.mode}:{source.size}:".encode("utf-8"))
+        rows = max(1, HASH_STRIP_BYTES // max(1, width * len(source.getbands())))
+        for top in range(0, height, rows):
+            digest.update(source.crop((0, top, width, min(height, top + rows))).tobytes())
+    else:
+        digest.update(source)
+    return digest.hexdigest()
+
+def _read_source(source):
+    """
+    Normalizes the supported inputs to either raw encoded bytes or a PIL image.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "getbands"):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return source.read()
+
+def phash(image):
+    """
+    64-bit perceptual hash of a PIL image: bit i is set when the i-th of the lowest 8x8 DCT
+    coefficients of its 32x32 grayscale copy is above their median. Resizing, re-encoding and
+    small colour shifts change only a few bits.
+    """
+    global _dct_matrix
+    import numpy as np
+    from PIL import Image
+
+    if _dct_matrix is None:
+        k = np.arange(PHASH_SAMPLE)[:, None]
+        n = np.arange(PHASH_SAMPLE)[None, :]
+        _dct_matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * PHASH_SAMPLE))
+    pixels = np.asarray(image.convert("L").resize((PHASH_SAMPLE, PHASH_SAMPLE), Image.LANCZOS), dtype=np.float64)
+    low = (_dct_matrix @ pixels @ _dct_matrix.T)[:PHASH_SIZE, :PHASH_SIZE].ravel()
+    # The DC term only encodes overall brightness, so it is left out of the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def perceptual_signature(image):
+    """
+    Returns (phash, thumbnail) for a PIL image: its pHash and its THUMBNAIL_EDGE-square grayscale
+    thumbnail as raw 8-bit pixels. The pHash is taken from the thumbnail, which is much cheaper
+    than resampling the full image twice.
+    """
+    from PIL import Image
+
+    thumbnail = image.convert("L").resize((THUMBNAIL_EDGE, THUMBNAIL_EDGE), Image.BOX)
+    return phash(thumbnail), thumbnail.tobytes()
+
+def _encode(image, max_edge, fmt, quality, owned):
+    """
+    Downscales the image to max_edge and encodes it in the configured format.
+    Images passed in by the caller (owned=False) are never modified in place.
+    Returns the encoded bytes, the encoded size and the perceptual signature (phash, thumbnail).
+    """
+    from PIL import Image
+
+    if max(image.size) > max_edge:
+        if not owned:
+            image = image.copy()
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if fmt == "JPEG":
+        if has_alpha:
+            rgba = image.convert("RGBA")
+            flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            image = flattened
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    out = io.BytesIO()
+    if fmt == "PNG":
+        image.save(out, format=fmt, optimize=True)
+    else:
+        image.save(out, format=fmt, quality=quality)
+    return out.getvalue(), image.size, perceptual_signature(image)
+
+def prepare_image(source, max_edge=IMAGE_MAX_EDGE, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """
+    Decodes, downsizes and compactly encodes an image for upload to Gemini.
+    Accepts raw file bytes, a path, a file-like object (e.g. a Streamlit upload) or a PIL image.
+    Already-prepared payloads are returned unchanged.
+
+    Returns a dict with the encoded "data", its "mime_type", the encoded "size",
+    "source_bytes"/"sent_bytes" to show the upload savings, and the perceptual "phash" and
+    "thumbnail" used to recognize the same poster in other files. For PIL inputs the
+    source size is the decoded raster size, since the original file is not known.
+    Encoded bytes are cached by content hash so repeat analyses reuse them.
+
+    Files are checked against IMAGE_MAX_PIXELS before decoding (raising ImageTooLarge), at most
+    IMAGE_DECODE_CONCURRENCY of them are decoded at once, and the full-resolution raster is
+    released as soon as the payload is encoded.
+    """
+    global _encoded_cache_bytes
+    if isinstance(source, dict) and "data" in source:
+        return source
+    fmt = fmt.upper()
+    raw = _read_source(source)
+    key = _content_hash(raw, max_edge, fmt, quality)
+    with _cache_lock:
+        cached = _encoded_cache.get(key)
+        if cached is not None:
+            _encoded_cache.move_to_end(key)
+            image_stats["cache_hits"] += 1
+            return dict(cached)
+
+    if not isinstance(raw, bytes):
+        image = raw
+        source_bytes = len(image.getbands()) * image.size[0] * image.size[1]
+    else:
+        # Pillow is only imported once an image actually needs decoding
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(raw))
+        source_bytes = len(raw)
+        width, height = image.size
+        if image.format == "JPEG":
+            # Let the JPEG decoder skip straight to a reduced scale before decoding
+            image.draft("RGB", (max_edge, max_edge))
+        # Only the raster that will actually be decoded counts against the limit
+        if image.size[0] * image.size[1] > IMAGE_MAX_PIXELS:
+            image.close()
+            raise ImageTooLarge(
+                f"Image is {width}×{height} pixels; at most {IMAGE_MAX_PIXELS / 1_000_000:g} megapixels "
+                f"can be decoded (GENIE_IMAGE_MAX_PIXELS)."
+            )
+    if image is raw:
+        data, size, (image_phash, thumbnail) = _encode(image, max_edge, fmt, quality, owned=False)
+    else:
+        with _decode_slots:
+            try:
+                data, size, (image_phash, thumbnail) = _encode(image, max_edge, fmt, quality, owned=True)
+            finally:
+                image.close()
+    payload = {
+        "data": data,
+        "mime_type": MIME_TYPES[fmt],
+        "size": size,
+        "source_bytes": source_bytes,
+        "sent_bytes": len(data),
+        "phash": image_phash,
+        "thumbnail": thumbnail,
+    }
+    with _cache_lock:
+        image_stats["images"] += 1
+        image_stats["source_bytes"] += source_bytes
+        image_stats["sent_bytes"] += len(data)
+        if key not in _encoded_cache:
+            _encoded_cache[key] = payload
+            _encoded_cache_bytes += len(data)
+        while _encoded_cache_bytes > ENCODED_CACHE_MAX_BYTES and _encoded_cache:
+            _, evicted = _encoded_cache.popitem(last=False)
+            _encoded_cache_bytes -= evicted["sent_bytes"]
+    return dict(payload)
+
+def preview_image(payload, max_edge=PREVIEW_MAX_EDGE):
+    """
+    Small JPEG (PNG for images with transparency) of a prepared image for showing in the page,
+    so the browser and Streamlit never handle the full-resolution upload.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(payload["data"])) as image:
+        if image.format == "JPEG":
+            image.draft("RGB", (max_edge, max_edge))
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        out = io.BytesIO()
+        if image.mode == "RGB":
+            image.save(out, format="JPEG", quality=IMAGE_QUALITY)
+        else:
+            image.save(out, format="PNG")
+    return out.getvalue()
+
+def image_part(payload):
+    """
+    Builds the inline image part expected by generate_content.
+    """
+    return {"mime_type": payload["mime_type"], "data": payload["data"]}
@@ -0,0 +1,132 @@
+# --------- loadtest.py ---------
+"""
+Load test for the shared Genie service (server.py).
+
+Usage:
+    python loadtest.py                                   # in-process service on the mock backend
+    python loadtest.py --url http://127.0.0.1:8765 --concurrency 1 8 32
+
+Each concurrency level sends --requests requests from that many concurrent clients, a mix of
+creative and localization calls. --duplicate-share of them repeat a handful of popular requests,
+which the service coalesces while they are in flight. Reports throughput, p50/p95/p99 latency of
+successful requests, 429 rejections, coalesced responses and errors per level.
+"""
+import os
+
+# The in-process service never touches the real API, the caches or the quota limits
+os.environ["GENIE_BACKEND"] = "mock"
+os.environ["GENIE_CACHE"] = "0"
+os.environ["GENIE_TM"] = "0"
+os.environ["GENIE_POSTER_INDEX"] = "0"
+os.environ.setdefault("GENIE_RPM", "1000000000")
+os.environ.setdefault("GENIE_TPM", "1000000000000")
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import percentile
+
+POPULAR_REQUESTS = 4
+
+def _request(level, i, duplicate_share, rng):
+    """
+    Returns (path, body) for request i of a level: a popular request or a unique one.
+    """
+    if rng.random() < duplicate_share:
+        n = rng.randrange(POPULAR_REQUESTS)
+        tag = f"popular {level}-{n}"
+    else:
+        n = i
+        tag = f"unique {level}-{i}"
+    if n % 2:
+        return "/v1/localize", {"caption": f"Big wins tonight ({tag})", "language": "Spanish"}
+    return "/v1/creative", {"prompt": f"Give me 3 taglines for game night ({tag})", "style": "Witty"}
+
+def _post(url, path, body, timeout):
+    """
+    Sends one request. Returns (status, seconds, coalesced).
+    """
+    request = urllib.request.Request(
+        url + path, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status, time.perf_counter() - started, response.headers.get("X-Genie-Coalesced") == "1"
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, time.perf_counter() - started, False
+    except OSError:
+        return None, time.perf_counter() - started, False
+
+def run_level(url, concurrency, requests, duplicate_share, timeout, seed=0):
+    """
+    Sends requests from concurrency clients and summarizes the outcome.
+    """
+    rng = random.Random(seed + concurrency)
+    jobs = [_request(concurrency, i, duplicate_share, rng) for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(lambda job: _post(url, job[0], job[1], timeout), jobs))
+    elapsed = time.perf_counter() - started
+    latencies = [seconds for status, seconds, _ in outcomes if status == 200]
+    return {
+        "ok": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "rejected": sum(status == 429 for status, _, _ in outcomes),
+        "coalesced": sum(coalesced for _, _, coalesced in outcomes),
+        "errors": sum(status not in (200, 429) for status, _, _ in outcomes),
+    }
+
+def _start_local_server(workers, queue_depth, latency):
+    from backends import MockBackend, set_backend
+    from server import GenieServer
+
+    set_backend(MockBackend(latency=latency, error_rate=0.0))
+    server = GenieServer(("127.0.0.1", 0), workers, queue_depth)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Genie service.")
+    parser.add_argument("--url", help="Service to test (default: start one in-process on the mock backend)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--duplicate-share", type=float, default=0.5,
+                        help="Share of requests that repeat a popular request (default: 0.5)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=8, help="Workers of the in-process service")
+    parser.add_argument("--queue-depth", type=int, default=32, help="Queue depth of the in-process service")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated API latency in seconds")
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url.rstrip("/") if args.url else None
+    if url is None:
+        server, url = _start_local_server(args.workers, args.queue_depth, args.latency)
+    try:
+        print(f"{'clients':>8}{'ok':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'429s':>7}{'coalesced':>11}{'errors':>8}")
+        for concurrency in args.concurrency:
+            r = run_level(url, concurrency, args.requests, args.duplicate_share, args.timeout)
+            print(f"{concurrency:>8}{r['ok']:>7}{r['throughput_per_s']:>9}{str(r['p50_ms']):>9}"
+                  f"{str(r['p95_ms']):>9}{str(r['p99_ms']):>9}{r['rejected']:>7}{r['coalesced']:>11}{r['errors']:>8}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
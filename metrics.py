@@ -0,0 +1,398 @@
+# --------- metrics.py ---------
+import contextvars
+import functools
+import inspect
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Instrumentation settings (override via environment variables)
+RING_BUFFER_SIZE = int(os.getenv("GENIE_METRICS_BUFFER", 1000))
+PROMETHEUS_FILE = os.getenv("GENIE_METRICS_PROM_FILE", "")
+PROMETHEUS_PORT = int(os.getenv("GENIE_METRICS_PORT", 0))
+
+# USD per 1M tokens (prompt, response), used for the cost estimates shown in the app
+MODEL_PRICING = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_call = contextvars.ContextVar("genie_current_call", default=None)
+_session = contextvars.ContextVar("genie_session", default="")
+_sinks = []
+_sinks_lock = threading.Lock()
+
+def set_session(session_id):
+    """
+    Tags calls made from the current context (e.g. one Streamlit session) with session_id.
+    """
+    _session.set(session_id)
+
+def current_session():
+    return _session.get()
+
+def _new_record(function):
+    return {
+        "function": function,
+        "session": _session.get(),
+        "model": "",
+        "started": time.time(),
+        "duration": 0.0,
+        "phases": {},
+        "prompt_tokens": 0,
+        "response_tokens": 0,
+        "requests": 0,
+        "retries": 0,
+        "cache_hit": False,
+        "error": "",
+    }
+
+def _finish(record, started):
+    record["duration"] = time.perf_counter() - started
+    with _sinks_lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        sink.record(record)
+
+def instrumented(function_name):
+    """
+    Decorator that records one call record per invocation of a gemini_api entry point.
+    Generator functions are timed until the generator is exhausted or closed.
+    """
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                record = _new_record(function_name)
+                started = time.perf_counter()
+                gen = fn(*args, **kwargs)
+                try:
+                    while True:
+                        # Only the generator's own steps run with the record as the current call
+                        token = _current_call.set(record)
+                        try:
+                            item = next(gen)
+                        except StopIteration:
+                            return
+                        finally:
+                            _current_call.reset(token)
+                        yield item
+                except Exception as e:
+                    record["error"] = str(e)
+                    raise
+                finally:
+                    gen.close()
+                    _finish(record, started)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            record = _new_record(function_name)
+            token = _current_call.set(record)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                record["error"] = str(e)
+                raise
+            finally:
+                _current_call.reset(token)
+                _finish(record, started)
+        return wrapper
+    return decorator
+
+@contextmanager
+def phase(name):
+    """
+    Adds the time spent in the enclosed block to the current call's phase timings.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - started)
+
+def add_phase(name, seconds):
+    record = _current_call.get()
+    if record is not None:
+        record["phases"][name] = record["phases"].get(name, 0.0) + seconds
+
+def note_cache_hit():
+    record = _current_call.get()
+    if record is not None:
+        record["cache_hit"] = True
+
+def note_retry():
+    record = _current_call.get()
+    if record is not None:
+        record["retries"] += 1
+
+def note_response(model_name, response):
+    """
+    Counts a model request and its token usage (from response.usage_metadata) on the current call.
+    """
+    record = _current_call.get()
+    if record is None:
+        return
+    record["model"] = model_name
+    record["requests"] += 1
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        record["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+        record["response_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+
+def _proc_status(field):
+    """
+    Returns a size field of /proc/self/status (e.g. "VmRSS") in bytes, or None off Linux.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def rss_bytes():
+    """
+    Current resident memory of the process in bytes, or None where it cannot be read.
+    """
+    return _proc_status("VmRSS")
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of the process in bytes since start (or since reset_peak_rss).
+    """
+    peak = _proc_status("VmHWM")
+    if peak is None:
+        try:
+            import resource
+        except ImportError:
+            return None
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024
+    return peak
+
+def reset_peak_rss():
+    """
+    Resets the process's peak resident memory to its current value. Returns False where the
+    kernel does not support it, in which case the peak is the one since process start.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+# The peak is process-wide: only a measurement that no other one overlaps may reset and read it
+_peak_lock = threading.Lock()
+_peak_active = 0
+_peak_started = 0
+
+@contextmanager
+def memory_peak():
+    """
+    Measures the peak resident memory while the block runs. Yields a dict that is filled in when the
+    block exits: "start_bytes", "peak_bytes" and "growth_bytes" (peak minus start). The peak is for
+    the whole process, so work running concurrently in other threads is included. Only a block that
+    no other memory_peak block overlaps resets the peak; the others (and those on systems where it
+    cannot be reset) report a peak that may predate the block, with "exact" False.
+    """
+    global _peak_active, _peak_started
+    with _peak_lock:
+        alone = _peak_active == 0
+        _peak_active += 1
+        _peak_started += 1
+        started = _peak_started
+        reset = alone and reset_peak_rss()
+    usage = {"start_bytes": rss_bytes(), "peak_bytes": None, "growth_bytes": None, "exact": False}
+    try:
+        yield usage
+    finally:
+        with _peak_lock:
+            _peak_active -= 1
+            usage["peak_bytes"] = peak_rss_bytes()
+            # Exact unless another measurement started after this one, or was running already
+            usage["exact"] = reset and _peak_started == started
+        if usage["start_bytes"] is not None and usage["peak_bytes"] is not None:
+            usage["growth_bytes"] = max(0, usage["peak_bytes"] - usage["start_bytes"])
+
+def percentile(samples, pct):
+    """
+    The pct-th percentile (0-100) of samples, as the nearest sample in sorted order.
+    """
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def estimated_cost(record):
+    """
+    Estimated USD cost of a call record, based on MODEL_PRICING.
+    """
+    prompt_price, response_price = MODEL_PRICING.get(record["model"], (0.0, 0.0))
+    return (record["prompt_tokens"] * prompt_price + record["response_tokens"] * response_price) / 1_000_000
+
+class RingBufferSink:
+    """
+    Keeps the most recent call records in memory.
+    """
+
+    def __init__(self, maxlen=RING_BUFFER_SIZE):
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self, session=None):
+        with self._lock:
+            records = list(self._records)
+        if session is not None:
+            records = [r for r in records if r["session"] == session]
+        return records
+
+    def summary(self, session=None):
+        """
+        Aggregates calls, cache hits, tokens, cost and latency for the buffered records.
+        """
+        records = self.records(session)
+        durations = [r["duration"] for r in records]
+        phases = {}
+        for r in records:
+            for name, seconds in r["phases"].items():
+                phases[name] = phases.get(name, 0.0) + seconds
+        return {
+            "calls": len(records),
+            "requests": sum(r["requests"] for r in records),
+            "cache_hits": sum(r["cache_hit"] for r in records),
+            "retries": sum(r["retries"] for r in records),
+            "errors": sum(bool(r["error"]) for r in records),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+            "response_tokens": sum(r["response_tokens"] for r in records),
+            "cost_usd": sum(estimated_cost(r) for r in records),
+            "p50_seconds": percentile(durations, 50) if durations else 0.0,
+            "p95_seconds": percentile(durations, 95) if durations else 0.0,
+            "phase_seconds": phases,
+        }
+
+class PrometheusSink:
+    """
+    Aggregates call records into Prometheus counters and histograms. The text exposition can be
+    rendered on demand, written to a file after every call, and/or served over HTTP.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def _inc(self, name, labels, value=1.0):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def record(self, record):
+        fn = {"function": record["function"]}
+        with self._lock:
+            self._inc("genie_calls_total", {**fn, "cache_hit": str(record["cache_hit"]).lower()})
+            self._inc("genie_requests_total", {**fn, "model": record["model"] or "none"}, record["requests"])
+            self._inc("genie_retries_total", fn, record["retries"])
+            if record["error"]:
+                self._inc("genie_errors_total", fn)
+            self._inc("genie_tokens_total", {**fn, "kind": "prompt"}, record["prompt_tokens"])
+            self._inc("genie_tokens_total", {**fn, "kind": "response"}, record["response_tokens"])
+            for name, seconds in record["phases"].items():
+                self._inc("genie_phase_seconds_total", {**fn, "phase": name}, seconds)
+            buckets, total, count = self._histograms.get(record["function"], ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if record["duration"] <= bound:
+                    buckets[i] += 1
+            self._histograms[record["function"]] = (buckets, total + record["duration"], count + 1)
+        if self.path:
+            self.write(self.path)
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+        lines = []
+        seen = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value:g}")
+        if histograms:
+            lines.append("# TYPE genie_call_duration_seconds histogram")
+        for function, (buckets, total, count) in sorted(histograms.items()):
+            for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'genie_call_duration_seconds_bucket{{function="{function}",le="{bound}"}} {bucket_count}')
+            lines.append(f'genie_call_duration_seconds_bucket{{function="{function}",le="+Inf"}} {count}')
+            lines.append(f'genie_call_duration_seconds_sum{{function="{function}"}} {total:g}')
+            lines.append(f'genie_call_duration_seconds_count{{function="{function}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Atomically writes the exposition to path (e.g. for the node_exporter textfile collector).
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".genie-metrics-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="0.0.0.0"):
+        """
+        Serves the exposition at http://host:port/metrics from a daemon thread.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+def add_sink(sink):
+    with _sinks_lock:
+        _sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    with _sinks_lock:
+        _sinks.remove(sink)
+
+ring_buffer = add_sink(RingBufferSink())
+prometheus = None
+if PROMETHEUS_FILE or PROMETHEUS_PORT:
+    prometheus = add_sink(PrometheusSink(PROMETHEUS_FILE or None))
+    if PROMETHEUS_PORT:
+        prometheus.serve(PROMETHEUS_PORT)
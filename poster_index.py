@@ -0,0 +1,273 @@
+# --------- poster_index.py ---------
+"""
+Perceptual index of analyzed posters.
+
+The response cache is keyed by the exact image bytes, so a poster that comes back re-exported,
+resized or as a JPEG instead of a PNG would be analyzed again. This index recognizes such
+copies: every poster is indexed by its 64-bit pHash in a BK-tree, a lookup collects the posters
+within a small Hamming distance, and a candidate is only accepted if its grayscale thumbnail
+matches pixel for pixel within a tolerance (a changed headline or colour scheme can keep the
+pHash but not the thumbnail). Cached analyses are then keyed by the id of the first copy seen.
+
+The index holds at most GENIE_POSTER_INDEX_ENTRIES posters. When it is full, the least recently
+seen tenth is evicted (from SQLite as well) and the BK-tree is rebuilt from the rest.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Poster index settings (override via environment variables)
+POSTER_INDEX_ENABLED = os.getenv("GENIE_POSTER_INDEX", "1") != "0"
+POSTER_INDEX_PATH = os.getenv(
+    "GENIE_POSTER_INDEX_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "genie", "posters.sqlite3"),
+)
+# Largest pHash Hamming distance (out of 64 bits) at which two posters are compared
+MAX_DISTANCE = int(os.getenv("GENIE_POSTER_MAX_DISTANCE", 6))
+MAX_ENTRIES = int(os.getenv("GENIE_POSTER_INDEX_ENTRIES", 5000))
+# Share of the posters evicted at once when the index is full, so the tree is not rebuilt per insert
+EVICT_FRACTION = 0.1
+# Largest per-pixel difference (0-255) between the thumbnails of two copies of one poster;
+# re-encoding and resizing stay well below it, edited text and recoloured areas do not
+THUMBNAIL_TOLERANCE = 14
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes under Hamming distance. Each child edge is labelled with
+    its distance to the parent, so by the triangle inequality a search only descends into edges
+    within radius of the query's distance to that parent.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def add(self, value, item):
+        self._size += 1
+        if self._root is None:
+            self._root = (value, item, {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        Returns (distance, item) for every stored hash within radius of value, nearest first.
+        """
+        found = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[1]))
+            pending.extend(
+                child for edge, child in node[2].items() if distance - radius <= edge <= distance + radius
+            )
+        found.sort(key=lambda match: match[0])
+        return found
+
+    def __len__(self):
+        return self._size
+
+class PosterIndex:
+    """
+    Maps prepared images (see image_utils.prepare_image) to a poster id shared by all copies of the
+    same poster. Indexed posters are kept in SQLite and loaded into the BK-tree on first use; the
+    added_at column holds when a poster was last seen, which decides what is evicted first.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=POSTER_INDEX_PATH, enabled=True, max_distance=MAX_DISTANCE,
+                 max_entries=MAX_ENTRIES):
+        self.path = path
+        self.enabled = enabled
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        # image id -> thumbnail, least recently seen first
+        self._thumbnails = OrderedDict()
+        self._phashes = {}
+        # Ids of copies already resolved to an indexed poster, least recently seen first
+        self._aliases = OrderedDict()
+        # The SQLite store is opened (and the tree loaded) on first use, keeping imports cheap
+        self._db = None
+        self._db_opened = False
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "evictions": 0}
+
+    def _disk(self):
+        """
+        Returns the SQLite connection, opening it and loading the tree on first use. Call with the lock held.
+        """
+        if not self._db_opened:
+            self._db_opened = True
+            self._db = self._open_db(self.path) if self.path else None
+            if self._db is not None:
+                rows = self._db.execute(
+                    "SELECT image_id, phash, thumbnail FROM posters ORDER BY added_at DESC LIMIT ?",
+                    (self.max_entries,),
+                ).fetchall()
+                for image_id, image_phash, thumbnail in reversed(rows):
+                    self._insert(image_id, int.from_bytes(image_phash, "big"), thumbnail)
+        return self._db
+
+    def _open_db(self, path):
+        """
+        Opens (and creates if needed) the store. Returns None if the location is not writable,
+        which keeps the index in memory only.
+        """
+        try:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS posters ("
+                "image_id TEXT PRIMARY KEY, phash BLOB NOT NULL, thumbnail BLOB NOT NULL, added_at REAL NOT NULL)"
+            )
+            db.commit()
+            return db
+        except (OSError, sqlite3.Error):
+            return None
+
+    def _insert(self, image_id, image_phash, thumbnail):
+        import numpy as np
+
+        self._thumbnails[image_id] = np.frombuffer(thumbnail, dtype=np.uint8).astype(np.int16)
+        self._phashes[image_id] = image_phash
+        self._tree.add(image_phash, image_id)
+
+    def _touch(self, image_id, db):
+        """
+        Marks an indexed poster as just seen. Call with the lock held.
+        """
+        self._thumbnails.move_to_end(image_id)
+        if db is not None:
+            try:
+                db.execute("UPDATE posters SET added_at = ? WHERE image_id = ?", (time.time(), image_id))
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _evict(self, db):
+        """
+        Drops the least recently seen posters (and their aliases) and rebuilds the tree from the
+        rest. Call with the lock held.
+        """
+        count = max(1, int(self.max_entries * EVICT_FRACTION))
+        evicted = set()
+        while self._thumbnails and len(evicted) < count:
+            image_id, _ = self._thumbnails.popitem(last=False)
+            del self._phashes[image_id]
+            evicted.add(image_id)
+        for alias in [alias for alias, target in self._aliases.items() if target in evicted]:
+            del self._aliases[alias]
+        self._tree = BKTree()
+        for image_id in self._thumbnails:
+            self._tree.add(self._phashes[image_id], image_id)
+        self.stats["evictions"] += len(evicted)
+        if db is not None:
+            try:
+                db.executemany("DELETE FROM posters WHERE image_id = ?", [(image_id,) for image_id in evicted])
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _find(self, image_phash, thumbnail):
+        """
+        Returns the id of an indexed copy of the poster, or None.
+        """
+        import numpy as np
+
+        pixels = np.frombuffer(thumbnail, dtype=np.uint8).astype(np.int16)
+        for _, image_id in self._tree.search(image_phash, self.max_distance):
+            indexed = self._thumbnails[image_id]
+            if indexed.shape == pixels.shape and np.abs(indexed - pixels).max() <= THUMBNAIL_TOLERANCE:
+                return image_id
+        return None
+
+    def identify(self, payload):
+        """
+        Returns the poster id to key results for this prepared image by: the id of an indexed copy
+        of the same poster if there is one, otherwise the image's own id, which is then indexed.
+        """
+        image_id = hashlib.sha256(payload["data"]).hexdigest()
+        if not self.enabled or "phash" not in payload:
+            return image_id
+        with self._lock:
+            db = self._disk()
+            if image_id in self._thumbnails:
+                self.stats["exact_hits"] += 1
+                self._touch(image_id, db)
+                return image_id
+            if image_id in self._aliases:
+                self.stats["near_hits"] += 1
+                self._aliases.move_to_end(image_id)
+                match = self._aliases[image_id]
+                self._touch(match, db)
+                return match
+            match = self._find(payload["phash"], payload["thumbnail"])
+            if match is not None:
+                self.stats["near_hits"] += 1
+                self._aliases[image_id] = match
+                if len(self._aliases) > self.max_entries:
+                    self._aliases.popitem(last=False)
+                self._touch(match, db)
+                return match
+            self.stats["misses"] += 1
+            if self.max_entries <= 0:
+                return image_id
+            if len(self._thumbnails) >= self.max_entries:
+                self._evict(db)
+            self._insert(image_id, payload["phash"], payload["thumbnail"])
+            if db is not None:
+                try:
+                    db.execute(
+                        "INSERT OR IGNORE INTO posters VALUES (?, ?, ?, ?)",
+                        (image_id, payload["phash"].to_bytes(8, "big"), payload["thumbnail"], time.time()),
+                    )
+                    db.commit()
+                except sqlite3.Error:
+                    pass
+            return image_id
+
+    def summary(self):
+        """
+        Poster count and lookup hit rates since the index was opened.
+        """
+        lookups = self.stats["exact_hits"] + self.stats["near_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "posters": len(self._thumbnails),
+            "lookups": lookups,
+            "exact_hit_rate": self.stats["exact_hits"] / lookups if lookups else 0.0,
+            "near_hit_rate": self.stats["near_hits"] / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        """
+        Removes every indexed poster.
+        """
+        with self._lock:
+            db = self._disk()
+            self._tree = BKTree()
+            self._thumbnails.clear()
+            self._phashes.clear()
+            self._aliases.clear()
+            if db is not None:
+                db.execute("DELETE FROM posters")
+                db.commit()
+
+poster_index = PosterIndex(enabled=POSTER_INDEX_ENABLED)
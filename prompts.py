@@ -73,3 +73,108 @@ Format:
 Localized Caption: "Translation here"
 Note: <cultural note if any, else leave blank>
 """
+
+# 5. Multi-language localization prompt (one request, JSON keyed by language)
+multi_localization_template = """
+You are Genie, a localization specialist. Adapt the following campaign caption for each of these audiences: {target_languages}
+"{caption}"
+
+For every language:
+- Translate accurately
+- Adapt cultural tone if needed
+- Flag if anything doesn't work well in the target culture
+
+Return only a JSON object with one key per language, spelled exactly as given above:
+{{"<Language>": {{"localized_caption": "Translation here", "note": "<cultural note if any, else empty>"}}}}
+"""
+
+# 6. Structured (JSON) variants of prompts 1–3, used with a response schema
+structured_creative_prompt_template = """
+You are Genie, a creative strategist for marketing and iGaming brands.
+Your job is to brainstorm {num} unique, catchy ideas for this prompt:
+"{prompt}"
+Make the ideas {style} if a style is specified. For each idea, give:
+- "caption": the campaign copy (slogan/tagline)
+- "score": an engagement score from 1 to 10 estimating likely audience appeal
+- "why": a one-sentence explanation of why it's engaging
+
+Return a JSON object with an "ideas" list.
+"""
+
+structured_caption_analysis_template = """
+You are Genie, an expert content analyst for iGaming/entertainment campaigns.
+Given the following image (attached) and caption:
+"{caption}"
+
+Return a JSON object with:
+- "engagement_score": engagement of the caption from 1 to 10
+- "brand_voice": whether it matches the brand voice (yes/no + why)
+- "compliance": any responsible gaming compliance risks (yes/no + explain)
+- "suggested_captions": 2 alternate, improved captions
+"""
+
+structured_image_caption_suggestion_template = """
+You are Genie, a creative copywriter for marketing and iGaming brands.
+Given only an image (attached), return a JSON object with:
+- "caption": the best possible campaign caption for the image
+- "engagement_score": its engagement from 1 to 10
+- "brand_voice": whether it's brand-appropriate
+- "compliance": any responsible gaming compliance risks
+- "suggested_captions": 2 alternate captions
+"""
+
+# 7. Repair prompt for fields that were missing or invalid in a structured response
+structured_repair_template = """
+Your previous answer below had missing or invalid values for these fields: {fields}
+Previous answer:
+{previous}
+
+Return a JSON object containing only those fields, keyed exactly as listed.
+Scores must be numbers from 1 to 10 and text fields must not be empty.
+"""
+
+# 8. Batch engagement scoring (one request for many captions, JSON keyed by caption number)
+caption_scoring_template = """
+You are Genie, an expert content analyst for iGaming/entertainment campaigns.
+{context}Score the likely audience engagement of each numbered caption below from 1 to 10 and briefly explain why.
+
+{captions}
+
+Return only a JSON object with one key per caption number:
+{{"<number>": {{"score": <1-10>, "why": "<one sentence>"}}}}
+"""
+
+caption_scoring_poster_context = "The captions are for the attached poster; judge how well each one fits it.\n"
+
+# 9. Appended to a creative prompt when a large idea count is split into parallel sub-requests
+creative_angle_instruction = """
+This is one batch of a larger brainstorm. Focus every idea in this batch on {angle},
+and avoid generic ideas that other batches would also come up with.
+"""
+
+creative_angles = [
+    "wordplay and puns",
+    "urgency and limited-time excitement",
+    "community and playing together",
+    "rewards, bonuses and value",
+    "emotion and storytelling",
+    "curiosity and questions",
+    "seasonal and topical hooks",
+    "bold, very short one-liners",
+    "luxury and exclusivity",
+    "humor and surprise",
+]
+
+# 10. Translation-memory hints appended to localization_template when similar captions were translated before
+localization_hints_template = """
+Approved {target_language} translations of similar captions from our translation memory; reuse their wording where it fits:
+{hints}
+"""
+
+# 11. Appended to prompts 2 and 3 to localize the best caption in the same request
+fused_localization_instruction = """
+Finally, adapt {subject} for {target_language} audiences: translate accurately, adapt the cultural tone if needed,
+and flag anything that doesn't work well in that culture. End your answer with these two lines:
+Localized Caption: "Translation here"
+Localization Note: <cultural note if any, else leave blank>
+"""
@@ -0,0 +1,295 @@
+# --------- routing.py ---------
+"""
+Per-task model routing.
+
+Each gemini_api task has its own model: creative taglines and localization run on the lighter,
+faster model and only the image analyses use the bigger default. The router keeps an
+exponentially weighted moving average (EWMA) of every model's latency per task; while the
+task's model averages above the task's latency SLO, calls move down to the next faster model
+(with an occasional probe of the preferred model, so it can win its place back).
+
+In cascade mode (GENIE_ROUTING_CASCADE=1) a call whose reply does not parse, or parses with a
+confidence below GENIE_ROUTING_MIN_CONFIDENCE, is repeated once on the task's escalation model.
+Confidence is the share of the expected fields or items the reply delivered (see gemini_api).
+
+Every attempt is recorded with its model, the reason it was chosen, its latency and confidence:
+summary() aggregates them per task, and GENIE_ROUTING_LOG appends them as JSON lines for tuning.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+FAST_MODEL = "gemini-1.5-flash-8b"
+DEFAULT_MODEL = "gemini-1.5-flash"
+STRONG_MODEL = "gemini-1.5-pro"
+# Fastest first; a task over its SLO moves one step towards the front
+MODEL_TIERS = [FAST_MODEL, DEFAULT_MODEL, STRONG_MODEL]
+
+CREATIVE = "creative"
+ANALYSIS = "analysis"
+SUGGESTION = "suggestion"
+LOCALIZATION = "localization"
+SCORING = "scoring"
+
+# task -> (model, escalation model, latency SLO in seconds)
+DEFAULT_ROUTES = {
+    CREATIVE: (FAST_MODEL, DEFAULT_MODEL, 4.0),
+    ANALYSIS: (DEFAULT_MODEL, STRONG_MODEL, 8.0),
+    SUGGESTION: (DEFAULT_MODEL, STRONG_MODEL, 8.0),
+    LOCALIZATION: (FAST_MODEL, DEFAULT_MODEL, 2.0),
+    SCORING: (DEFAULT_MODEL, DEFAULT_MODEL, 5.0),
+}
+
+# Routing settings (override via environment variables); per task e.g. GENIE_MODEL_LOCALIZATION,
+# GENIE_ESCALATION_MODEL_LOCALIZATION and GENIE_SLO_LOCALIZATION
+ROUTING_CASCADE = os.getenv("GENIE_ROUTING_CASCADE", "0") == "1"
+MIN_CONFIDENCE = float(os.getenv("GENIE_ROUTING_MIN_CONFIDENCE", 0.75))
+ROUTING_LOG_PATH = os.getenv("GENIE_ROUTING_LOG", "")
+# Weight of the newest latency sample in a model's moving average
+EWMA_ALPHA = 0.2
+# While a task is moved off its model, every PROBE_EVERY-th call still goes to it
+PROBE_EVERY = 20
+DECISION_BUFFER_SIZE = 1000
+
+# Model time of the attempt in progress: gemini_api reports the time spent in the backend call
+# itself, so queueing for quota and retry backoff do not count against a model's latency
+_attempt_seconds = contextvars.ContextVar("genie_route_attempt_seconds", default=None)
+
+def note_model_seconds(seconds):
+    """
+    Adds the duration of one backend call to the current routed attempt, if any.
+    """
+    timing = _attempt_seconds.get()
+    if timing is not None:
+        timing["seconds"] += seconds
+        timing["calls"] += 1
+
+def routes_from_env(defaults=DEFAULT_ROUTES):
+    """
+    Returns the routes with the per-task environment overrides applied.
+    """
+    routes = {}
+    for task, (model, escalation, slo) in defaults.items():
+        suffix = task.upper()
+        routes[task] = (
+            os.getenv(f"GENIE_MODEL_{suffix}", model),
+            os.getenv(f"GENIE_ESCALATION_MODEL_{suffix}", escalation),
+            float(os.getenv(f"GENIE_SLO_{suffix}", slo)),
+        )
+    return routes
+
+class ModelRouter:
+    """
+    Chooses the model for each call of a task and records how the choice worked out.
+    Safe to share between threads.
+    """
+
+    def __init__(self, routes=None, cascade=ROUTING_CASCADE, min_confidence=MIN_CONFIDENCE,
+                 log_path=ROUTING_LOG_PATH, tiers=MODEL_TIERS, alpha=EWMA_ALPHA, probe_every=PROBE_EVERY):
+        self.routes = dict(routes or routes_from_env())
+        self.cascade = cascade
+        self.min_confidence = min_confidence
+        self.log_path = log_path
+        self.tiers = list(tiers)
+        self.alpha = alpha
+        self.probe_every = probe_every
+        self._lock = threading.Lock()
+        # (task, model) -> EWMA latency in seconds
+        self._latency = {}
+        self._fallback_calls = {}
+        self._decisions = deque(maxlen=DECISION_BUFFER_SIZE)
+        self._stats = {}
+
+    def cache_tag(self, task):
+        """
+        Identifies the task's routing policy in cache keys: a reply is reused for any call of the
+        task, whichever of its models produced it, but not after the task is moved to other models.
+        """
+        model, escalation, _ = self.routes[task]
+        return f"{model}>{escalation}" if self.cascade and escalation != model else model
+
+    def _faster(self, model):
+        """
+        The next faster tier than model, or None.
+        """
+        if model not in self.tiers:
+            return None
+        index = self.tiers.index(model)
+        return self.tiers[index - 1] if index > 0 else None
+
+    def select(self, task):
+        """
+        Returns (model, reason) for the next call of task. The reason is "route" for the task's
+        model, "slo" when the call moves to a faster model because the preferred one is over the
+        task's SLO, and "probe" for the occasional call that re-measures a model over its SLO.
+        """
+        model, _, slo = self.routes[task]
+        with self._lock:
+            reason = "route"
+            while self._latency.get((task, model), 0.0) > slo:
+                faster = self._faster(model)
+                if faster is None:
+                    break
+                calls = self._fallback_calls.get((task, model), 0) + 1
+                self._fallback_calls[(task, model)] = calls
+                if calls % self.probe_every == 0:
+                    return model, "probe"
+                model, reason = faster, "slo"
+            return model, reason
+
+    def plan(self, task):
+        """
+        Returns the (model, reason) attempts a call of task may make, in order: the selected model
+        and, in cascade mode, the task's escalation model.
+        """
+        model, reason = self.select(task)
+        escalation = self.routes[task][1]
+        if self.cascade and escalation != model:
+            return [(model, reason), (escalation, "escalation")]
+        return [(model, reason)]
+
+    def accepts(self, confidence):
+        return confidence is not None and confidence >= self.min_confidence
+
+    def record(self, task, model, reason, seconds, confidence=None, error=""):
+        """
+        Records one attempt taking seconds of model time: updates the model's latency average for
+        the task, the task's totals and the decision log. Failed attempts do not update the average.
+        """
+        slo = self.routes[task][2]
+        accepted = not error and (confidence is None or self.accepts(confidence))
+        decision = {
+            "time": time.time(),
+            "task": task,
+            "model": model,
+            "reason": reason,
+            "seconds": round(seconds, 4),
+            "confidence": None if confidence is None else round(confidence, 3),
+            "accepted": accepted,
+            "over_slo": seconds > slo,
+            "error": error,
+            "session": metrics.current_session(),
+        }
+        with self._lock:
+            previous = self._latency.get((task, model))
+            if not error:
+                self._latency[(task, model)] = (
+                    seconds if previous is None else self.alpha * seconds + (1 - self.alpha) * previous
+                )
+            stats = self._stats.setdefault(task, {
+                "attempts": 0, "escalations": 0, "escalation_seconds": 0.0, "slo_fallbacks": 0,
+                "probes": 0, "over_slo": 0, "rejected": 0, "models": {},
+            })
+            stats["attempts"] += 1
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+            stats["over_slo"] += decision["over_slo"]
+            stats["rejected"] += not accepted
+            if reason == "escalation":
+                stats["escalations"] += 1
+                stats["escalation_seconds"] += seconds
+            elif reason == "slo":
+                stats["slo_fallbacks"] += 1
+            elif reason == "probe":
+                stats["probes"] += 1
+            self._decisions.append(decision)
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(decision) + "\n")
+                except OSError:
+                    pass
+        return decision
+
+    def run(self, task, attempt, confidence):
+        """
+        Calls attempt(model) on the planned models until a reply is accepted: confidence(reply) is
+        at least min_confidence and attempt did not raise ValueError (a reply that cannot be used).
+        The last planned model's reply is returned even when not accepted, or the most confident
+        earlier one if that one failed outright. Other exceptions are recorded and raised.
+        Each attempt is recorded with the model time reported through note_model_seconds.
+        """
+        best = None
+        plan = self.plan(task)
+        last_model = plan[-1][0]
+        for model, reason in plan:
+            timing = {"seconds": 0.0, "calls": 0}
+            token = _attempt_seconds.set(timing)
+            try:
+                reply = attempt(model)
+            except ValueError as e:
+                self.record(task, model, reason, timing["seconds"], error=str(e) or type(e).__name__)
+                if model == last_model:
+                    if best is not None:
+                        return best[1]
+                    raise
+                continue
+            except Exception as e:
+                self.record(task, model, reason, timing["seconds"], error=str(e) or type(e).__name__)
+                raise
+            finally:
+                _attempt_seconds.reset(token)
+            score = confidence(reply)
+            self.record(task, model, reason, timing["seconds"], score)
+            if self.accepts(score):
+                return reply
+            if best is None or score > best[0]:
+                best = (score, reply)
+        return best[1]
+
+    def latency(self, task, model):
+        """
+        The task's moving-average latency on model in seconds, or None before its first call.
+        """
+        with self._lock:
+            return self._latency.get((task, model))
+
+    def decisions(self, task=None):
+        """
+        The most recent attempts (oldest first), optionally only those of one task.
+        """
+        with self._lock:
+            decisions = list(self._decisions)
+        return [d for d in decisions if task is None or d["task"] == task]
+
+    def summary(self):
+        """
+        Per task: its route, attempts per model, the moving-average latency of each model used,
+        and how often calls escalated, fell back for the SLO, ran over it or were rejected.
+        "escalation_seconds" is the latency added by escalations.
+        """
+        with self._lock:
+            summary = {}
+            for task, (model, escalation, slo) in self.routes.items():
+                stats = self._stats.get(task)
+                if stats is None:
+                    continue
+                summary[task] = {
+                    "model": model,
+                    "escalation_model": escalation,
+                    "slo_seconds": slo,
+                    **{k: v for k, v in stats.items() if k != "models"},
+                    "escalation_seconds": round(stats["escalation_seconds"], 3),
+                    "escalation_rate": stats["escalations"] / stats["attempts"],
+                    "models": {
+                        name: {"attempts": count, "ewma_seconds": round(self._latency.get((task, name), 0.0), 3)}
+                        for name, count in stats["models"].items()
+                    },
+                }
+            return summary
+
+    def reset(self):
+        """
+        Forgets all latency averages and recorded decisions.
+        """
+        with self._lock:
+            self._latency.clear()
+            self._fallback_calls.clear()
+            self._decisions.clear()
+            self._stats.clear()
+
+router = ModelRouter()
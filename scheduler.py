@@ -0,0 +1,236 @@
+# --------- scheduler.py ---------
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Quota settings (override via environment variables)
+REQUESTS_PER_MINUTE = float(os.getenv("GENIE_RPM", 15))
+TOKENS_PER_MINUTE = float(os.getenv("GENIE_TPM", 1_000_000))
+MAX_RETRIES = int(os.getenv("GENIE_MAX_RETRIES", 4))
+BACKOFF_BASE_SECONDS = float(os.getenv("GENIE_BACKOFF_BASE", 1.0))
+BACKOFF_MAX_SECONDS = float(os.getenv("GENIE_BACKOFF_MAX", 30.0))
+# Gemini quotas are per model: each model gets its own buckets, at GENIE_RPM/GENIE_TPM unless
+# listed here, e.g. GENIE_MODEL_RPM="gemini-1.5-pro=2,gemini-1.5-flash-8b=15"
+MODEL_REQUESTS_PER_MINUTE = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition("=") for item in os.getenv("GENIE_MODEL_RPM", "").split(","))
+    if name.strip() and rate.strip()
+}
+
+# Priority lanes: lower values are admitted first
+INTERACTIVE = 0
+BATCH = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_current_lane = contextvars.ContextVar("genie_priority_lane", default=INTERACTIVE)
+
+@contextmanager
+def priority_lane(lane):
+    """
+    Runs the enclosed Gemini calls in the given priority lane (INTERACTIVE or BATCH).
+    """
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+def is_retryable(error):
+    """
+    True for rate-limit, server-side and transient network errors.
+    """
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                                "InternalServerError", "DeadlineExceeded"):
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most one minute of budget.
+    The balance may go negative when actual usage exceeds an earlier estimate.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """
+        Seconds until amount tokens are available (0 if they are available now).
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+class RequestScheduler:
+    """
+    Central admission point for Gemini calls. Calls wait in a priority queue until both the
+    requests-per-minute and tokens-per-minute buckets of their model allow them, and retryable
+    failures are retried with exponential backoff and full jitter. The buckets are shared by the
+    whole process, so with server.py they are the limits of all its clients together.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS,
+                 model_requests_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_requests_per_minute = dict(
+            MODEL_REQUESTS_PER_MINUTE if model_requests_per_minute is None else model_requests_per_minute
+        )
+        # model -> (requests bucket, tokens bucket)
+        self._buckets = {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._stats = {
+            "admitted": 0,
+            "retries": 0,
+            "failures": 0,
+            "max_queue_depth": 0,
+            "wait_seconds": {name: 0.0 for name in LANE_NAMES.values()},
+            "max_wait_seconds": {name: 0.0 for name in LANE_NAMES.values()},
+            "admitted_by_lane": {name: 0 for name in LANE_NAMES.values()},
+            "admitted_by_model": {},
+        }
+
+    def _model_buckets(self, model):
+        """
+        Returns the (requests, tokens) buckets of model, creating them on first use. Call with the lock held.
+        """
+        if model not in self._buckets:
+            self._buckets[model] = (
+                TokenBucket(self.model_requests_per_minute.get(model, self.requests_per_minute)),
+                TokenBucket(self.tokens_per_minute),
+            )
+        return self._buckets[model]
+
+    def _admit(self, lane, est_tokens, model):
+        """
+        Blocks until this call is the first queued call for its model and both of the model's
+        buckets have budget. Returns the time spent waiting.
+        """
+        started = time.monotonic()
+        entry = (lane, next(self._seq), model)
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+            requests, tokens = self._model_buckets(model)
+            while True:
+                if min(queued for queued in self._queue if queued[2] == model) == entry:
+                    now = time.monotonic()
+                    delay = max(requests.wait_time(1, now), tokens.wait_time(est_tokens, now))
+                    if delay <= 0:
+                        break
+                    self._cond.wait(timeout=delay)
+                else:
+                    self._cond.wait()
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            requests.take(1)
+            tokens.take(est_tokens)
+            waited = time.monotonic() - started
+            name = LANE_NAMES.get(lane, str(lane))
+            self._stats["admitted"] += 1
+            self._stats["admitted_by_lane"][name] = self._stats["admitted_by_lane"].get(name, 0) + 1
+            self._stats["wait_seconds"][name] = self._stats["wait_seconds"].get(name, 0.0) + waited
+            self._stats["max_wait_seconds"][name] = max(self._stats["max_wait_seconds"].get(name, 0.0), waited)
+            self._stats["admitted_by_model"][model] = self._stats["admitted_by_model"].get(model, 0) + 1
+            self._cond.notify_all()
+        return waited
+
+    def _reconcile(self, response, est_tokens, model):
+        """
+        Charges the model's token bucket for the difference between estimated and actual usage.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None)
+        if actual:
+            with self._cond:
+                self._model_buckets(model)[1].take(actual - est_tokens)
+
+    def submit(self, call, est_tokens=1000, lane=None, model=""):
+        """
+        Runs call() once admitted against model's quota, retrying retryable errors with backoff.
+        The lane defaults to the one set by priority_lane (INTERACTIVE otherwise).
+        """
+        lane = _current_lane.get() if lane is None else lane
+        attempt = 0
+        while True:
+            metrics.add_phase("queue", self._admit(lane, est_tokens, model))
+            try:
+                with metrics.phase("network"):
+                    response = call()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self._cond:
+                        self._stats["failures"] += 1
+                    raise
+                attempt += 1
+                with self._cond:
+                    self._stats["retries"] += 1
+                metrics.note_retry()
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                with metrics.phase("backoff"):
+                    time.sleep(random.uniform(0, delay))
+                continue
+            self._reconcile(response, est_tokens, model)
+            return response
+
+    def metrics(self):
+        """
+        Snapshot of queue depth, wait times and retry counts.
+        """
+        with self._cond:
+            snapshot = {
+                key: dict(value) if isinstance(value, dict) else value
+                for key, value in self._stats.items()
+            }
+            snapshot["queue_depth"] = len(self._queue)
+        snapshot["mean_wait_seconds"] = {
+            name: total / max(snapshot["admitted_by_lane"].get(name, 0), 1)
+            for name, total in snapshot["wait_seconds"].items()
+        }
+        return snapshot
+
+def estimate_tokens(contents, expected_output_tokens=512):
+    """
+    Rough token estimate for a request: ~4 characters per text token, a fixed cost per
+    inline image, plus the expected response length.
+    """
+    parts = contents if isinstance(contents, list) else [contents]
+    total = expected_output_tokens
+    for part in parts:
+        if isinstance(part, str):
+            total += len(part) // 4 + 1
+        else:
+            total += 258
+    return total
+
+scheduler = RequestScheduler()
@@ -0,0 +1,219 @@
+# --------- schemas.py ---------
+import json
+from dataclasses import asdict, dataclass, field
+
+# Keys used only for local validation; stripped before the schema is sent to the API
+_LOCAL_KEYS = ("minimum", "maximum")
+
+SCORE_SCHEMA = {"type": "number", "minimum": 1, "maximum": 10}
+
+CREATIVE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ideas": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "caption": {"type": "string"},
+                    "score": SCORE_SCHEMA,
+                    "why": {"type": "string"},
+                },
+                "required": ["caption", "score", "why"],
+            },
+        },
+    },
+    "required": ["ideas"],
+}
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "engagement_score": SCORE_SCHEMA,
+        "brand_voice": {"type": "string"},
+        "compliance": {"type": "string"},
+        "suggested_captions": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["engagement_score", "brand_voice", "compliance", "suggested_captions"],
+}
+
+SUGGESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "caption": {"type": "string"},
+        **ANALYSIS_SCHEMA["properties"],
+    },
+    "required": ["caption"] + ANALYSIS_SCHEMA["required"],
+}
+
+@dataclass
+class CaptionVariation:
+    caption: str
+    score: float = None
+    why: str = ""
+    recommended: bool = False
+
+@dataclass
+class CreativeIdeas:
+    variations: list = field(default_factory=list)
+
+    @classmethod
+    def from_data(cls, data):
+        variations = [
+            CaptionVariation(caption=item["caption"], score=item.get("score"), why=item.get("why") or "")
+            for item in data.get("ideas") or []
+            if item and item.get("caption")
+        ]
+        if variations:
+            top = max(variations, key=lambda v: v.score or 0)
+            top.recommended = True
+        return cls(variations)
+
+    def to_result(self):
+        """
+        Returns the (ideas, variations) pair produced by generate_creative_ideas.
+        """
+        return [v.caption for v in self.variations], [asdict(v) for v in self.variations]
+
+@dataclass
+class CaptionAnalysis:
+    engagement_score: float = None
+    brand_voice: str = ""
+    compliance: str = ""
+    caption_variations: list = field(default_factory=list)
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(
+            engagement_score=data.get("engagement_score"),
+            brand_voice=data.get("brand_voice") or "",
+            compliance=data.get("compliance") or "",
+            caption_variations=[
+                CaptionVariation(caption=c) for c in data.get("suggested_captions") or [] if c
+            ],
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+@dataclass
+class CaptionSuggestion(CaptionAnalysis):
+    caption: str = ""
+
+    @classmethod
+    def from_data(cls, data):
+        result = super().from_data(data)
+        result.caption = data.get("caption") or ""
+        return result
+
+    def to_dict(self):
+        result = asdict(self)
+        return {"caption": result.pop("caption"), **result}
+
+def response_config(schema):
+    """
+    Builds the generation_config for a JSON response constrained to schema.
+    """
+    return {"response_mime_type": "application/json", "response_schema": _api_schema(schema)}
+
+def _api_schema(schema):
+    cleaned = {k: v for k, v in schema.items() if k not in _LOCAL_KEYS}
+    if "properties" in cleaned:
+        cleaned["properties"] = {k: _api_schema(v) for k, v in cleaned["properties"].items()}
+    if "items" in cleaned:
+        cleaned["items"] = _api_schema(cleaned["items"])
+    return cleaned
+
+def _validate(value, schema, path, failed):
+    """
+    Validates value against schema, returning the cleaned value and appending the
+    dotted path of every missing or invalid field to failed.
+    """
+    kind = schema["type"]
+    if kind == "object":
+        if not isinstance(value, dict):
+            value = {}
+        cleaned = {}
+        required = schema.get("required", [])
+        for name, sub_schema in schema["properties"].items():
+            sub_path = f"{path}.{name}" if path else name
+            if value.get(name) is None:
+                cleaned[name] = None
+                if name in required:
+                    failed.append(sub_path)
+                continue
+            cleaned[name] = _validate(value[name], sub_schema, sub_path, failed)
+        return cleaned
+    if kind == "array":
+        if not isinstance(value, list):
+            failed.append(path)
+            return None
+        return [_validate(item, schema["items"], f"{path}.{i}", failed) for i, item in enumerate(value)]
+    if kind == "number":
+        try:
+            number = float(str(value).split("/")[0])
+        except ValueError:
+            failed.append(path)
+            return None
+        if not schema.get("minimum", number) <= number <= schema.get("maximum", number):
+            failed.append(path)
+            return None
+        return number
+    text = str(value).strip().strip('"')
+    if not text:
+        failed.append(path)
+        return None
+    return text
+
+def _load_json(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+def parse_structured(text, schema):
+    """
+    Parses and validates a JSON response in one pass.
+    Returns (data, failed_paths); failed fields are left as None.
+    """
+    failed = []
+    data = _validate(_load_json(text), schema, "", failed)
+    return data, failed
+
+def _schema_at(schema, path):
+    for part in path.split("."):
+        schema = schema["items"] if schema["type"] == "array" else schema["properties"][part]
+    return schema
+
+def _set_at(data, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        data = data[int(part)] if isinstance(data, list) else data[part]
+    if isinstance(data, list):
+        data[int(last)] = value
+    else:
+        data[last] = value
+
+def repair_schema(schema, failed):
+    """
+    Builds a schema that asks only for the failed fields, keyed by their dotted paths.
+    """
+    return {
+        "type": "object",
+        "properties": {path: _schema_at(schema, path) for path in failed},
+        "required": list(failed),
+    }
+
+def apply_repair(data, text, schema, failed):
+    """
+    Merges a repair response into data. Returns (data, still_failed).
+    """
+    repaired, still_failed = parse_structured(text, repair_schema(schema, failed))
+    for path in failed:
+        if path not in still_failed:
+            _set_at(data, path, repaired[path])
+    return data, still_failed
@@ -0,0 +1,318 @@
+# --------- server.py ---------
+"""
+Shared HTTP service in front of gemini_api, so several Streamlit front ends and batch jobs can
+share one process: one response cache, one scheduler and one set of rate limits.
+
+Usage:
+    python server.py [--host 127.0.0.1] [--port 8765] [--workers 8] [--queue-depth 32]
+
+Endpoints (POST with a JSON body; images are base64-encoded file bytes):
+    /v1/creative        {"prompt", "style"}                -> {"ideas", "variations"}
+    /v1/analyze         {"image", "caption"}               -> analysis
+    /v1/suggest         {"image"}                          -> suggestion
+    /v1/localize        {"caption", "language"}            -> localization
+    /v1/localize_batch  {"caption", "languages"}           -> {language: localization}
+    /v1/score           {"captions", "image" (optional)}   -> [{"score", "why"}]
+    GET /healthz, GET /v1/stats
+
+Identical requests that arrive while one is already running share its upstream call. At most
+--workers calls run at once and at most --queue-depth more wait for a worker; beyond that the
+service answers 429 with a Retry-After header. Send "X-Genie-Lane: batch" to run a request in
+the scheduler's batch lane. Set GENIE_BACKEND=mock to serve the local stand-in backend.
+
+Bodies are checked before dispatch: malformed JSON or missing fields get 400, fields of the wrong
+type or images that cannot be decoded get 422, images over GENIE_IMAGE_MAX_PIXELS get 413. Only
+failures of the model or backend itself are answered with 502.
+"""
+import argparse
+import base64
+import binascii
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import gemini_api
+from image_utils import ImageTooLarge, prepare_image
+from routing import router
+from scheduler import BATCH, INTERACTIVE, priority_lane, scheduler
+
+# Service settings (override via environment variables)
+SERVER_WORKERS = int(os.getenv("GENIE_SERVER_WORKERS", 8))
+SERVER_QUEUE_DEPTH = int(os.getenv("GENIE_SERVER_QUEUE_DEPTH", 32))
+SERVER_TIMEOUT_SECONDS = float(os.getenv("GENIE_SERVER_TIMEOUT", 120))
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+class InvalidRequest(ValueError):
+    """
+    Raised for a request body that is well-formed JSON but not a valid request (answered with 422).
+    """
+
+def _decode_image(value):
+    """
+    Decodes and prepares a base64 image, so a file that is not an image is refused before dispatch.
+    The prepared payload is cached, so the worker reuses it.
+    """
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except (binascii.Error, TypeError):
+        raise InvalidRequest("Field image must be base64-encoded image bytes.")
+    try:
+        return prepare_image(raw)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        raise InvalidRequest("Field image is not a readable JPEG, PNG or WebP image.")
+
+def _is_text(value):
+    return isinstance(value, str) and bool(value.strip())
+
+def _is_text_list(value):
+    return isinstance(value, list) and bool(value) and all(_is_text(item) for item in value)
+
+# field -> (check, description used in the error message)
+FIELD_TYPES = {
+    "prompt": (_is_text, "a non-empty string"),
+    "style": (_is_text, "a non-empty string"),
+    "caption": (_is_text, "a non-empty string"),
+    "language": (_is_text, "a non-empty string"),
+    "languages": (_is_text_list, "a non-empty list of strings"),
+    "captions": (_is_text_list, "a non-empty list of strings"),
+    "image": (_is_text, "a base64 string"),
+}
+
+def validate(body, required, optional=()):
+    """
+    Returns the missing required fields of body, after checking the type of every known field
+    it carries. Raises InvalidRequest for a field of the wrong type.
+    """
+    missing = [field for field in required if body.get(field) in (None, "", [])]
+    for field in (*required, *optional):
+        if field in missing or body.get(field) is None:
+            continue
+        check, description = FIELD_TYPES[field]
+        if not check(body[field]):
+            raise InvalidRequest(f"Field {field} must be {description}.")
+    return missing
+
+def _creative(body):
+    ideas, variations = gemini_api.generate_creative_ideas(body["prompt"], body.get("style") or "Default")
+    return {"ideas": ideas, "variations": variations}
+
+# path -> (required fields, optional fields, handler(body) returning a JSON-serializable result);
+# handlers get the image already decoded and prepared (see image_utils.prepare_image)
+ENDPOINTS = {
+    "/v1/creative": (("prompt",), ("style",), _creative),
+    "/v1/analyze": (("image", "caption"), (),
+                    lambda body: gemini_api.analyze_caption(body["image"], body["caption"])),
+    "/v1/suggest": (("image",), (), lambda body: gemini_api.suggest_captions_from_image(body["image"])),
+    "/v1/localize": (("caption", "language"), (),
+                     lambda body: gemini_api.localize_caption(body["caption"], body["language"])),
+    "/v1/localize_batch": (("caption", "languages"), (),
+                           lambda body: gemini_api.localize_caption_batch(body["caption"], body["languages"])),
+    "/v1/score": (("captions",), ("image",),
+                  lambda body: gemini_api.score_captions(body["captions"], body.get("image"))),
+}
+
+class Overloaded(Exception):
+    """
+    Raised when every worker is busy and the wait queue is full.
+    """
+
+class SingleFlight:
+    """
+    Runs calls on a bounded worker pool, at most one per key at a time: a caller whose key is
+    already in flight gets the running call's future instead of starting another. Distinct calls
+    beyond workers + queue_depth are refused with Overloaded.
+    """
+
+    def __init__(self, workers=SERVER_WORKERS, queue_depth=SERVER_QUEUE_DEPTH):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="genie-worker")
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "coalesced": 0, "rejected": 0, "max_queue_depth": 0}
+
+    def submit(self, key, fn, *args):
+        """
+        Returns (future, coalesced); coalesced is True when the caller joined a call already in flight.
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            future = self._flights.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, True
+            if len(self._flights) >= self.workers + self.queue_depth:
+                self.stats["rejected"] += 1
+                raise Overloaded()
+            # The worker inherits the caller's context (e.g. its scheduler priority lane)
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args)
+            self._flights[key] = future
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queued())
+        # Registered outside the lock: an already finished future runs the callback right here
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future, False
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def _queued(self):
+        return max(0, len(self._flights) - self.workers)
+
+    def summary(self):
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._flights), "queue_depth": self._queued()}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+def flight_key(path, body):
+    """
+    Identifies a request by its endpoint and canonical JSON body, with images replaced by their hash.
+    """
+    if body.get("image"):
+        body = dict(body, image=hashlib.sha256(str(body["image"]).encode("ascii", "replace")).hexdigest())
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{path}\0{canonical}".encode("utf-8")).hexdigest()
+
+class GenieRequestHandler(BaseHTTPRequestHandler):
+    server_version = "Genie/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/v1/stats":
+            self._send(200, {
+                **self.server.flights.summary(), "scheduler": scheduler.metrics(), "routing": router.summary(),
+            })
+        else:
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": f"Request body is larger than {MAX_BODY_BYTES} bytes."})
+            return
+        raw = self.rfile.read(length)
+        endpoint = ENDPOINTS.get(self.path)
+        if endpoint is None:
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+            return
+        required, optional, handler = endpoint
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._send(400, {"error": "Request body must be JSON."})
+            return
+        if not isinstance(body, dict):
+            self._send(400, {"error": "Request body must be a JSON object."})
+            return
+        try:
+            missing = validate(body, required, optional)
+        except InvalidRequest as e:
+            self._send(422, {"error": str(e)})
+            return
+        if missing:
+            self._send(400, {"error": f"Missing field: {', '.join(missing)}"})
+            return
+
+        key = flight_key(self.path, body)
+        if body.get("image"):
+            try:
+                body["image"] = _decode_image(body["image"])
+            except InvalidRequest as e:
+                self._send(422, {"error": str(e)})
+                return
+            except ImageTooLarge as e:
+                self._send(413, {"error": str(e)})
+                return
+        lane = BATCH if self.headers.get("X-Genie-Lane", "").lower() == "batch" else INTERACTIVE
+        try:
+            future, coalesced = self.server.flights.submit(key, _run, lane, handler, body)
+        except Overloaded:
+            self._send(429, {"error": "Server busy, retry later."}, {"Retry-After": "1"})
+            return
+        try:
+            result = future.result(timeout=self.server.timeout_seconds)
+        except FutureTimeoutError:
+            self._send(504, {"error": "Timed out waiting for the model."})
+            return
+        except Exception as e:
+            self._send(502, {"error": str(e)})
+            return
+        self._send(200, result, {"X-Genie-Coalesced": "1" if coalesced else "0"})
+
+def _run(lane, handler, body):
+    with priority_lane(lane):
+        return handler(body)
+
+class GenieServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server; each connection gets a thread that waits on the shared worker pool.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, workers=SERVER_WORKERS, queue_depth=SERVER_QUEUE_DEPTH,
+                 timeout_seconds=SERVER_TIMEOUT_SECONDS, verbose=False):
+        super().__init__(address, GenieRequestHandler)
+        self.flights = SingleFlight(workers, queue_depth)
+        self.timeout_seconds = timeout_seconds
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        self.flights.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Genie over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-w", "--workers", type=int, default=SERVER_WORKERS, help="Concurrent upstream calls")
+    parser.add_argument("--queue-depth", type=int, default=SERVER_QUEUE_DEPTH,
+                        help="Calls that may wait for a worker before requests get 429")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    server = GenieServer((args.host, args.port), args.workers, args.queue_depth, verbose=args.verbose)
+    print(f"Genie service on http://{args.host}:{server.server_address[1]} "
+          f"({args.workers} workers, queue depth {args.queue_depth})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# --------- session_memo.py ---------
+import hashlib
+import os
+from collections import OrderedDict
+
+# Results kept per session and per kind of result (override via environment variable)
+SESSION_MEMO_MAX_ENTRIES = int(os.getenv("GENIE_SESSION_MEMO_ENTRIES", 16))
+
+def input_key(*parts):
+    """
+    Hashes the inputs of a request (prompt, style, image bytes, caption, ...) into a memo key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, (bytes, bytearray)):
+            part = repr(part).encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") hash differently
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+class SessionMemo:
+    """
+    Bounded LRU of results stored in a per-session mapping such as st.session_state,
+    so reruns can redraw earlier results without querying the model again.
+    """
+
+    def __init__(self, state, name, max_entries=SESSION_MEMO_MAX_ENTRIES):
+        if name not in state:
+            state[name] = OrderedDict()
+        self._entries = state[name]
+        self.max_entries = max_entries
+
+    def get(self, key):
+        """
+        Returns the memoized result for key, or None.
+        """
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def set(self, key, value):
+        """
+        Memoizes value under key, evicting the least recently used entries beyond max_entries.
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
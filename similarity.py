@@ -0,0 +1,110 @@
+# --------- similarity.py ---------
+import re
+import zlib
+
+import numpy as np
+
+# MinHash settings: NUM_PERM hashes split into LSH_BANDS bands of equal width
+NUM_PERM = 64
+LSH_BANDS = 32
+SHINGLE_SIZE = 3
+# Jaccard similarity of shingle sets at or above which two texts count as near-duplicates
+DUPLICATE_THRESHOLD = 0.6
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(20240607)
+_PERM_A = _rng.integers(1, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+def normalize(text):
+    """
+    Lowercases text and collapses punctuation and whitespace, so trivial variants compare equal.
+    """
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Returns the set of character n-grams of the normalized text.
+    """
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def minhash(shingle_set):
+    """
+    MinHash signature (NUM_PERM values) of a shingle set.
+    """
+    if not shingle_set:
+        return np.zeros(NUM_PERM, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64,
+                         count=len(shingle_set))
+    # (a * h + b) mod p for every permutation and shingle; h < 2^32 and a < 2^61 can overflow
+    # uint64, which only reshuffles the hash family and is harmless for MinHash
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+class NearDuplicateIndex:
+    """
+    Incremental near-duplicate detector over short texts. MinHash signatures are bucketed by
+    LSH band, so each lookup only compares against texts that share a band; candidates are then
+    confirmed with the exact Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, threshold=DUPLICATE_THRESHOLD, bands=LSH_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self._rows = NUM_PERM // bands
+        self._buckets = {}
+        self._shingles = []
+        self._keys = []
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self._rows:(band + 1) * self._rows].tobytes())
+                for band in range(self.bands)]
+
+    def find(self, text):
+        """
+        Returns the key of an indexed near-duplicate of text, or None.
+        """
+        return self._find(shingles(text))[0]
+
+    def _find(self, shingle_set):
+        band_keys = self._band_keys(minhash(shingle_set))
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(self._buckets.get(band_key, ()))
+        for i in sorted(candidates):
+            if jaccard(shingle_set, self._shingles[i]) >= self.threshold:
+                return self._keys[i], band_keys
+        return None, band_keys
+
+    def add(self, text, key=None):
+        """
+        Indexes text unless it is a near-duplicate of an indexed text.
+        Returns None if it was added, otherwise the key of the existing near-duplicate.
+        """
+        shingle_set = shingles(text)
+        duplicate, band_keys = self._find(shingle_set)
+        if duplicate is not None:
+            return duplicate
+        position = len(self._keys)
+        self._keys.append(text if key is None else key)
+        self._shingles.append(shingle_set)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(position)
+        return None
+
+    def __len__(self):
+        return len(self._keys)
+
+def dedupe(texts, threshold=DUPLICATE_THRESHOLD):
+    """
+    Returns texts without near-duplicates, keeping the first occurrence of each.
+    """
+    index = NearDuplicateIndex(threshold)
+    return [text for text in texts if index.add(text) is None]
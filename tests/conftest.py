@@ -0,0 +1,15 @@
+# --------- conftest.py ---------
+import os
+import sys
+
+# Tests never touch the real API, the on-disk caches or the quota limits
+os.environ["GENIE_BACKEND"] = "mock"
+os.environ["GENIE_MOCK_LATENCY"] = "0"
+os.environ["GENIE_CACHE"] = "0"
+os.environ["GENIE_TM"] = "0"
+os.environ["GENIE_POSTER_INDEX"] = "0"
+os.environ["GENIE_ROUTING_LOG"] = ""
+os.environ.setdefault("GENIE_RPM", "1000000000")
+os.environ.setdefault("GENIE_TPM", "1000000000000")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
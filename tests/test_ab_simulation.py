@@ -0,0 +1,65 @@
+# --------- test_ab_simulation.py ---------
+import numpy as np
+import pytest
+
+from utils import run_ab_test_simulation, simulate_ab_test
+
+def _variations(scores):
+    return [{"caption": f"Caption {n}", "score": score} for n, score in enumerate(scores)]
+
+@pytest.mark.parametrize("mode", ["fixed", "thompson"])
+def test_same_seed_simulates_identically(mode):
+    first = simulate_ab_test([8.0, 6.0, None], mode=mode, simulations=200, seed=11)
+    second = simulate_ab_test([8.0, 6.0, None], mode=mode, simulations=200, seed=11)
+    for key in ("win_probability", "ctr_mean", "ctr_low", "ctr_high", "expected_sample_size"):
+        assert np.array_equal(first[key], second[key])
+    assert first["impressions_to_decision"] == second["impressions_to_decision"]
+
+def test_fixed_mode_splits_impressions_evenly():
+    result = simulate_ab_test([9.0, 5.0, 5.0, 5.0], mode="fixed", simulations=200, seed=3)
+    sizes = result["expected_sample_size"]
+    assert sizes == pytest.approx(np.full(4, sizes[0]), rel=1e-5)
+
+def test_thompson_mode_favours_a_clearly_better_variation_but_explores_all():
+    result = simulate_ab_test([9.0, 5.0, 5.0, 5.0, 5.0, 5.0], mode="thompson", simulations=200, seed=3)
+    sizes = result["expected_sample_size"]
+    assert sizes[0] > 0.5 * sizes.sum()
+    assert (sizes[1:] > 0).all()
+    assert result["win_probability"].argmax() == 0
+
+def test_thompson_mode_serves_weaker_variations_less_than_fixed():
+    scores = [9.0, 6.0, 5.0, 5.0]
+    fixed = simulate_ab_test(scores, mode="fixed", simulations=200, seed=5)
+    thompson = simulate_ab_test(scores, mode="thompson", simulations=200, seed=5)
+    assert thompson["expected_sample_size"][1:].sum() < fixed["expected_sample_size"][1:].sum()
+
+def test_unscored_variations_get_the_mean_of_the_scored_ones():
+    result = simulate_ab_test([9.0, 3.0, None], mode="fixed", simulations=500, seed=7)
+    ctr = result["ctr_mean"]
+    assert ctr[1] < ctr[2] < ctr[0]
+    assert result["win_probability"].sum() == pytest.approx(1.0)
+    none_scored = simulate_ab_test([None, None], simulations=200, seed=7)
+    assert none_scored["win_probability"].sum() == pytest.approx(1.0)
+
+def test_a_single_variation_is_decided_at_once():
+    result = simulate_ab_test([6.0], simulations=200, seed=1, rounds=10, impressions=1000)
+    assert result["win_probability"].tolist() == [1.0]
+    assert result["decided_share"] == 1.0
+    assert result["impressions_to_decision"] == pytest.approx(100.0)
+
+def test_unknown_mode_raises():
+    with pytest.raises(ValueError):
+        simulate_ab_test([5.0, 6.0], mode="greedy")
+
+def test_run_is_reproducible_for_the_same_captions_and_scores():
+    first = run_ab_test_simulation(_variations([8.0, 6.5, None]))
+    second = run_ab_test_simulation(_variations([8.0, 6.5, None]))
+    assert first == second
+    assert sum(v["recommended"] for v in first) == 1
+    assert first[0]["recommended"]
+    assert all(v["why"] for v in first)
+
+def test_run_handles_no_and_one_variation():
+    assert run_ab_test_simulation([]) == []
+    (only,) = run_ab_test_simulation(_variations([None]))
+    assert only["win_probability"] == 1.0 and only["recommended"]
@@ -0,0 +1,97 @@
+# --------- test_cache.py ---------
+import pytest
+
+import cache
+from cache import ResponseCache, make_cache_key
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache.time, "time", fake.time)
+    return fake
+
+def test_cache_key_covers_every_part():
+    key = make_cache_key("model", "prompt", b"image", namespace="analysis")
+    assert key == make_cache_key("model", "prompt", b"image", namespace="analysis")
+    assert key != make_cache_key("model", "prompt", b"other", namespace="analysis")
+    assert key != make_cache_key("model", "prompt", b"image", namespace="creative")
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+
+def test_hits_are_fresh_copies():
+    responses = ResponseCache(path=":memory:")
+    responses.set("key", {"ideas": ["Spin to win"]})
+    responses.get("key")["ideas"].append("changed")
+    assert responses.get("key") == {"ideas": ["Spin to win"]}
+    assert responses.stats == {"memory_hits": 2, "disk_hits": 0, "misses": 0}
+
+def test_entries_expire_after_the_ttl(clock):
+    responses = ResponseCache(path=":memory:", ttl=10)
+    responses.set("key", "value")
+    clock.now += 9
+    assert responses.get("key") == "value"
+    clock.now += 2
+    assert responses.get("key") is None
+    # Expired on disk as well, not only in memory
+    responses._memory.clear()
+    assert responses.get("key") is None
+    assert responses.stats["misses"] == 2
+
+def test_memory_tier_evicts_least_recently_used(clock):
+    responses = ResponseCache(path=":memory:", memory_max_entries=2)
+    responses.set("a", 1)
+    responses.set("b", 2)
+    assert responses.get("a") == 1
+    responses.set("c", 3)
+    assert list(responses._memory) == ["a", "c"]
+    # The evicted entry is still served from disk and comes back into memory
+    assert responses.get("b") == 2
+    assert responses.stats["disk_hits"] == 1
+    assert list(responses._memory) == ["c", "b"]
+
+def test_disk_is_pruned_to_its_size_limit_least_recently_used_first(clock):
+    payload = "x" * 98  # 100 bytes as JSON
+    responses = ResponseCache(path=":memory:", memory_max_entries=1, disk_max_bytes=2000)
+    for n in range(49):
+        clock.now += 1
+        responses.set(f"key {n}", payload)
+    clock.now += 1
+    assert responses.get("key 0") == payload
+    clock.now += 1
+    responses.set("key 49", payload)
+    # 20 rows fit: the recently read key 0 and the 19 newest writes
+    assert responses._db.execute("SELECT SUM(size) FROM responses").fetchone()[0] == 2000
+    assert responses.get("key 0") == payload
+    assert responses.get("key 31") == payload
+    assert responses.get("key 49") == payload
+    assert responses.get("key 1") is None
+    assert responses.get("key 30") is None
+
+def test_pruning_drops_expired_rows_first(clock):
+    responses = ResponseCache(path=":memory:", ttl=10, memory_max_entries=1)
+    responses.set("old", "value")
+    clock.now += 20
+    for n in range(49):
+        responses.set(f"key {n}", "value")
+    assert responses._db.execute("SELECT COUNT(*) FROM responses WHERE key = 'old'").fetchone()[0] == 0
+
+def test_memory_only_and_disabled_caches():
+    memory_only = ResponseCache(path="")
+    memory_only.set("key", "value")
+    assert memory_only.get("key") == "value"
+    disabled = ResponseCache(path=":memory:", enabled=False)
+    disabled.set("key", "value")
+    assert disabled.get("key") is None
+    assert disabled.stats["misses"] == 0
+
+def test_clear_empties_both_tiers():
+    responses = ResponseCache(path=":memory:")
+    responses.set("key", "value")
+    responses.clear()
+    assert responses.get("key") is None
@@ -0,0 +1,71 @@
+# --------- test_compliance.py ---------
+import random
+
+import pytest
+
+from compliance import BLOCK, PASS, WARN, ComplianceScreener, KeywordAutomaton, normalize
+
+def test_automaton_reports_overlapping_and_nested_phrases():
+    automaton = KeywordAutomaton({"he": "he", "she": "she", "his": "his", "hers": "hers"})
+    assert sorted(automaton.find("ushers")) == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+    assert list(automaton.find("")) == []
+
+def test_automaton_matches_naive_search():
+    rng = random.Random(7)
+    phrases = {"".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(12)}
+    automaton = KeywordAutomaton({phrase: phrase for phrase in phrases})
+    for _ in range(200):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 30)))
+        expected = {
+            (start, start + len(phrase), phrase)
+            for phrase in phrases
+            for start in range(len(text) - len(phrase) + 1)
+            if text.startswith(phrase, start)
+        }
+        assert set(automaton.find(text)) == expected
+
+def test_normalize_folds_case_hyphens_and_apostrophes():
+    assert normalize("  Risk-FREE —  Can’t   lose ") == "risk free can't lose"
+
+@pytest.mark.parametrize("caption, rule", [
+    ("Risk-free spins all weekend", "risk-free"),
+    ("Guaranteed WIN tonight", "guaranteed-win"),
+    ("A sure bet!", "guaranteed-win"),
+    ("Double your money at the tables", "financial-solution"),
+])
+def test_blocking_phrases_and_patterns(caption, rule):
+    result = ComplianceScreener().screen(caption)
+    assert result["verdict"] == BLOCK
+    assert rule in [finding["rule"] for finding in result["findings"]]
+
+def test_phrases_only_match_whole_words():
+    # "sure bet" occurs inside "leisure bets" but not as words of its own
+    assert ComplianceScreener().screen("Leisure bets for the weekend") == {"verdict": PASS, "findings": []}
+    assert ComplianceScreener().screen("Game night with friends")["verdict"] == PASS
+
+def test_localized_rules_apply_to_their_language_and_english_to_all():
+    screener = ComplianceScreener()
+    assert screener.screen("Juega sin riesgo", "Spanish")["verdict"] == BLOCK
+    assert screener.screen("Juega sin riesgo", "German")["verdict"] == PASS
+    assert screener.screen("Spiele risk free", "German")["verdict"] == BLOCK
+    assert screener.screen("पक्की जीत आज", "Hindi")["findings"][0]["match"] == "पक्की जीत"
+
+def test_market_rules_only_apply_in_their_markets():
+    assert ComplianceScreener().screen("Claim your free spins now")["verdict"] == PASS
+    result = ComplianceScreener(market="uk").screen("Claim your free spins now")
+    assert result["verdict"] == WARN
+    assert result["findings"][0]["rule"] == "free-bet-terms"
+
+def test_verdict_is_the_most_severe_finding():
+    rules = [
+        {"id": "mild", "severity": WARN, "message": "Mild", "phrases": {"English": ["jackpot"]}},
+        {"id": "severe", "severity": BLOCK, "message": "Severe", "phrases": {"English": ["mega jackpot"]}},
+    ]
+    screener = ComplianceScreener(rules=rules)
+    assert screener.screen("Jackpot tonight")["verdict"] == WARN
+    result = screener.screen("MEGA-jackpot tonight")
+    assert result["verdict"] == BLOCK
+    assert sorted(finding["rule"] for finding in result["findings"]) == ["mild", "severe"]
+    assert [r["verdict"] for r in screener.screen_many(["calm night", "jackpot", "mega jackpot"])] == [
+        PASS, WARN, BLOCK,
+    ]
@@ -0,0 +1,58 @@
+# --------- test_creative_ideas.py ---------
+import pytest
+
+import gemini_api
+
+@pytest.mark.parametrize("prompt, count", [
+    ("Give me 20 witty taglines", 20),
+    ("five slogans for game night", 5),
+    ("Slogans for the 2024 season: 7 please", 7),
+    ("Need 4 ideas for our 2025 launch", 4),
+])
+def test_extract_num_ideas_prefers_counted_numbers_and_skips_years(prompt, count):
+    assert gemini_api.extract_num_ideas(prompt) == count
+
+@pytest.mark.parametrize("prompt", [
+    "Slogans for our 2025 launch",
+    "Taglines for 10% off and $5 drinks",
+    "Write 0 taglines",
+    "Something catchy",
+])
+def test_extract_num_ideas_defaults_without_a_usable_count(prompt):
+    assert gemini_api.extract_num_ideas(prompt) == gemini_api.DEFAULT_NUM_IDEAS
+
+def test_extract_num_ideas_falls_back_past_a_zero_count():
+    assert gemini_api.extract_num_ideas("Give me 0 slogans for 4 people") == 4
+
+def test_extract_num_ideas_is_capped(monkeypatch):
+    assert gemini_api.extract_num_ideas("Give me 500 names") == gemini_api.MAX_IDEAS
+    monkeypatch.setattr(gemini_api, "MAX_IDEAS", 12)
+    assert gemini_api.extract_num_ideas("Give me 50 names") == 12
+
+def _variation(caption, score):
+    return {"caption": caption, "score": score, "why": "", "recommended": True}
+
+def test_merger_drops_near_duplicates_and_blocked_ideas():
+    merger = gemini_api._IdeaMerger(num=5)
+    assert merger.add("Spin to win this Friday night", _variation("Spin to win this Friday night", 6.0))
+    assert not merger.add("Spin to win this Friday night!!", _variation("Spin to win this Friday night!!", 9.0))
+    assert not merger.add("Risk-free spins all weekend", _variation("Risk-free spins all weekend", 9.0))
+    assert merger.add("Join our poker league", _variation("Join our poker league", 8.0))
+    ideas, variations = merger.result()
+    assert ideas == ["Spin to win this Friday night", "Join our poker league"]
+    assert [v["caption"] for v in variations] == ideas
+    assert all(v["prescreen"]["verdict"] != "block" for v in variations)
+
+def test_merger_stops_at_num_ideas_and_keeps_one_recommendation():
+    merger = gemini_api._IdeaMerger(num=2)
+    captions = ["Spin to win tonight", "Join our poker league", "Big wins await at the club"]
+    kept = [merger.add(caption, _variation(caption, score)) for caption, score in zip(captions, [5.0, 8.0, 9.0])]
+    assert kept == [True, True, False]
+    ideas, variations = merger.result()
+    assert ideas == captions[:2]
+    assert [v["recommended"] for v in variations] == [False, True]
+
+def test_merger_keeps_ideas_without_variations():
+    merger = gemini_api._IdeaMerger(num=3)
+    assert merger.add("Spin to win tonight", None)
+    assert merger.result() == (["Spin to win tonight"], [])
@@ -0,0 +1,70 @@
+# --------- test_fused_localization.py ---------
+import pytest
+from PIL import Image
+
+import gemini_api
+from compliance import BLOCK
+from translation_memory import TranslationMemory
+
+@pytest.fixture
+def tm(tmp_path, monkeypatch):
+    memory = TranslationMemory(path=str(tmp_path / "tm.sqlite3"))
+    monkeypatch.setattr(gemini_api, "translation_memory", memory)
+    return memory
+
+@pytest.fixture
+def blocked(monkeypatch):
+    """
+    Captions in this set are blocked by the pre-screen, everything else is screened as usual.
+    """
+    captions = set()
+    screen = gemini_api.prescreen
+
+    def prescreen(caption, *args, **kwargs):
+        if caption in captions:
+            return {"verdict": BLOCK, "findings": [{"rule": "test", "severity": BLOCK, "message": "", "match": ""}]}
+        return screen(caption, *args, **kwargs)
+
+    monkeypatch.setattr(gemini_api, "prescreen", prescreen)
+    return captions
+
+def _poster():
+    return Image.new("RGB", (320, 240), (200, 30, 30))
+
+def _analyze(language="Spanish"):
+    events = list(gemini_api.stream_caption_analysis(_poster(), "Spin to win tonight", language))
+    return events, events[-1][1]
+
+def test_first_variation_is_localized_and_remembered(tm, blocked):
+    events, result = _analyze()
+    first = result["caption_variations"][0]["caption"]
+    localized = result["localization"]["localized_caption"]
+    assert localized and first in localized
+    assert ("localized_caption", localized) in events
+    assert tm.lookup(first, "Spanish")["localized_caption"] == localized
+
+def test_localization_of_blocked_first_variation_is_dropped(tm, blocked):
+    _, unblocked = _analyze()
+    first, second = (v["caption"] for v in unblocked["caption_variations"][:2])
+    tm.clear()
+    blocked.add(first)
+
+    events, result = _analyze()
+    captions = [v["caption"] for v in result["caption_variations"]]
+    assert first not in captions and second in captions
+    assert not [value for event, value in events if event == "localized_caption" and value]
+    assert result["localization"] == {"localized_caption": "", "notes": ""}
+    # The translation of the blocked caption must not be stored under the caption that moved up
+    assert tm.lookup(second, "Spanish") is None
+    assert tm.lookup(first, "Spanish") is None
+
+def test_localization_of_blocked_suggested_caption_is_dropped(tm, blocked):
+    events = list(gemini_api.stream_caption_suggestions(_poster(), "Spanish"))
+    caption = events[-1][1]["caption"]
+    tm.clear()
+    blocked.add(caption)
+
+    events = list(gemini_api.stream_caption_suggestions(_poster(), "Spanish"))
+    result = events[-1][1]
+    assert result["localization"] == {"localized_caption": "", "notes": ""}
+    assert tm.units() == []
@@ -0,0 +1,27 @@
+# --------- test_image_utils.py ---------
+from PIL import Image
+
+import image_utils
+
+def _poster():
+    image = Image.new("RGB", (300, 200), (200, 30, 30))
+    image.putpixel((299, 199), (0, 0, 0))
+    return image
+
+def test_content_hash_does_not_depend_on_the_strip_size(monkeypatch):
+    poster = _poster()
+    whole = image_utils._content_hash(poster, 1536, "JPEG", 85)
+    monkeypatch.setattr(image_utils, "HASH_STRIP_BYTES", 7 * 300 * 3)
+    assert image_utils._content_hash(poster, 1536, "JPEG", 85) == whole
+    monkeypatch.setattr(image_utils, "HASH_STRIP_BYTES", 1)
+    assert image_utils._content_hash(poster, 1536, "JPEG", 85) == whole
+
+def test_content_hash_covers_every_row_and_the_settings(monkeypatch):
+    monkeypatch.setattr(image_utils, "HASH_STRIP_BYTES", 7 * 300 * 3)
+    poster = _poster()
+    key = image_utils._content_hash(poster, 1536, "JPEG", 85)
+    changed = poster.copy()
+    changed.putpixel((299, 199), (255, 255, 255))
+    assert image_utils._content_hash(changed, 1536, "JPEG", 85) != key
+    assert image_utils._content_hash(poster, 1536, "JPEG", 80) != key
+    assert image_utils._content_hash(poster.convert("RGBA"), 1536, "JPEG", 85) != key
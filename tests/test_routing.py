@@ -0,0 +1,122 @@
+# --------- test_routing.py ---------
+import pytest
+
+from routing import ModelRouter, note_model_seconds
+
+TIERS = ["fast", "default", "strong"]
+
+def _router(cascade=False, probe_every=4, alpha=0.5):
+    routes = {"analysis": ("default", "strong", 1.0), "creative": ("fast", "default", 1.0)}
+    return ModelRouter(routes=routes, cascade=cascade, min_confidence=0.75, log_path="", tiers=TIERS,
+                       alpha=alpha, probe_every=probe_every)
+
+def test_latency_is_an_exponentially_weighted_average():
+    router = _router(alpha=0.5)
+    assert router.latency("analysis", "default") is None
+    router.record("analysis", "default", "route", 0.4)
+    router.record("analysis", "default", "route", 0.8)
+    router.record("analysis", "default", "route", 1.6)
+    assert router.latency("analysis", "default") == pytest.approx(1.1)
+    # Failed attempts do not move the average
+    router.record("analysis", "default", "route", 30.0, error="timeout")
+    assert router.latency("analysis", "default") == pytest.approx(1.1)
+
+def test_falls_back_to_faster_model_over_slo_and_probes():
+    router = _router(probe_every=4)
+    assert router.select("analysis") == ("default", "route")
+    router.record("analysis", "default", "route", 2.0)
+    reasons = [router.select("analysis") for _ in range(8)]
+    assert reasons == [("fast", "slo")] * 3 + [("default", "probe")] + [("fast", "slo")] * 3 + [("default", "probe")]
+    # The fastest tier has nowhere to fall back to
+    router.record("creative", "fast", "route", 5.0)
+    assert router.select("creative") == ("fast", "route")
+
+def test_probe_lets_a_recovered_model_win_its_place_back():
+    router = _router(probe_every=2, alpha=1.0)
+    router.record("analysis", "default", "route", 2.0)
+    assert router.select("analysis") == ("fast", "slo")
+    model, reason = router.select("analysis")
+    assert (model, reason) == ("default", "probe")
+    router.record("analysis", model, reason, 0.3)
+    assert router.select("analysis") == ("default", "route")
+
+def test_plan_adds_escalation_only_in_cascade_mode():
+    assert _router(cascade=False).plan("analysis") == [("default", "route")]
+    assert _router(cascade=True).plan("analysis") == [("default", "route"), ("strong", "escalation")]
+    assert _router(cascade=True).cache_tag("analysis") == "default>strong"
+    assert _router(cascade=False).cache_tag("analysis") == "default"
+
+def test_cascade_escalates_low_confidence_replies():
+    router = _router(cascade=True)
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        return {"default": 0.5, "strong": 0.9}[model]
+
+    assert router.run("analysis", attempt, confidence=lambda reply: reply) == 0.9
+    assert calls == ["default", "strong"]
+    assert [(d["model"], d["reason"], d["accepted"]) for d in router.decisions("analysis")] == [
+        ("default", "route", False), ("strong", "escalation", True),
+    ]
+    summary = router.summary()["analysis"]
+    assert (summary["attempts"], summary["escalations"], summary["rejected"]) == (2, 1, 1)
+    assert summary["escalation_rate"] == 0.5
+
+def test_cascade_keeps_an_accepted_reply():
+    router = _router(cascade=True)
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        return 1.0
+
+    assert router.run("analysis", attempt, confidence=lambda reply: reply) == 1.0
+    assert calls == ["default"]
+
+def test_cascade_returns_the_best_reply_when_the_escalation_fails():
+    router = _router(cascade=True)
+
+    def attempt(model):
+        if model == "strong":
+            raise ValueError("unparseable reply")
+        return 0.5
+
+    assert router.run("analysis", attempt, confidence=lambda reply: reply) == 0.5
+    assert router.decisions()[-1]["error"] == "unparseable reply"
+
+def test_unusable_reply_without_alternative_raises():
+    router = _router(cascade=False)
+
+    def attempt(model):
+        raise ValueError("unparseable reply")
+
+    with pytest.raises(ValueError):
+        router.run("analysis", attempt, confidence=lambda reply: 1.0)
+
+def test_other_errors_are_recorded_and_raised_without_escalating():
+    router = _router(cascade=True)
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        router.run("analysis", attempt, confidence=lambda reply: 1.0)
+    assert calls == ["default"]
+    assert router.latency("analysis", "default") is None
+
+def test_run_records_only_reported_model_time():
+    router = _router(alpha=1.0)
+
+    def attempt(model):
+        note_model_seconds(0.25)
+        note_model_seconds(0.5)
+        return "reply"
+
+    router.run("analysis", attempt, confidence=lambda reply: 1.0)
+    assert router.latency("analysis", "default") == pytest.approx(0.75)
+    # Outside a routed attempt there is nothing to add to
+    note_model_seconds(10.0)
+    assert router.latency("analysis", "default") == pytest.approx(0.75)
@@ -0,0 +1,118 @@
+# --------- test_scheduler.py ---------
+import threading
+import time
+
+import pytest
+
+import scheduler
+from scheduler import BATCH, INTERACTIVE, RequestScheduler, TokenBucket, is_retryable
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+class RateLimited(Exception):
+    code = 429
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        time.sleep(0.001)
+
+def test_token_bucket_refills_up_to_one_minute_of_budget(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock.monotonic)
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(2, clock.now) == pytest.approx(2.0)
+    clock.now += 1
+    assert bucket.wait_time(2, clock.now) == pytest.approx(1.0)
+    clock.now += 3600
+    assert bucket.wait_time(60, clock.now) == 0.0
+    assert bucket.tokens == 60
+
+def test_calls_are_admitted_by_lane_then_in_arrival_order(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock.monotonic)
+    requests = RequestScheduler(requests_per_minute=60, tokens_per_minute=1e9, max_retries=0)
+    bucket = requests._model_buckets("model")[0]
+    bucket.take(bucket.tokens)
+
+    order = []
+    threads = []
+    for name, lane in [("batch 1", BATCH), ("interactive 1", INTERACTIVE), ("batch 2", BATCH),
+                       ("interactive 2", INTERACTIVE)]:
+        thread = threading.Thread(
+            target=requests.submit, args=(lambda name=name: order.append(name),),
+            kwargs={"est_tokens": 1, "lane": lane, "model": "model"},
+        )
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: len(requests._queue) == len(threads))
+
+    # One request of budget per second: each tick admits exactly the head of the queue
+    for admitted in range(1, 5):
+        clock.now += 1
+        with requests._cond:
+            requests._cond.notify_all()
+        _wait_until(lambda: len(order) == admitted)
+    for thread in threads:
+        thread.join()
+    assert order == ["interactive 1", "interactive 2", "batch 1", "batch 2"]
+    assert requests.metrics()["admitted_by_lane"] == {"interactive": 2, "batch": 2}
+
+def test_models_have_their_own_quota():
+    requests = RequestScheduler(requests_per_minute=1, tokens_per_minute=1e9, max_retries=0,
+                                model_requests_per_minute={"fast": 100})
+    assert requests.submit(lambda: "slow", model="slow") == "slow"
+    assert [requests.submit(lambda: "fast", model="fast") for _ in range(3)] == ["fast"] * 3
+    assert requests.metrics()["admitted_by_model"] == {"slow": 1, "fast": 3}
+
+def test_rate_limited_calls_are_retried_with_exponential_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(scheduler.time, "sleep", sleeps.append)
+    # Full jitter draws from [0, delay]; take the upper end to see the delays themselves
+    monkeypatch.setattr(scheduler.random, "uniform", lambda low, high: high)
+    requests = RequestScheduler(requests_per_minute=1e9, tokens_per_minute=1e9, max_retries=4,
+                                backoff_base=1.0, backoff_max=3.0)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) <= 3:
+            raise RateLimited("quota exceeded")
+        return "reply"
+
+    assert requests.submit(call) == "reply"
+    assert sleeps == [1.0, 2.0, 3.0]
+    assert requests.metrics()["retries"] == 3
+
+def test_retries_stop_after_max_retries_and_skip_other_errors(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(scheduler.time, "sleep", sleeps.append)
+    requests = RequestScheduler(requests_per_minute=1e9, tokens_per_minute=1e9, max_retries=2)
+
+    def rate_limited():
+        raise RateLimited("quota exceeded")
+
+    with pytest.raises(RateLimited):
+        requests.submit(rate_limited)
+    assert len(sleeps) == 2
+
+    def invalid():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        requests.submit(invalid)
+    assert len(sleeps) == 2
+    assert requests.metrics()["failures"] == 2
+
+def test_is_retryable():
+    assert is_retryable(RateLimited())
+    assert is_retryable(ConnectionError())
+    assert is_retryable(type("ServiceUnavailable", (Exception,), {})())
+    assert not is_retryable(ValueError())
@@ -0,0 +1,119 @@
+# --------- test_scoring.py ---------
+import json
+
+import pytest
+
+import backends
+import gemini_api
+from backends import MockBackend
+
+class ScoringBackend(MockBackend):
+    """
+    Mock backend that records the captions of every scoring request and can leave some out of its replies.
+    """
+
+    def __init__(self, drop_once=()):
+        super().__init__(latency=0, error_rate=0)
+        self.requests = []
+        self.drop_once = set(drop_once)
+
+    def generate(self, model_name, contents, generation_config=None, stream=False):
+        response = super().generate(model_name, contents, generation_config, stream)
+        prompt = contents[0] if isinstance(contents, list) else contents
+        if "each numbered caption below" not in prompt:
+            return response
+        captions = [line.split(". ", 1)[1].strip('"') for line in prompt.splitlines()
+                    if line[:1].isdigit() and '. "' in line]
+        self.requests.append(captions)
+        scores = json.loads(response.text)
+        for number, caption in enumerate(captions, 1):
+            if caption in self.drop_once:
+                self.drop_once.discard(caption)
+                scores.pop(str(number))
+        response.text = json.dumps(scores)
+        return response
+
+@pytest.fixture
+def backend(monkeypatch):
+    def install(**kwargs):
+        mock = ScoringBackend(**kwargs)
+        monkeypatch.setattr(backends, "_backend", mock)
+        return mock
+    return install
+
+def test_captions_are_scored_in_chunks_once_each(backend):
+    mock = backend()
+    captions = [f"Caption {n}" for n in range(45)]
+    scored = gemini_api.score_captions(captions + ["Caption 3", ""], chunk_size=20)
+    assert sorted(len(chunk) for chunk in mock.requests) == [5, 20, 20]
+    assert sorted(c for chunk in mock.requests for c in chunk) == sorted(captions)
+    assert len(scored) == 47
+    assert all(1 <= s["score"] <= 10 for s in scored[:46])
+    assert scored[45] == scored[3]
+    assert scored[46] == {"score": None, "why": ""}
+
+def test_captions_missing_from_a_reply_are_requested_again(backend):
+    mock = backend(drop_once={"Caption 2"})
+    scored = gemini_api.score_captions([f"Caption {n}" for n in range(4)])
+    assert mock.requests == [[f"Caption {n}" for n in range(4)], ["Caption 2"]]
+    assert scored[2]["score"] is not None
+
+def test_captions_never_scored_are_left_unscored(backend):
+    backend(drop_once={"Caption 1"})
+    scored = gemini_api.score_captions(["Caption 0", "Caption 1"], max_retries=0)
+    assert scored[0]["score"] is not None
+    assert scored[1] == {"score": None, "why": ""}
+
+def test_score_variations_only_scores_unscored_variations(backend):
+    mock = backend()
+    variations = [
+        {"caption": "Spin to win", "score": 7.0, "why": "Punchy"},
+        {"caption": "Game night", "score": None, "why": "Kept short"},
+        {"caption": "Poker league", "score": None, "why": ""},
+    ]
+    gemini_api.score_variations(variations)
+    assert mock.requests == [["Game night", "Poker league"]]
+    assert variations[0] == {"caption": "Spin to win", "score": 7.0, "why": "Punchy"}
+    assert variations[1]["score"] is not None and variations[1]["why"] == "Kept short"
+    assert variations[2]["score"] is not None and variations[2]["why"]
+
+def test_parse_caption_scores_keeps_only_valid_scores():
+    text = json.dumps({"1": {"score": 8.26, "why": " Clear "}, "2": {"score": 11}, "3": {"score": "n/a"}, "4": "7"})
+    assert gemini_api._parse_caption_scores(text, ["a", "b", "c", "d"]) == {"a": {"score": 8.3, "why": "Clear"}}
+
+class FailingChunkBackend(ScoringBackend):
+    """
+    Scoring backend whose calls fail while a listed caption is in the request.
+    """
+
+    def __init__(self, failing, times=1):
+        super().__init__()
+        self.failing = set(failing)
+        self.times = times
+
+    def generate(self, model_name, contents, generation_config=None, stream=False):
+        prompt = contents[0] if isinstance(contents, list) else contents
+        if self.times and any(f'"{caption}"' in prompt for caption in self.failing):
+            self.times -= 1
+            raise RuntimeError("Mock backend: chunk failed")
+        return super().generate(model_name, contents, generation_config, stream)
+
+def test_a_failed_chunk_keeps_the_other_scores_and_is_retried(monkeypatch):
+    mock = FailingChunkBackend({"Caption 5"})
+    monkeypatch.setattr(backends, "_backend", mock)
+    captions = [f"Caption {n}" for n in range(8)]
+    scored = gemini_api.score_captions(captions, chunk_size=4)
+    assert all(s["score"] is not None for s in scored)
+    # Only the failed chunk is requested again
+    assert sorted(map(tuple, mock.requests)) == sorted([tuple(captions[:4]), tuple(captions[4:])])
+
+def test_captions_of_a_chunk_that_keeps_failing_stay_unscored(monkeypatch):
+    monkeypatch.setattr(backends, "_backend", FailingChunkBackend({"Caption 5"}, times=10))
+    scored = gemini_api.score_captions([f"Caption {n}" for n in range(8)], chunk_size=4)
+    assert all(s["score"] is not None for s in scored[:4])
+    assert scored[4:] == [{"score": None, "why": ""}] * 4
+
+def test_raises_when_no_caption_could_be_scored(monkeypatch):
+    monkeypatch.setattr(backends, "_backend", FailingChunkBackend({"Caption 0", "Caption 5"}, times=10))
+    with pytest.raises(RuntimeError, match="chunk failed"):
+        gemini_api.score_captions([f"Caption {n}" for n in range(8)], chunk_size=4)
@@ -0,0 +1,77 @@
+# --------- test_similarity.py ---------
+import random
+
+import numpy as np
+import pytest
+
+from similarity import DUPLICATE_THRESHOLD, NUM_PERM, NearDuplicateIndex, dedupe, jaccard, minhash, shingles
+
+WORDS = ["spin", "win", "tonight", "friday", "game", "night", "poker", "league", "big", "wins",
+         "await", "join", "the", "fun", "jackpot", "club", "weekend", "party"]
+
+def _caption_pairs(count, seed=3):
+    """
+    Pairs of captions from a base caption with zero to four words swapped, so their similarities
+    spread across the threshold.
+    """
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        base = [rng.choice(WORDS) for _ in range(rng.randint(4, 8))]
+        edited = list(base)
+        for _ in range(rng.randint(0, 4)):
+            edited[rng.randrange(len(edited))] = rng.choice(WORDS)
+        pairs.append((" ".join(base), " ".join(edited)))
+    return pairs
+
+def test_shingles_normalize_case_and_punctuation():
+    assert shingles("Spin, to WIN!") == shingles("spin to win")
+    assert shingles("Hi") == {"hi"}
+    assert shingles("?!") == set()
+
+def test_jaccard():
+    assert jaccard({"a", "b"}, {"b", "c"}) == pytest.approx(1 / 3)
+    assert jaccard(set(), set()) == 1.0
+    assert jaccard({"a"}, set()) == 0.0
+
+def test_minhash_agreement_estimates_jaccard():
+    signature = minhash(shingles("Spin to win tonight"))
+    assert signature.shape == (NUM_PERM,)
+    assert np.array_equal(signature, minhash(shingles("spin to win tonight!")))
+    for a, b in _caption_pairs(50):
+        sa, sb = shingles(a), shingles(b)
+        estimate = (minhash(sa) == minhash(sb)).mean()
+        # 64 permutations: the estimate's standard deviation is at most 1/16
+        assert abs(estimate - jaccard(sa, sb)) < 0.25
+
+def test_index_flags_exactly_the_pairs_at_or_above_the_threshold():
+    pairs = _caption_pairs(300)
+    similarities = [jaccard(shingles(a), shingles(b)) for a, b in pairs]
+    assert any(s >= DUPLICATE_THRESHOLD for s in similarities)
+    assert any(s < DUPLICATE_THRESHOLD for s in similarities)
+    for (a, b), similarity in zip(pairs, similarities):
+        index = NearDuplicateIndex()
+        index.add(a, key="base")
+        # Candidates are confirmed with the exact Jaccard similarity, so LSH can only cost recall,
+        # and with 32 bands of 2 rows a pair at the threshold is missed with probability < 1e-6
+        assert (index.find(b) == "base") == (similarity >= DUPLICATE_THRESHOLD)
+
+def test_threshold_is_configurable():
+    a, b = "Game night for everyone", "Game nights for everybody"
+    assert 0.5 <= jaccard(shingles(a), shingles(b)) < DUPLICATE_THRESHOLD
+    strict, loose = NearDuplicateIndex(), NearDuplicateIndex(threshold=0.5)
+    strict.add(a)
+    loose.add(a)
+    assert strict.find(b) is None
+    assert loose.find(b) == a
+
+def test_add_returns_existing_key_and_skips_duplicates():
+    index = NearDuplicateIndex()
+    assert index.add("Spin to win this Friday night", key=1) is None
+    assert index.add("Spin to win this Friday night!!") == 1
+    assert index.add("Join our poker league", key=2) is None
+    assert len(index) == 2
+
+def test_dedupe_keeps_first_occurrence_in_order():
+    texts = ["Spin to win tonight", "Poker league", "spin to win tonight!", "Big wins await", "POKER LEAGUE"]
+    assert dedupe(texts) == ["Spin to win tonight", "Poker league", "Big wins await"]
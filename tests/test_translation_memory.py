@@ -0,0 +1,83 @@
+# --------- test_translation_memory.py ---------
+import pytest
+
+from translation_memory import TranslationMemory
+
+@pytest.fixture
+def tm(tmp_path):
+    return TranslationMemory(path=str(tmp_path / "tm.sqlite3"), fuzzy_threshold=0.75)
+
+def test_exact_lookup_ignores_case_whitespace_and_quotes(tm):
+    tm.add("Spin to win tonight!", "Spanish", "¡Gira y gana esta noche!", "Informal")
+    assert tm.lookup('  "spin TO win   tonight!" ', "Spanish") == {
+        "localized_caption": "¡Gira y gana esta noche!",
+        "notes": "Informal",
+    }
+    assert tm.lookup("Spin to win tonight!", "German") is None
+
+def test_every_lookup_counts_as_a_hit_or_a_miss(tm):
+    tm.add("Spin to win tonight!", "Spanish", "¡Gira y gana esta noche!")
+    tm.lookup("Spin to win tonight!", "Spanish")
+    tm.lookup("Never seen before", "Spanish")
+    tm.lookup("Spin to win tonight!", "German")
+    summary = tm.summary()
+    assert (summary["exact_hits"], summary["misses"], summary["lookups"]) == (1, 2, 3)
+    assert summary["exact_hit_rate"] == pytest.approx(1 / 3)
+
+def test_fuzzy_finds_close_sources_best_first(tm):
+    tm.add("Spin to win tonight!", "Spanish", "¡Gira y gana esta noche!")
+    tm.add("Spin to win tonight with friends!", "Spanish", "¡Gira y gana esta noche con amigos!")
+    tm.add("Join the poker league", "Spanish", "Únete a la liga de póquer")
+    matches = tm.fuzzy("Spin to win tonite!", "Spanish")
+    assert [m["localized_caption"] for m in matches] == ["¡Gira y gana esta noche!"]
+    assert matches[0]["source"] == "Spin to win tonight!"
+    assert 0.75 <= matches[0]["similarity"] < 1.0
+
+    matches = tm.fuzzy("Spin to win tonight with your friends!", "Spanish")
+    assert matches[0]["source"] == "Spin to win tonight with friends!"
+    assert all(a["similarity"] >= b["similarity"] for a, b in zip(matches, matches[1:]))
+
+def test_fuzzy_respects_threshold_language_and_exact_matches(tm):
+    tm.add("Spin to win tonight!", "Spanish", "¡Gira y gana esta noche!")
+    # An exact match is lookup's job, not a fuzzy hint
+    assert tm.fuzzy("Spin to win tonight!", "Spanish") == []
+    assert tm.fuzzy("Spin to win tonite!", "German") == []
+    assert tm.fuzzy("Weekly poker league finals", "Spanish") == []
+    assert tm.stats["fuzzy_misses"] == 3
+
+def test_translations_are_replaced_not_duplicated(tm):
+    tm.add("Spin to win tonight!", "Spanish", "Gira para ganar")
+    tm.add("spin to win tonight!", "Spanish", "¡Gira y gana esta noche!")
+    assert tm.units() == [("spin to win tonight!", "Spanish", "¡Gira y gana esta noche!", "")]
+
+@pytest.mark.parametrize("filename", ["memory.tmx", "memory.csv"])
+def test_export_import_round_trip(tm, tmp_path, filename):
+    tm.add("Spin to win tonight!", "Spanish", "¡Gira y gana esta noche!", "Informal tone")
+    tm.add("Spin to win tonight!", "Hindi", "आज रात घुमाओ और जीतो!")
+    tm.add("Poker & pizza night", "German", "Poker- & Pizzaabend")
+    path = str(tmp_path / filename)
+    assert tm.export_file(path) == 3
+
+    imported = TranslationMemory(path=str(tmp_path / "imported.sqlite3"))
+    assert imported.import_file(path) == 3
+    assert imported.units() == tm.units()
+    assert imported.lookup("spin to win tonight!", "Hindi") == {
+        "localized_caption": "आज रात घुमाओ और जीतो!",
+        "notes": "",
+    }
+
+def test_tmx_import_maps_language_codes(tm, tmp_path):
+    path = tmp_path / "vendor.tmx"
+    path.write_text(
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<tmx version="1.4"><header srclang="en-US" datatype="plaintext" segtype="sentence"/>'
+        "<body><tu><note>Approved</note>"
+        '<tuv xml:lang="en-US"><seg>Big wins tonight</seg></tuv>'
+        '<tuv xml:lang="fr-FR"><seg>Gros gains ce soir</seg></tuv>'
+        '<tuv xml:lang="nl"><seg>Grote winsten vanavond</seg></tuv>'
+        "</tu></body></tmx>",
+        encoding="utf-8",
+    )
+    assert tm.import_file(str(path)) == 2
+    assert tm.lookup("Big wins tonight", "French") == {"localized_caption": "Gros gains ce soir", "notes": "Approved"}
+    assert tm.lookup("Big wins tonight", "Dutch")["localized_caption"] == "Grote winsten vanavond"
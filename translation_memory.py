@@ -0,0 +1,361 @@
+# --------- translation_memory.py ---------
+"""
+Persistent translation memory for caption localization.
+
+Every localization is stored under its normalized source caption and target language. Later
+requests for the same caption are answered from the memory without calling the model, and
+close matches (found through a trigram index, confirmed by edit-distance similarity) are sent
+to the model as hints.
+
+Usage:
+    python translation_memory.py import memory.tmx      # or .csv
+    python translation_memory.py export memory.tmx      # or .csv
+    python translation_memory.py stats
+"""
+import argparse
+import csv
+import difflib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from similarity import shingles
+
+# Translation memory settings (override via environment variables)
+TM_ENABLED = os.getenv("GENIE_TM", "1") != "0"
+TM_PATH = os.getenv(
+    "GENIE_TM_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "genie", "translation_memory.sqlite3"),
+)
+FUZZY_THRESHOLD = float(os.getenv("GENIE_TM_FUZZY_THRESHOLD", 0.75))
+# Candidates sharing the most trigrams with the query that are re-scored by edit distance
+FUZZY_CANDIDATES = 20
+
+SOURCE_LANGUAGE = "English"
+# TMX identifies languages by code; the app uses language names
+LANGUAGE_CODES = {
+    "English": "en",
+    "Spanish": "es",
+    "German": "de",
+    "French": "fr",
+    "Italian": "it",
+    "Dutch": "nl",
+    "Portuguese": "pt",
+    "Polish": "pl",
+    "Hindi": "hi",
+}
+_LANGUAGE_NAMES = {code: name for name, code in LANGUAGE_CODES.items()}
+_XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+def normalize_source(text):
+    """
+    Key form of a source caption: case-folded, whitespace collapsed, surrounding quotes removed.
+    """
+    return " ".join(text.split()).strip("\"'“”‘’ ").casefold()
+
+def _language_name(code_or_name):
+    code = code_or_name.strip()
+    return _LANGUAGE_NAMES.get(code.lower().split("-")[0], code)
+
+class TranslationMemory:
+    """
+    SQLite store of (source caption, language) -> translation, with a trigram index on the
+    sources for fuzzy lookups. Safe to share between threads.
+    """
+
+    def __init__(self, path=TM_PATH, enabled=True, fuzzy_threshold=FUZZY_THRESHOLD):
+        self.path = path
+        self.enabled = enabled
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        # The SQLite store is opened on first use, keeping imports cheap
+        self._db = None
+        self._db_opened = False
+        # Every lookup is an exact hit or a miss; fuzzy searches (made after a miss) count separately
+        self.stats = {"exact_hits": 0, "misses": 0, "fuzzy_hits": 0, "fuzzy_misses": 0, "added": 0}
+
+    def _disk(self):
+        """
+        Returns the SQLite connection, opening it on first use. Call with the lock held.
+        """
+        if not self._db_opened:
+            self._db_opened = True
+            self._db = self._open_db(self.path) if self.path else None
+        return self._db
+
+    def _open_db(self, path):
+        """
+        Opens (and creates if needed) the store. Returns None if the location is not writable,
+        which disables the memory.
+        """
+        try:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS units ("
+                "id INTEGER PRIMARY KEY, source TEXT NOT NULL, source_norm TEXT NOT NULL, "
+                "language TEXT NOT NULL, target TEXT NOT NULL, note TEXT NOT NULL DEFAULT '', "
+                "origin TEXT NOT NULL, gram_count INTEGER NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, UNIQUE (source_norm, language))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS grams ("
+                "language TEXT NOT NULL, gram TEXT NOT NULL, unit_id INTEGER NOT NULL, "
+                "PRIMARY KEY (language, gram, unit_id)) WITHOUT ROWID"
+            )
+            db.commit()
+            return db
+        except (OSError, sqlite3.Error):
+            return None
+
+    def _available(self):
+        return self.enabled and self._disk() is not None
+
+    def lookup(self, source, language):
+        """
+        Returns the stored translation of source into language as {"localized_caption", "notes"},
+        or None.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._disk() is None:
+                return None
+            row = self._db.execute(
+                "SELECT id, target, note FROM units WHERE source_norm = ? AND language = ?",
+                (normalize_source(source), language),
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE units SET hits = hits + 1 WHERE id = ?", (row[0],))
+            self._db.commit()
+            self.stats["exact_hits"] += 1
+        return {"localized_caption": row[1], "notes": row[2]}
+
+    def fuzzy(self, source, language, limit=3):
+        """
+        Returns up to limit stored translations into language whose source is at least
+        fuzzy_threshold similar to source (difflib ratio of the normalized texts), best first.
+        Each match is a dict with source, localized_caption, notes and similarity.
+        """
+        if not self.enabled:
+            return []
+        norm = normalize_source(source)
+        grams = sorted(shingles(norm))
+        if not grams:
+            with self._lock:
+                self.stats["fuzzy_misses"] += 1
+            return []
+        with self._lock:
+            if self._disk() is None:
+                return []
+            placeholders = ",".join("?" * len(grams))
+            # Sources far shorter or longer than the query cannot reach the threshold
+            rows = self._db.execute(
+                "SELECT u.source, u.source_norm, u.target, u.note, COUNT(*) AS shared "
+                "FROM grams g JOIN units u ON u.id = g.unit_id "
+                f"WHERE g.language = ? AND g.gram IN ({placeholders}) AND u.gram_count BETWEEN ? AND ? "
+                "GROUP BY g.unit_id ORDER BY shared DESC LIMIT ?",
+                (language, *grams, int(len(grams) * self.fuzzy_threshold / 2),
+                 int(len(grams) * 2 / self.fuzzy_threshold) + 1, FUZZY_CANDIDATES),
+            ).fetchall()
+            matches = []
+            for source_text, source_norm, target, note, _ in rows:
+                if source_norm == norm:
+                    continue
+                similarity = difflib.SequenceMatcher(None, norm, source_norm).ratio()
+                if similarity >= self.fuzzy_threshold:
+                    matches.append({
+                        "source": source_text,
+                        "localized_caption": target,
+                        "notes": note,
+                        "similarity": round(similarity, 3),
+                    })
+            matches.sort(key=lambda m: m["similarity"], reverse=True)
+            if matches:
+                self.stats["fuzzy_hits"] += 1
+            else:
+                self.stats["fuzzy_misses"] += 1
+        return matches[:limit]
+
+    def add(self, source, language, target, note="", origin="model"):
+        """
+        Stores (or replaces) the translation of source into language.
+        """
+        if not self.enabled or not source.strip() or not target.strip():
+            return
+        with self._lock:
+            if self._disk() is None:
+                return
+            self._insert(source, language, target, note, origin)
+            self._db.commit()
+
+    def _insert(self, source, language, target, note, origin):
+        norm = normalize_source(source)
+        grams = shingles(norm)
+        previous = self._db.execute(
+            "SELECT id FROM units WHERE source_norm = ? AND language = ?", (norm, language)
+        ).fetchone()
+        if previous:
+            self._db.execute("DELETE FROM grams WHERE language = ? AND unit_id = ?", (language, previous[0]))
+            self._db.execute("DELETE FROM units WHERE id = ?", (previous[0],))
+        cursor = self._db.execute(
+            "INSERT INTO units (source, source_norm, language, target, note, origin, gram_count, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (source.strip(), norm, language, target.strip(), note or "", origin, len(grams), time.time()),
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO grams (language, gram, unit_id) VALUES (?, ?, ?)",
+            [(language, gram, cursor.lastrowid) for gram in grams],
+        )
+        self.stats["added"] += 1
+
+    def units(self):
+        """
+        Returns every stored unit as (source, language, target, note) tuples.
+        """
+        with self._lock:
+            if self._disk() is None:
+                return []
+            return self._db.execute(
+                "SELECT source, language, target, note FROM units ORDER BY source_norm, language"
+            ).fetchall()
+
+    def summary(self):
+        """
+        Unit count and lookup hit rates since the memory was opened. The fuzzy hit rate is the
+        share of lookups whose miss was followed by a fuzzy search that found hints.
+        """
+        lookups = self.stats["exact_hits"] + self.stats["misses"]
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM units").fetchone()[0] if self._available() else 0
+        return {
+            **self.stats,
+            "units": count,
+            "lookups": lookups,
+            "exact_hit_rate": self.stats["exact_hits"] / lookups if lookups else 0.0,
+            "fuzzy_hit_rate": self.stats["fuzzy_hits"] / lookups if lookups else 0.0,
+        }
+
+    def import_file(self, path):
+        """
+        Imports translation units from a .tmx or .csv file. Returns the number of units imported.
+        """
+        units = _read_tmx(path) if path.lower().endswith(".tmx") else _read_csv(path)
+        with self._lock:
+            if not self._available():
+                return 0
+            count = 0
+            for source, language, target, note in units:
+                if source.strip() and target.strip():
+                    self._insert(source, language, target, note, "import")
+                    count += 1
+            self._db.commit()
+        return count
+
+    def export_file(self, path):
+        """
+        Exports every unit to a .tmx or .csv file. Returns the number of units exported.
+        """
+        units = self.units()
+        if path.lower().endswith(".tmx"):
+            _write_tmx(path, units)
+        else:
+            _write_csv(path, units)
+        return len(units)
+
+    def clear(self):
+        with self._lock:
+            if self._available():
+                self._db.execute("DELETE FROM grams")
+                self._db.execute("DELETE FROM units")
+                self._db.commit()
+
+def _read_csv(path):
+    """
+    Reads units from a CSV file with source, language, target and (optional) note columns.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            (row["source"], _language_name(row["language"]), row["target"], row.get("note") or "")
+            for row in csv.DictReader(f)
+        ]
+
+def _write_csv(path, units):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["source", "language", "target", "note"])
+        writer.writerows(units)
+
+def _read_tmx(path):
+    """
+    Reads units from a TMX file: each <tu> pairs its source-language <tuv> with every other one.
+    """
+    root = ET.parse(path).getroot()
+    header = root.find("header")
+    source_code = (header.get("srclang") if header is not None else "") or LANGUAGE_CODES[SOURCE_LANGUAGE]
+    source_language = _language_name(source_code)
+    units = []
+    for tu in root.iter("tu"):
+        note = tu.findtext("note") or ""
+        segments = {}
+        for tuv in tu.findall("tuv"):
+            language = _language_name(tuv.get(_XML_LANG) or tuv.get("lang") or "")
+            segments[language] = "".join(tuv.find("seg").itertext()) if tuv.find("seg") is not None else ""
+        source = segments.pop(source_language, "")
+        units += [(source, language, target, note) for language, target in segments.items()]
+    return units
+
+def _write_tmx(path, units):
+    """
+    Writes units as TMX 1.4, one <tu> per (source, language) pair.
+    """
+    source_code = LANGUAGE_CODES[SOURCE_LANGUAGE]
+    root = ET.Element("tmx", version="1.4")
+    ET.SubElement(root, "header", {
+        "creationtool": "Genie", "creationtoolversion": "1", "datatype": "plaintext",
+        "segtype": "sentence", "adminlang": source_code, "srclang": source_code, "o-tmf": "genie",
+    })
+    body = ET.SubElement(root, "body")
+    for source, language, target, note in units:
+        tu = ET.SubElement(body, "tu")
+        if note:
+            ET.SubElement(tu, "note").text = note
+        for code, text in ((source_code, source), (LANGUAGE_CODES.get(language, language), target)):
+            tuv = ET.SubElement(tu, "tuv", {_XML_LANG: code})
+            ET.SubElement(tuv, "seg").text = text
+    ET.indent(root)
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+translation_memory = TranslationMemory(enabled=TM_ENABLED)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage Genie's translation memory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="Import units from a .tmx or .csv file").add_argument("path")
+    sub.add_parser("export", help="Export all units to a .tmx or .csv file").add_argument("path")
+    sub.add_parser("stats", help="Show the number of stored units")
+    args = parser.parse_args(argv)
+
+    memory = TranslationMemory()
+    if args.command == "import":
+        print(f"Imported {memory.import_file(args.path)} units into {memory.path}")
+    elif args.command == "export":
+        print(f"Exported {memory.export_file(args.path)} units to {args.path}")
+    else:
+        units = memory.units()
+        print(f"{len(units)} units in {memory.path}")
+        by_language = {}
+        for _, language, _, _ in units:
+            by_language[language] = by_language.get(language, 0) + 1
+        for language, count in sorted(by_language.items()):
+            print(f"  {language:<12}{count:>8}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,160 @@
 # --------- utils.py ---------
-import random
+import os
+import zlib
 
-def run_ab_test_simulation(variations):
+import numpy as np
+
+# A/B simulation settings (override via environment variables)
+AB_MODE = os.getenv("GENIE_AB_MODE", "thompson")
+AB_IMPRESSIONS = int(os.getenv("GENIE_AB_IMPRESSIONS", 1_000_000))
+AB_SIMULATIONS = int(os.getenv("GENIE_AB_SIMULATIONS", 1000))
+AB_ROUNDS = int(os.getenv("GENIE_AB_ROUNDS", 10))
+
+# Engagement scores (1-10) map linearly onto this click-through-rate range
+CTR_RANGE = (0.005, 0.05)
+# Pseudo-impressions behind the prior of a scored and an unscored variation
+SCORED_PRIOR_STRENGTH = 2000
+UNSCORED_PRIOR_STRENGTH = 200
+# Variations x simulations evaluated per step; fewer simulations are run for large variation counts
+SIMULATION_CELLS = 100_000
+# A test stops once the leader beats every other variation with this z-score (~95% one-sided)
+DECISION_Z = 1.645
+# Thompson sampling allocates each round by the share of posterior draws every variation wins
+# (at least one draw per variation), keeping this share of the round spread evenly to explore
+THOMPSON_DRAWS = 16
+THOMPSON_EXPLORATION = 0.05
+
+def score_to_ctr(score):
+    """
+    Maps an engagement score (1-10) to a prior click-through rate.
+    """
+    low, high = CTR_RANGE
+    return low + (min(max(score, 1.0), 10.0) - 1.0) / 9.0 * (high - low)
+
+def simulate_ab_test(scores, mode=AB_MODE, impressions=AB_IMPRESSIONS, simulations=AB_SIMULATIONS,
+                     rounds=AB_ROUNDS, seed=None):
+    """
+    Monte Carlo simulation of an A/B test between variations with the given engagement scores
+    (None for unscored variations, which get a weak prior at the mean of the scored ones).
+
+    Each simulation draws a true click-through rate for every variation from its prior, then
+    serves the impressions in rounds, either split evenly ("fixed") or allocated by Thompson
+    sampling on the running Beta posteriors ("thompson", in proportion to each variation's share
+of the posterior draws it wins, with a small even share kept for exploration). A simulation stops early once the
+    leader beats every other variation at ~95% confidence. All simulations and variations are
+    advanced together as arrays; Beta and binomial draws use their normal approximations,
+    which are accurate at these impression counts.
+
+    Returns a dict of per-variation arrays: win_probability, ctr_mean, ctr_low/ctr_high (95%
+    credible interval) and expected_sample_size (mean impressions served before the decision),
+    plus the mean total impressions to a decision and the share of simulations that reached one.
+    """
+    if mode not in ("thompson", "fixed"):
+        raise ValueError(f"Unknown A/B simulation mode: {mode}")
+    k = len(scores)
+    rng = np.random.default_rng(seed)
+    sims = max(100, min(simulations, SIMULATION_CELLS // max(k, 1)))
+
+    known = [score_to_ctr(s) for s in scores if s is not None]
+    neutral = float(np.mean(known)) if known else score_to_ctr(5.5)
+    prior_mean = np.array([neutral if s is None else score_to_ctr(s) for s in scores], dtype=np.float32)
+    strength = np.array([UNSCORED_PRIOR_STRENGTH if s is None else SCORED_PRIOR_STRENGTH for s in scores],
+                        dtype=np.float32)
+
+    # True rates of each simulated world, drawn from the priors
+    spread = np.sqrt(prior_mean * (1 - prior_mean) / (strength + 1))
+    true_ctr = np.clip(prior_mean + spread * rng.standard_normal((sims, k), dtype=np.float32), 1e-5, 0.5)
+
+    alpha = np.broadcast_to(prior_mean * strength, (sims, k)).copy()
+    beta = np.broadcast_to((1 - prior_mean) * strength, (sims, k)).copy()
+    served = np.zeros((sims, k), dtype=np.float32)
+    decided_after = np.full(sims, float(impressions), dtype=np.float32)
+    running = np.arange(sims)
+    batch = impressions / rounds
+
+    for r in range(rounds):
+        # Only simulations that have not reached a decision serve more impressions
+        a, b, p = alpha[running], beta[running], true_ctr[running]
+        n = len(running)
+        if mode == "fixed":
+            allocation = np.full((n, k), batch / k, dtype=np.float32)
+        else:
+            mean = a / (a + b)
+            sd = np.sqrt(mean * (1 - mean) / (a + b + 1))
+            samples = max(THOMPSON_DRAWS, k)
+            wins = np.zeros(n * k, dtype=np.float32)
+            # Drawn THOMPSON_DRAWS at a time so many variations do not multiply the memory held
+            for start in range(0, samples, THOMPSON_DRAWS):
+                count = min(THOMPSON_DRAWS, samples - start)
+                draws = mean[:, None, :] + sd[:, None, :] * rng.standard_normal((n, count, k), dtype=np.float32)
+                picks = draws.argmax(axis=2) + (np.arange(n) * k)[:, None]
+                wins += np.bincount(picks.ravel(), minlength=n * k)
+            wins = wins.reshape(n, k)
+            allocation = batch * ((1 - THOMPSON_EXPLORATION) * wins / samples + THOMPSON_EXPLORATION / k)
+
+        expected = allocation * p
+        noise = np.sqrt(expected * (1 - p)) * rng.standard_normal((n, k), dtype=np.float32)
+        clicks = np.clip(expected + noise, 0.0, allocation)
+        a += clicks
+        b += allocation - clicks
+        alpha[running] = a
+        beta[running] = b
+        served[running] += allocation
+
+        # Stop simulations whose leader now beats every other variation
+        mean = a / (a + b)
+        var = mean * (1 - mean) / (a + b + 1)
+        leader = mean.argmax(axis=1)[:, None]
+        z = (np.take_along_axis(mean, leader, axis=1) - mean) / np.sqrt(np.take_along_axis(var, leader, axis=1) + var)
+        np.put_along_axis(z, leader, np.inf, axis=1)
+        decided = z.min(axis=1) >= DECISION_Z
+        decided_after[running[decided]] = batch * (r + 1)
+        running = running[~decided]
+        if not len(running):
+            break
+
+    total = alpha + beta
+    mean = alpha / total
+    posterior = mean + np.sqrt(mean * (1 - mean) / (total + 1)) * rng.standard_normal((sims, k), dtype=np.float32)
+    winners = np.bincount(posterior.argmax(axis=1), minlength=k)
+    low, high = np.percentile(posterior, [2.5, 97.5], axis=0)
+    return {
+        "mode": mode,
+        "simulations": sims,
+        "win_probability": winners / sims,
+        "ctr_mean": posterior.mean(axis=0),
+        "ctr_low": low,
+        "ctr_high": high,
+        "expected_sample_size": served.mean(axis=0),
+        "impressions_to_decision": float(decided_after.mean()),
+        "decided_share": 1.0 - len(running) / sims,
+    }
+
+def _default_seed(variations):
+    # The same variations always simulate identically, so results are stable across reruns
+    text = "\x1f".join(f"{v.get('caption', '')}\x1e{v.get('score')}" for v in variations)
+    return zlib.crc32(text.encode("utf-8"))
+
+def run_ab_test_simulation(variations, mode=AB_MODE, seed=None):
     """
-    Simulate A/B test scoring for multiple caption variations.
-    Uses provided scores if available, otherwise assigns a plausible random value.
-    Recommends the highest-scoring option.
+    Simulate an A/B test between caption variations (see simulate_ab_test).
+    Adds each variation's win probability, CTR credible interval and expected sample size,
+    and recommends the variation most likely to win.
     """
     for v in variations:
-        if v.get("score") is None:
-            v["score"] = round(random.uniform(6.5, 9.2), 1)
         v["why"] = v.get("why", "Likely to drive strong engagement for the target audience.")
-    # Recommend the highest
-    if variations:
-        top_idx = max(range(len(variations)), key=lambda i: variations[i]['score'] or 0)
-        for idx, v in enumerate(variations):
-            v["recommended"] = (idx == top_idx)
+    if not variations:
+        return variations
+    result = simulate_ab_test(
+        [v.get("score") for v in variations], mode=mode,
+        seed=_default_seed(variations) if seed is None else seed,
+    )
+    top_idx = int(result["win_probability"].argmax())
+    for idx, v in enumerate(variations):
+        v["win_probability"] = round(float(result["win_probability"][idx]), 3)
+        v["ctr_interval"] = (round(float(result["ctr_low"][idx]), 5), round(float(result["ctr_high"][idx]), 5))
+        v["expected_sample_size"] = int(result["expected_sample_size"][idx])
+        v["recommended"] = (idx == top_idx)
     return variations
 
 def format_score(score):
@@ -26,6 +165,36 @@ def format_score(score):
         return "N/A"
     return f"{score}/10"
 
+def format_win_chance(variation):
+    """
+    Format a variation's simulated A/B result for display (e.g., '46% win chance · CTR 3.2–4.8%').
+    Returns an empty string before the simulation has run.
+    """
+    if variation.get("win_probability") is None:
+        return ""
+    low, high = variation["ctr_interval"]
+    return f"{variation['win_probability']:.0%} win chance · CTR {low:.1%}–{high:.1%}"
+
+def format_prescreen(result):
+    """
+    Format the compliance pre-screen findings of a caption for display (e.g., '⚠️ Mentions or
+    appeals to minors (“kids”)'). Returns an empty string when nothing was flagged.
+    """
+    if not result or not result["findings"]:
+        return ""
+    icon = "🚫" if result["verdict"] == "block" else "⚠️"
+    return f"{icon} " + "; ".join(f"{f['message']} (“{f['match']}”)" for f in result["findings"])
+
+def format_bytes(num_bytes):
+    """
+    Format a byte count for display (e.g., '1.4 MB').
+    """
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
 def get_supported_languages():
     """
     Returns a list of localization languages supported for campaign translations.